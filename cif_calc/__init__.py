@@ -0,0 +1,99 @@
+"""Calculation core of the LCL Destination Charges Comparison Calculator.
+
+Shared by the Streamlit UI (main.py) and headless jobs such as
+``python -m cif_calc.batch``. Importing the package has no side effects:
+submodules (and with them pandas / numpy / openpyxl) are only imported
+when one of the names below is first used, e.g.
+
+    from cif_calc import agent_compare, load_exchange_rates
+"""
+import importlib
+
+_EXPORTS = {
+    # engine
+    "agent_compare": "engine",
+    "agent_coefficients": "engine",
+    "charge_caps": "engine",
+    "nomination_compare": "engine",
+    "expand_ladder": "engine",
+    "charge_ladder": "engine",
+    "cbm_slabs": "engine",
+    "cheapest_bands": "engine",
+    "pairwise_crossovers": "engine",
+    "nom": "engine",
+    "DEFAULT_MAX_CBM": "engine",
+    "DEFAULT_CBM_STEP": "engine",
+    # exchange rates
+    "load_exchange_rates": "rates",
+    "save_exchange_rates": "rates",
+    "currency_list": "rates",
+    "rates_version": "rates",
+    "RateHistory": "rates",
+    "load_rate_history": "rates",
+    "record_rates": "rates",
+    "rate_history_version": "rates",
+    "rate_time": "rates",
+    # shared Data/ files
+    "VersionConflict": "files",
+    "file_version": "files",
+    "write_file": "files",
+    # POD locations
+    "pod_locations_version": "locations",
+    "load_pod_locations": "locations",
+    "save_pod_locations": "locations",
+    "pod_list": "locations",
+    # saved workbooks
+    "to_safe_sheet": "workbook",
+    "CONTAINER_TYPES": "workbook",
+    "DEFAULT_CONTAINER_TYPES": "workbook",
+    "container_info": "workbook",
+    "read_comparison_workbook": "workbook",
+    "comparison_inputs": "workbook",
+    "rate_date_from_info": "workbook",
+    "comparison_sheets": "workbook",
+    "write_workbook": "workbook",
+    "sheets_digest": "workbook",
+    # saved-comparison store
+    "list_comparisons": "store",
+    "comparison_version": "store",
+    "load_comparison": "store",
+    "load_sheet": "store",
+    "sheet_names": "store",
+    "save_comparison": "store",
+    "delete_comparison": "store",
+    "add_empty_agent": "store",
+    "export_workbook": "store",
+    "archive_signature": "store",
+    "export_archive": "store",
+    "import_saved_workbooks": "store",
+    "search_comparisons": "store",
+    "indexed_values": "store",
+    # bulk tariff import
+    "import_tariffs": "tariffs",
+    "read_tariff_file": "tariffs",
+    "tariff_frames": "tariffs",
+    "form_frames": "tariffs",
+    "form_keys": "tariffs",
+    "grid_frames": "tariffs",
+    "agent_grid": "tariffs",
+    # scenario sweep
+    "scenario_grid": "sweep",
+    "run_sweep": "sweep",
+    # Monte Carlo simulation
+    "run_simulation": "simulate",
+    "rebate_currencies": "simulate",
+    # live recalculation
+    "LiveCalculator": "live",
+}
+
+__all__ = sorted(_EXPORTS)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(f"{__name__}.{_EXPORTS[name]}"), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,167 @@
+# ------------------------------------------------------------------
+# Headless batch re-calculation of saved comparisons
+#
+#   python -m cif_calc.batch                       # every comparison in the store
+#   python -m cif_calc.batch --workers 8 --output-dir out/
+#   python -m cif_calc.batch --xlsx Data/Saved     # a directory of .xlsx workbooks
+#   python -m cif_calc.batch --as-of 2026-10-01    # revalue everything at that day's rates
+#
+# Each comparison is re-calculated with the exchange rates of its own rate
+# date (a rate-history timestamp), so unchanged inputs give the saved
+# numbers; comparisons saved before rate dates were recorded use the
+# current rates.
+# ------------------------------------------------------------------
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from cif_calc.paths import EXCHANGE_PATH, RATE_HISTORY_PATH, STORE_PATH
+
+# Same defaults as cif_calc.engine; repeated so --help does not import pandas
+DEFAULT_MAX_CBM = 30
+DEFAULT_CBM_STEP = 1.0
+
+def rate_tables(history, dates) -> dict:
+    """{rate date: exchange-rate table} for every rate date, from one vectorized history lookup."""
+    days = sorted(set(dates))
+    matrix = history.rate_matrix(days)
+    return {day: row.dropna().rename("Exchange Rate to USD").rename_axis("Currency").reset_index()
+            for day, (_, row) in zip(days, matrix.iterrows())}
+
+def recalculate_sheets(sheets, exchange_df, slabs=None, rate_date=None):
+    """Re-run agent_compare on a saved comparison's sheets.
+
+    rate_date is when exchange_df's rates were in force, recorded in Info
+    (default: the comparison's own). Returns (updated sheets, number of agents compared).
+    """
+    from cif_calc.engine import agent_compare
+    from cif_calc.workbook import comparison_inputs, comparison_sheets, container_info
+
+    saved = comparison_inputs(sheets)
+    in_df, nom_df, input_dict = saved["in_df"], saved["nom_df"], saved["input_dict"]
+    comp_df, nomination_df = agent_compare(in_df, nom_df, input_dict, exchange_df, slabs)
+
+    info_df = container_info(saved["pol"], saved["pod"], input_dict, rate_date or saved["rate_date"])
+    agents = in_df["Agent Name"].nunique() if not in_df.empty else 0
+    return comparison_sheets(info_df, in_df, nom_df, comp_df, nomination_df), agents
+
+def recalculate_workbook(path, history, slabs=None, output_path=None, as_of=None):
+    """Re-calculate one .xlsx workbook at its rate date (or as_of) and write it back (or to output_path).
+
+    Written through write_file: a workbook changed by someone else while it
+    was being re-calculated is left alone (VersionConflict).
+    """
+    import pandas as pd
+    from cif_calc.files import file_version, write_file
+    from cif_calc.rates import rate_time
+    from cif_calc.workbook import rate_date_from_info, write_workbook
+
+    version = file_version(path)
+    sheets = pd.read_excel(path, sheet_name=None)
+    day = as_of or (rate_date_from_info(sheets["Info"]) if "Info" in sheets else None) or rate_time()
+    sheets, agents = recalculate_sheets(sheets, history.as_of(day), slabs, day)
+    if output_path:
+        write_file(output_path, lambda tmp: write_workbook(sheets, tmp))
+    else:
+        write_file(path, lambda tmp: write_workbook(sheets, tmp), expected_version=version)
+    return agents
+
+def _xlsx_job(args):
+    path, history, slabs, output_path, as_of = args
+    return None, recalculate_workbook(path, history, slabs, output_path, as_of)
+
+def _store_job(args):
+    sheets, exchange_df, slabs, rate_date = args
+    return recalculate_sheets(sheets, exchange_df, slabs, rate_date)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Re-calculate every saved comparison.")
+    parser.add_argument("--store", default=STORE_PATH,
+                        help="saved-comparison store (default: %(default)s)")
+    parser.add_argument("--xlsx", metavar="DIR",
+                        help="re-calculate the .xlsx workbooks in DIR instead of the store")
+    parser.add_argument("--exchange-rates", default=EXCHANGE_PATH,
+                        help="exchange-rate workbook, used while there is no rate history (default: %(default)s)")
+    parser.add_argument("--rate-history", default=RATE_HISTORY_PATH,
+                        help="dated exchange-rate history (default: %(default)s)")
+    parser.add_argument("--as-of", metavar="YYYY-MM-DD[THH:MM:SS]",
+                        help="use the rates in force then (a bare date: at the end of that day) "
+                             "for every comparison instead of each one's own rate date")
+    parser.add_argument("--output-dir",
+                        help="write .xlsx results here instead of updating the store / workbooks")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(),
+                        help="worker processes (default: CPU count)")
+    parser.add_argument("--max-cbm", type=float, default=DEFAULT_MAX_CBM)
+    parser.add_argument("--step", type=float, default=DEFAULT_CBM_STEP)
+    args = parser.parse_args(argv)
+    if not 0 < args.step <= args.max_cbm:
+        parser.error("--step must be greater than 0 and at most --max-cbm")
+
+    from cif_calc import store
+    from cif_calc.engine import cbm_slabs
+    from cif_calc.rates import load_rate_history, rate_time
+    from cif_calc.workbook import rate_date_from_info, write_workbook
+
+    if args.xlsx:
+        names = sorted(os.path.splitext(f)[0] for f in os.listdir(args.xlsx) if f.lower().endswith(".xlsx"))
+    else:
+        names = store.list_comparisons(args.store)
+    if not names:
+        print(f"No saved comparisons in {args.xlsx or args.store}")
+        return 0
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    history = load_rate_history(args.rate_history, args.exchange_rates)
+    as_of = rate_time(args.as_of) if args.as_of else None
+    now = rate_time()   # for comparisons without a rate date
+    slabs = cbm_slabs(args.max_cbm, args.step)
+
+    start = time.perf_counter()
+    agents = failed = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures, versions = {}, {}
+        if args.xlsx:
+            for name in names:
+                out = os.path.join(args.output_dir, f"{name}.xlsx") if args.output_dir else None
+                job = pool.submit(_xlsx_job, (os.path.join(args.xlsx, f"{name}.xlsx"), history, slabs, out, as_of))
+                futures[job] = name
+        else:
+            # A save from the UI while this runs wins; the batch result is dropped
+            saved = {}
+            for name in names:
+                versions[name] = store.comparison_version(name, args.store)
+                saved[name] = store.load_comparison(name, path=args.store)
+            dates = {name: as_of or (rate_date_from_info(sheets["Info"]) if "Info" in sheets else None) or now
+                     for name, sheets in saved.items()}
+            tables = rate_tables(history, dates.values())
+            for name, sheets in saved.items():
+                job = pool.submit(_store_job, (sheets, tables[dates[name]], slabs, dates[name]))
+                futures[job] = name
+
+        for fut in as_completed(futures):
+            name = futures[fut]
+            try:
+                sheets, n = fut.result()
+                if sheets is not None:
+                    # Only this process writes to the store
+                    if args.output_dir:
+                        write_workbook(sheets, os.path.join(args.output_dir, f"{name}.xlsx"))
+                    else:
+                        store.save_comparison(name, sheets, args.store, versions[name])
+                agents += n
+                print(f"✔ {name}")
+            except Exception as e:
+                failed += 1
+                print(f"✘ {name}: {e}", file=sys.stderr)
+    elapsed = time.perf_counter() - start
+
+    done = len(names) - failed
+    print(f"{done}/{len(names)} comparisons, {agents} agents in {elapsed:.2f}s "
+          f"({done / elapsed:.1f} comparisons/s, {agents / elapsed:.0f} agents/s)")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
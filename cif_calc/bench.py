@@ -0,0 +1,220 @@
+# ------------------------------------------------------------------
+# Benchmarks – engine and saved-comparison I/O on synthetic tenders
+#
+#   python -m cif_calc.bench                          # small + medium, compare with the baseline
+#   python -m cif_calc.bench --sizes large --repeat 3
+#   python -m cif_calc.bench --save-baseline          # record this machine's numbers
+#
+# Every case is timed --repeat times (median and best wall time) and run
+# once more under tracemalloc for its peak memory. Results go to a JSON
+# file; a case more than --tolerance slower (or heavier) than the stored
+# baseline is a regression and makes the exit status 1. Timings are only
+# comparable on the machine that recorded the baseline.
+# ------------------------------------------------------------------
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+
+BASELINE_PATH = os.path.join("benchmarks", "baseline.json")
+
+# agents, charge heads per agent, currencies, largest CBM slab (1 CBM steps)
+SIZES = {
+    "small": (10, 8, 3, 30),
+    "medium": (80, 12, 6, 60),
+    "large": (400, 15, 10, 120),
+}
+DEFAULT_SIZES = ["small", "medium"]
+# Differences below these never count as regressions (timer / allocator noise)
+NOISE_FLOOR = {"seconds": 0.002, "peak_mb": 0.5}
+CASES = ["form_frames", "agent_compare", "nom", "save_xlsx", "load_xlsx", "save_store", "load_store"]
+
+def synthetic_tender(agents, heads, currencies, seed=0) -> dict:
+    """A reproducible tender: agent-form widget values plus everything derived from them.
+
+    Returns state / agent_ids (as the agent forms leave them), in_df, nom_df,
+    exchange_df and input_dict. Amounts are entered as text, some left blank.
+    """
+    import numpy as np
+    import pandas as pd
+    from cif_calc.tariffs import form_frames
+
+    rng = np.random.default_rng(seed)
+    codes = ["USD"] + [f"C{i:02d}" for i in range(1, currencies)]
+    exchange_df = pd.DataFrame({"Currency": codes,
+                                "Exchange Rate to USD": np.r_[1.0, rng.uniform(0.01, 1.5, currencies - 1)]})
+
+    def amount(p_blank=0.3):
+        return "" if rng.random() < p_blank else f"{rng.uniform(0, 40):.2f}"
+
+    state, agent_ids = {}, list(range(1, agents + 1))
+    for a in agent_ids:
+        state[f"agent_name_{a}"] = f"Agent {a}"
+        state[f"nom_support_rate_{a}"] = float(rng.choice([0.0, rng.uniform(1, 10)]))
+        state[f"nom_support_cbm_{a}"] = float(rng.integers(0, 5))
+        state[f"nom_support_bl_{a}"] = int(rng.integers(0, 3))
+        state[f"{a}_num_charge_rows"] = heads
+        for i in range(1, heads + 1):
+            state[f"{a}_desc_{i}"] = f"Charge {i}"
+            state[f"{a}_currency_{i}"] = codes[rng.integers(currencies)]
+            for key in ("cbm", "ton", "bl", "vat"):
+                state[f"{a}_{key}_{i}"] = amount()
+            state[f"{a}_min_{i}"] = amount(0.7)
+            state[f"{a}_max_{i}"] = amount(0.9)
+        state[f"{a}_desc_notes"] = "Synthetic"
+        state[f"{a}_rebate_currency"] = codes[rng.integers(currencies)]
+        state[f"{a}_rebate_cbm"] = amount(0.5)
+        state[f"{a}_rebate_bl"] = amount(0.7)
+        state[f"{a}_rebate_container"] = amount(0.7)
+
+    in_df, nom_df = form_frames(state, agent_ids)
+    input_dict = {"20'STD": [25.0, 1800.0, 5.0, -10.0, 3.0, 1.0, 2.0],
+                  "40'STD": [50.0, 2400.0, 12.0, -5.0, 0.0, 0.0, 0.0]}
+    return {"state": state, "agent_ids": agent_ids, "in_df": in_df, "nom_df": nom_df,
+            "exchange_df": exchange_df, "input_dict": input_dict}
+
+def case_functions(tender, max_cbm, workdir) -> dict:
+    """{case: zero-argument callable} over one tender; files go to workdir."""
+    import numpy as np
+    from cif_calc import store
+    from cif_calc.engine import agent_coefficients, agent_compare, cbm_slabs, nom, nomination_support
+    from cif_calc.tariffs import form_frames
+    from cif_calc.workbook import (comparison_sheets, container_info, read_comparison_workbook,
+                                   write_workbook)
+
+    in_df, nom_df, exchange_df = tender["in_df"], tender["nom_df"], tender["exchange_df"]
+    input_dict, slabs = tender["input_dict"], cbm_slabs(max_cbm)
+    comp_df, nomination_df = agent_compare(in_df.copy(), nom_df, input_dict, exchange_df, slabs)
+    sheets = comparison_sheets(container_info("Nhava Sheva", "Jebel Ali", input_dict),
+                               in_df, nom_df, comp_df, nomination_df)
+    xlsx_path = os.path.join(workdir, "tender.xlsx")
+    store_path = os.path.join(workdir, "tender.sqlite")
+    write_workbook(sheets, xlsx_path)
+    store.save_comparison("Tender", sheets, store_path)
+
+    # nom() at every CBM slab (rows) for every agent (columns) of the 20'STD inputs
+    coeffs = agent_coefficients(in_df.copy(), exchange_df)
+    support = nomination_support(nom_df, coeffs.index)
+    load, box, bls, market, tran_cbm, tran_bl, tran_pro = input_dict["20'STD"]
+    volumes = np.asarray(slabs, dtype=float)[:, None]
+    nom_args = (volumes, np.full_like(volumes, bls - tran_bl), box / load, market,
+                *(support[c].to_numpy(dtype=float)[None, :]
+                  for c in ("Nomination Rate", "Nomination CBM", "Nomination BL")),
+                *(coeffs[c].to_numpy(dtype=float)[None, :]
+                  for c in ("Rebate Per CBM", "Rebate Per BL", "Rebate Per Container")),
+                tran_cbm, tran_pro)
+
+    return {
+        "form_frames": lambda: form_frames(tender["state"], tender["agent_ids"]),
+        # agent_coefficients cleans its input in place, so each run gets fresh text
+        "agent_compare": lambda: agent_compare(in_df.copy(), nom_df, input_dict, exchange_df, slabs),
+        "nom": lambda: nom(*nom_args),
+        "save_xlsx": lambda: write_workbook(sheets, xlsx_path),
+        "load_xlsx": lambda: read_comparison_workbook(xlsx_path),
+        "save_store": lambda: store.save_comparison("Tender", sheets, store_path),
+        "load_store": lambda: store.load_comparison("Tender", path=store_path),
+    }
+
+def measure(fn, repeat) -> dict:
+    """Median / best wall time over repeat runs, then one traced run for peak memory."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    tracemalloc.start()
+    try:
+        fn()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"seconds": statistics.median(times), "best_seconds": min(times), "peak_mb": peak / 2 ** 20}
+
+def run(sizes, cases=CASES, repeat=5, seed=0) -> dict:
+    """Results keyed "case/size", with the environment they were taken in."""
+    import numpy as np
+    import pandas as pd
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for size in sizes:
+            agents, heads, currencies, max_cbm = SIZES[size]
+            fns = case_functions(synthetic_tender(agents, heads, currencies, seed), max_cbm, workdir)
+            for case in cases:
+                results[f"{case}/{size}"] = measure(fns[case], repeat)
+    return {
+        "meta": {"date": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+                 "pandas": pd.__version__, "numpy": np.__version__, "machine": platform.platform(),
+                 "repeat": repeat, "seed": seed, "sizes": {s: SIZES[s] for s in sizes}},
+        "results": results,
+    }
+
+def compare(results, baseline, tolerance=0.25, memory_tolerance=0.25) -> list:
+    """(key, metric, baseline, current, ratio, regressed) for every shared case."""
+    rows = []
+    for key, current in results["results"].items():
+        base = baseline.get("results", {}).get(key)
+        if base is None:
+            continue
+        for metric, tol in (("seconds", tolerance), ("peak_mb", memory_tolerance)):
+            ratio = current[metric] / base[metric] if base[metric] else float("inf")
+            regressed = ratio > 1 + tol and current[metric] - base[metric] > NOISE_FLOOR[metric]
+            rows.append((key, metric, base[metric], current[metric], ratio, regressed))
+    return rows
+
+def _read_json(path):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+def _write_json(data, path):
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2)
+        f.write("\n")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the comparison engine and workbook I/O.")
+    parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=DEFAULT_SIZES,
+                        help="synthetic tender sizes (default: %(default)s)")
+    parser.add_argument("--cases", nargs="+", choices=CASES, default=CASES, help="cases to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=5, help="timed runs per case (default: %(default)s)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", default="bench_results.json", help="results file (default: %(default)s)")
+    parser.add_argument("--baseline", default=BASELINE_PATH, help="baseline results (default: %(default)s)")
+    parser.add_argument("--save-baseline", action="store_true", help="write the results as the new baseline")
+    parser.add_argument("--tolerance", type=float, default=0.25,
+                        help="allowed slowdown before a case counts as a regression (default: %(default)s)")
+    parser.add_argument("--memory-tolerance", type=float, default=0.25,
+                        help="allowed growth of peak memory (default: %(default)s)")
+    args = parser.parse_args(argv)
+
+    results = run(args.sizes, args.cases, args.repeat, args.seed)
+    _write_json(results, args.output)
+    for key, r in results["results"].items():
+        print(f"{key:<24} {r['seconds'] * 1000:10.2f} ms  (best {r['best_seconds'] * 1000:.2f})"
+              f"  peak {r['peak_mb']:8.2f} MB")
+    print(f"-> {os.path.abspath(args.output)}")
+
+    if args.save_baseline:
+        _write_json(results, args.baseline)
+        print(f"Baseline saved to {os.path.abspath(args.baseline)}")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --save-baseline to record one.")
+        return 0
+
+    rows = compare(results, _read_json(args.baseline), args.tolerance, args.memory_tolerance)
+    regressions = [r for r in rows if r[5]]
+    for key, metric, base, current, ratio, _ in regressions:
+        print(f"✘ {key} {metric}: {base:.4g} -> {current:.4g} ({ratio:.2f}x)", file=sys.stderr)
+    print(f"{len(rows) - len(regressions)}/{len(rows)} measurements within tolerance of {args.baseline}")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,406 @@
+# ------------------------------------------------------------------
+# Comparison engine – LCL destination charges & nomination profitability
+# ------------------------------------------------------------------
+import numpy as np
+import pandas as pd
+
+from cif_calc.timing import timed
+
+NOMINATION_COLS = ["Nomination Rate", "Nomination CBM", "Nomination BL"]
+
+def nom(con_cbm,con_bl,freight_cost,market_rate,nomination_rate,nomination_cbm,nomination_bl,rebate_cbm,rebate_bl,rebate_per_container,tran_cbm_f,tran_pro_per_cbm_f):
+    # Works on scalars or on per-agent arrays
+    free_hand_volume = np.asarray(con_cbm, dtype=float) - np.asarray(nomination_cbm, dtype=float)
+    free_hand_bl = np.trunc(np.asarray(con_bl - nomination_bl, dtype=float)).astype(int)
+
+    pro_free_hand = (free_hand_volume*market_rate)+(free_hand_volume*rebate_cbm)-(free_hand_volume*freight_cost)+(free_hand_bl*rebate_bl)
+    pro_nomination = (nomination_rate-freight_cost)*nomination_cbm
+
+    pro_sum = pro_free_hand+pro_nomination+rebate_per_container+(tran_cbm_f*tran_pro_per_cbm_f)
+
+    return free_hand_volume,free_hand_bl,pro_free_hand,pro_nomination,pro_sum
+
+LADDER_TYPES = ["Destination Charges", "Fixed Charges (BL)", "Rebate (CBM or Ton)", "Rebate (BL)", "Net Charges"]
+MONEY_COLS = ['Per CBM', 'Per Ton', 'Minimum', 'Maximum', 'Per BL']
+CAP_COLS = ['Per CBM', 'Per Ton', 'Minimum', 'Maximum']
+DEFAULT_MAX_CBM = 30
+DEFAULT_CBM_STEP = 1.0
+
+def cbm_slabs(max_cbm=DEFAULT_MAX_CBM, step=DEFAULT_CBM_STEP):
+    """CBM slabs step, 2*step, ... up to and including max_cbm."""
+    step = float(step)
+    if step <= 0:
+        raise ValueError("CBM step must be greater than 0.")
+    count = int(np.floor(float(max_cbm) / step + 1e-9))
+    if count < 1:
+        raise ValueError("CBM step must not be greater than the largest CBM slab.")
+    return np.round(np.arange(1, count + 1) * step, 6)
+
+def slab_label(n) -> str:
+    return f"CBM {float(n):g}"
+
+def currency_rate_map(exchange_df) -> dict:
+    """Currency → USD map (USD is always 1.0)."""
+    rate_map = dict(zip(exchange_df['Currency'],
+                        exchange_df['Exchange Rate to USD'].astype(float)))
+    rate_map.setdefault('USD', 1.0)
+    return rate_map
+
+def money_values(df, cols=MONEY_COLS) -> pd.DataFrame:
+    """df[cols] as numbers, blank / non-numeric -> 0; df is left untouched."""
+    # Blank strings do not parse either, so to_numeric covers them
+    return df[cols].apply(pd.to_numeric, errors='coerce').fillna(0)
+
+def clean_money_cols(df):
+    """Blank / non-numeric money columns -> 0, in place."""
+    df[MONEY_COLS] = money_values(df)
+    return df
+
+def _first_per_agent(codes, mask, n_agents):
+    """Row index of each agent's first row where mask holds (-1 if none)."""
+    rows = np.flatnonzero(mask & (codes >= 0))
+    first = np.full(n_agents, -1)
+    agent, at = np.unique(codes[rows], return_index=True)
+    first[agent] = rows[at]
+    return first
+
+def _take(values, rows, fill):
+    """values[rows] with fill where rows is -1."""
+    return np.where(rows >= 0, values[rows], fill)
+
+@timed
+def agent_coefficients(df, exchange_df) -> pd.DataFrame:
+    """Compact per-agent charge coefficients, indexed by Agent Name.
+
+    Every slab of the comparison is a function of these few numbers (all USD):
+    fixed BL charge, per-CBM and per-Ton slopes, and the rebate terms.
+    Cleans the money columns of df in place.
+
+    Works on plain arrays (agent codes + bincount) rather than groupby /
+    drop_duplicates / reindex, so its cost is a few array passes and hardly
+    any per-call pandas overhead: recalculating after editing one agent of
+    a few hundred is as cheap as looking the others up in a cache would be.
+    """
+    clean_money_cols(df)
+
+    # Currency conversion for every row in one mapped multiply
+    # (unknown currencies map to NaN and drop out of the sums, as before)
+    rates = df['Currency'].map(currency_rate_map(exchange_df)).to_numpy(dtype=float)
+    codes, agents = pd.factorize(df['Agent Name'])
+    n_agents = len(agents)
+    money = df[MONEY_COLS].to_numpy(dtype=float)
+
+    is_rebate = (df['Description'] == 'Rebate').fillna(False).to_numpy(dtype=bool)
+    is_remark = (df['Description'] == 'Remarks').fillna(False).to_numpy(dtype=bool)
+
+    charge = ~(is_rebate | is_remark) & (codes >= 0)
+    usd = np.nan_to_num(money[charge] * rates[charge, None])
+    totals = {col: np.bincount(codes[charge], weights=usd[:, j], minlength=n_agents)
+              for j, col in enumerate(MONEY_COLS)}
+
+    # First Rebate / Remarks row per agent; the rebate's rate is the first known one
+    rebate = _first_per_agent(codes, is_rebate, n_agents)
+    r_rate = _take(rates, _first_per_agent(codes, is_rebate & ~np.isnan(rates), n_agents), 0.0)
+    remark = _first_per_agent(codes, is_remark, n_agents)
+    per_container = pd.to_numeric(df['Per Container'], errors='coerce').to_numpy(dtype=float)
+
+    def rebate_col(values):
+        return np.nan_to_num(_take(values, rebate, 0.0)) * r_rate
+
+    coeffs = pd.DataFrame({
+        "Remarks": pd.Series(df['Currency'].to_numpy(dtype=object)[remark], dtype=object)
+                     .where(remark >= 0, "").fillna("").to_numpy(dtype=object),
+        "Per CBM": totals['Per CBM'],
+        "Per Ton": totals['Per Ton'],
+        "Per BL": totals['Per BL'],
+        "Rebate Per CBM": rebate_col(money[:, MONEY_COLS.index('Per CBM')]),
+        "Rebate Per Ton": rebate_col(money[:, MONEY_COLS.index('Per Ton')]),
+        "Rebate Per BL": rebate_col(money[:, MONEY_COLS.index('Per BL')]),
+        "Rebate Per Container": rebate_col(per_container),
+    }, index=pd.Index(agents, name="Agent Name"))
+    return coeffs
+
+@timed
+def charge_caps(df, exchange_df) -> pd.DataFrame:
+    """Charge heads carrying a Minimum and/or Maximum, in their own currency.
+
+    Only heads charged on volume (Per CBM or Per Ton) are capped, and only on
+    the basis their agent is charged on; a 0 Minimum or Maximum means no limit. Heads in an unknown currency are left out, as
+    they are from the totals. Money columns may still be raw text.
+    """
+    rate = df['Currency'].map(currency_rate_map(exchange_df))
+    money = money_values(df, CAP_COLS)
+    capped = (~df['Description'].isin(['Rebate', 'Remarks'])
+              & ((money['Per CBM'] != 0) | (money['Per Ton'] != 0))
+              & ((money['Minimum'] > 0) | (money['Maximum'] > 0))
+              & rate.notna())
+    caps = pd.concat([df.loc[capped, ['Agent Name']], money[capped]], axis=1)
+    caps['Rate'] = rate[capped]
+    return caps.reset_index(drop=True)
+
+def _cap_adjustment(coeffs, caps, use_cbm, n):
+    """Clamp every capped head at every slab in one (heads x slabs) pass.
+
+    Returns the per-agent change to the volume charge, shape (agents, slabs).
+    Each head follows its agent's CBM / Ton branch and is only capped when it
+    has a rate on that branch (a Per Ton-only head is not raised to its
+    Minimum while its agent is charged per CBM), so uncapped tariffs add 0.
+    """
+    out = np.zeros(use_cbm.shape)
+    codes = coeffs.index.get_indexer(caps['Agent Name'])
+    keep = codes >= 0
+    if not keep.any():
+        return out
+    codes = codes[keep]
+    cbm, ton, lo, hi, rate = (caps[c].to_numpy(dtype=float)[keep, None]
+                              for c in ('Per CBM', 'Per Ton', 'Minimum', 'Maximum', 'Rate'))
+
+    on_cbm = use_cbm[codes]
+    raw = np.where(on_cbm, cbm * n, ton * (n / 2))
+    active = np.where(on_cbm, cbm != 0, ton != 0)
+    clamped = np.minimum(np.maximum(raw, lo), np.where(hi > 0, hi, np.inf))
+    np.add.at(out, codes, np.where(active, clamped - raw, 0.0) * rate)
+    return out
+
+@timed
+def charge_ladder(coeffs, slabs, caps=None):
+    """Charge ladder for every agent at once -> array of shape (agents, 5, slabs).
+
+    The five rows follow LADDER_TYPES. Ton weight is taken as CBM / 2 and the
+    CBM or Ton branch (and its rebate) is picked per slab, as in the tariff sheet.
+    With caps (see charge_caps) each head's volume charge is clamped to its
+    Minimum / Maximum before it is summed into "Destination Charges".
+    """
+    n = np.asarray(slabs, dtype=float)[None, :]
+    tot_cbm, tot_ton, tot_bl, rebate_cbm, rebate_ton, rebate_bl = (
+        coeffs[c].to_numpy(dtype=float)[:, None]
+        for c in ("Per CBM", "Per Ton", "Per BL", "Rebate Per CBM", "Rebate Per Ton", "Rebate Per BL"))
+
+    tpc = tot_cbm * n
+    tpt = tot_ton * (n / 2)
+    use_cbm = tpc > tpt
+    con = np.where(use_cbm, tpc, tpt)
+    if caps is not None and len(caps):
+        con = con + _cap_adjustment(coeffs, caps, np.broadcast_to(use_cbm, con.shape), n)
+    rcon = np.where(use_cbm, rebate_cbm * n, rebate_ton * (n / 2))
+    fixed = np.broadcast_to(tot_bl, con.shape)
+    net = (fixed + con) - rcon - rebate_bl
+
+    return np.stack([con, fixed, rcon, np.broadcast_to(rebate_bl, con.shape), net], axis=1)
+
+@timed
+def expand_ladder(coeffs, slabs=None, caps=None) -> pd.DataFrame:
+    """Expand agent coefficients into the comparison table (one CBM column per slab)."""
+    slabs = cbm_slabs() if slabs is None else np.asarray(slabs, dtype=float)
+    if not len(slabs):
+        raise ValueError("No CBM slabs to compare.")
+    ladder = charge_ladder(coeffs, slabs, caps)
+
+    comp_df = pd.DataFrame({
+        "Agent Name": np.repeat(coeffs.index.to_numpy(), len(LADDER_TYPES)),
+        "Remarks": np.repeat(coeffs["Remarks"].to_numpy(), len(LADDER_TYPES)),
+        "Type": np.tile(LADDER_TYPES, len(coeffs)),
+    })
+    slab_df = pd.DataFrame(np.round(ladder.reshape(-1, len(slabs)), 2),
+                           columns=[slab_label(n) for n in slabs])
+    return pd.concat([comp_df, slab_df], axis=1)
+
+def net_pieces(coeffs, caps=None, max_cbm=DEFAULT_MAX_CBM, min_cbm=0.0):
+    """Net charge of every agent as piecewise-linear lines in volume.
+
+    For CBM > 0 the CBM-or-Ton branch does not depend on the volume
+    (Per CBM * n vs Per Ton * n/2), so without caps each agent's net charge
+    is a single line. A capped head only bends it where the head's charge
+    reaches its Minimum or Maximum, so between those knots every agent is
+    linear again. Returns (bounds, intercept, slope) with bounds of length
+    pieces + 1 and intercept / slope of shape (agents, pieces).
+    """
+    lo, hi = float(min_cbm), float(max_cbm)
+    knots = [lo, hi]
+    if caps is not None and len(caps):
+        tot_cbm = coeffs["Per CBM"].reindex(caps["Agent Name"]).to_numpy(dtype=float)
+        tot_ton = coeffs["Per Ton"].reindex(caps["Agent Name"]).to_numpy(dtype=float)
+        head_rate = np.where(tot_cbm > tot_ton / 2,
+                             caps["Per CBM"].to_numpy(dtype=float),
+                             caps["Per Ton"].to_numpy(dtype=float) / 2)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            for col in ("Minimum", "Maximum"):
+                knots.extend((caps[col].to_numpy(dtype=float) / head_rate).tolist())
+    knots = np.asarray(knots)
+    bounds = np.unique(knots[np.isfinite(knots) & (knots >= lo) & (knots <= hi)])
+
+    # Evaluate each piece at two interior points and read its line off them
+    p = bounds[:-1] + (bounds[1:] - bounds[:-1]) / 3
+    q = bounds[:-1] + (bounds[1:] - bounds[:-1]) * 2 / 3
+    net = charge_ladder(coeffs, np.concatenate([p, q]), caps)[:, 4, :]
+    f_p, f_q = net[:, :len(p)], net[:, len(p):]
+    slope = (f_q - f_p) / (q - p)
+    intercept = f_p - slope * p
+    return bounds, intercept, slope
+
+def _lower_envelope(intercept, slope, lo, hi):
+    """Cheapest line over [lo, hi] -> list of (from, to, line index). O(n log n)."""
+    # Slope descending, then intercept ascending; on ties the earlier agent wins
+    order = np.lexsort((np.arange(len(slope)), intercept, -slope))
+    hull = []
+    for i in order:
+        if hull and slope[hull[-1]] == slope[i]:
+            continue  # same slope, higher (or equal) intercept: never cheapest
+        while len(hull) >= 2:
+            a, b = hull[-2], hull[-1]
+            x_ab = (intercept[b] - intercept[a]) / (slope[a] - slope[b])
+            x_ai = (intercept[i] - intercept[a]) / (slope[a] - slope[i])
+            if x_ai <= x_ab:
+                hull.pop()
+            else:
+                break
+        hull.append(i)
+
+    bands = []
+    start = lo
+    for k, i in enumerate(hull):
+        if k + 1 < len(hull):
+            j = hull[k + 1]
+            end = (intercept[j] - intercept[i]) / (slope[i] - slope[j])
+        else:
+            end = np.inf
+        end = min(end, hi)
+        if end > start:
+            bands.append((start, end, i))
+            start = end
+        if start >= hi:
+            break
+    return bands
+
+@timed
+def cheapest_bands(coeffs, max_cbm=DEFAULT_MAX_CBM, min_cbm=0.0, caps=None) -> pd.DataFrame:
+    """Lowest-cost agent per CBM band between min_cbm and max_cbm."""
+    cols = ["From CBM", "To CBM", "Agent Name", "Net Charges From", "Net Charges To"]
+    if coeffs.empty or max_cbm <= min_cbm:
+        return pd.DataFrame(columns=cols)
+    bounds, intercept, slope = net_pieces(coeffs, caps, max_cbm, min_cbm)
+    agents = coeffs.index.to_numpy()
+
+    rows = []
+    for k in range(len(bounds) - 1):
+        b, m = intercept[:, k], slope[:, k]
+        for lo, hi, i in _lower_envelope(b, m, bounds[k], bounds[k + 1]):
+            if rows and rows[-1][2] == agents[i]:
+                rows[-1][1], rows[-1][4] = hi, b[i] + m[i] * hi  # same agent across a knot
+            else:
+                rows.append([lo, hi, agents[i], b[i] + m[i] * lo, b[i] + m[i] * hi])
+    return pd.DataFrame(rows, columns=cols)
+
+@timed
+def pairwise_crossovers(coeffs, max_cbm=DEFAULT_MAX_CBM, min_cbm=0.0, caps=None) -> pd.DataFrame:
+    """Breakeven volumes for every pair of agents and which one is cheaper either side.
+
+    One row per crossover; a pair that never crosses between min_cbm and
+    max_cbm gets a single row with an empty "Crossover CBM".
+    """
+    cols = ["Agent A", "Agent B", "Crossover CBM", "Cheaper Below", "Cheaper Above"]
+    if len(coeffs) < 2 or max_cbm <= min_cbm:
+        return pd.DataFrame(columns=cols)
+    bounds, intercept, slope = net_pieces(coeffs, caps, max_cbm, min_cbm)
+    agents = coeffs.index.to_numpy()
+    a, b = np.triu_indices(len(agents), k=1)
+
+    pair_idx, cross_at, below, above = [], [], [], []
+    crossed = np.zeros(len(a), dtype=bool)
+    for k in range(len(bounds) - 1):
+        d_int = intercept[a, k] - intercept[b, k]   # A - B on this piece
+        d_slope = slope[a, k] - slope[b, k]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            cross = np.where(d_slope != 0, -d_int / d_slope, np.nan)
+        inside = (cross > min_cbm) & (cross >= bounds[k]) & (cross < bounds[k + 1])
+        crossed |= inside
+        a_first = d_slope[inside] > 0   # A - B rising: A is cheaper below
+        pair_idx.append(np.flatnonzero(inside))
+        cross_at.append(cross[inside])
+        below.append(np.where(a_first, agents[a[inside]], agents[b[inside]]))
+        above.append(np.where(a_first, agents[b[inside]], agents[a[inside]]))
+
+    # Pairs that keep one order over the whole range
+    rest = np.flatnonzero(~crossed)
+    net_mid = charge_ladder(coeffs, [(min_cbm + max_cbm) / 2], caps)[:, 4, 0]
+    diff = net_mid[a[rest]] - net_mid[b[rest]]
+    cheaper = np.where(diff < 0, agents[a[rest]], np.where(diff > 0, agents[b[rest]], "Equal"))
+    pair_idx.append(rest)
+    cross_at.append(np.full(len(rest), np.nan))
+    below.append(cheaper)
+    above.append(cheaper)
+
+    pair_idx, cross_at = np.concatenate(pair_idx), np.concatenate(cross_at)
+    order = np.lexsort((cross_at, pair_idx))
+    pair_idx = pair_idx[order]
+    return pd.DataFrame({
+        "Agent A": agents[a[pair_idx]],
+        "Agent B": agents[b[pair_idx]],
+        "Crossover CBM": cross_at[order],
+        "Cheaper Below": np.concatenate(below)[order],
+        "Cheaper Above": np.concatenate(above)[order],
+    }, columns=cols)
+
+def nomination_support(nom_df, agents) -> pd.DataFrame:
+    """NOMINATION_COLS indexed once by agent; agents without a row get 0."""
+    return (nom_df.drop_duplicates('Agent Name').set_index('Agent Name')
+            .reindex(columns=NOMINATION_COLS, fill_value=0).apply(pd.to_numeric, errors='coerce')
+            .reindex(agents).fillna(0))
+
+NOMINATION_RESULT_COLS = [
+    "Agent Name", "Container Type", "Box Rate", "Total Loadability", "Freight Cost", "Total Number of BLs",
+    "Market Rate", "Nomination Rate", "Transhipment CBM", "Transhipment Number of BLs",
+    "Transhipment Profitability Per CBM", "Rebate Per CBM", "Rebate Per BL", "Rebate Per Container",
+    "Nomination CBM", "Nomination BL", "Considered CBM", "Considered BLs", "Free Hand CBM", "Free Hand BL",
+    "Profitability on Free Hand", "Profitability on Nomination", "Sum of Profitability",
+]
+
+@timed
+def nomination_compare(coeffs, nom_df, input_dict) -> pd.DataFrame:
+    """Nomination profitability of every agent for every container type.
+
+    input_dict maps each container type to its inputs (loadability, box rate,
+    BLs, market rate, transhipment CBM / BLs / profitability per CBM); all
+    types are evaluated in one (types, agents) pass through nom(). Rows are
+    grouped by agent, with the container types in input_dict order.
+    """
+    types = list(input_dict)
+    inputs = np.array([[float(v) for v in input_dict[t]] for t in types], dtype=float).reshape(len(types), 7)
+    loadability, box_rate, num_bl, market_rate, tran_cbm, tran_bl, tran_pro = (
+        inputs[:, [i]] for i in range(7))   # (types, 1) columns
+    con_cbm = loadability - tran_cbm
+    con_bl = num_bl - tran_bl
+    # No freight cost per CBM without a loadability: that type's profitability is NaN
+    with np.errstate(divide="ignore", invalid="ignore"):
+        freight_cost = np.where(loadability != 0, box_rate / loadability, np.nan)
+
+    agents = coeffs.index.to_numpy()
+    rebate_cbm, rebate_bl, rebate_container = (
+        coeffs[c].to_numpy(dtype=float)[None, :] for c in ("Rebate Per CBM", "Rebate Per BL", "Rebate Per Container"))
+    nom_support = nomination_support(nom_df, agents)
+    nomination_rate, nomination_cbm, nomination_bl = (
+        nom_support[c].to_numpy()[None, :] for c in NOMINATION_COLS)
+
+    free_hand_volume, free_hand_bl, pro_free_hand, pro_nomination, pro_sum = nom(
+        con_cbm, con_bl, freight_cost, market_rate, nomination_rate, nomination_cbm, nomination_bl,
+        rebate_cbm, rebate_bl, rebate_container, tran_cbm, tran_pro)
+
+    def rows(values):   # (types, agents) -> one value per agent x type row
+        return np.broadcast_to(values, (len(types), len(agents))).T.ravel()
+
+    return pd.DataFrame(dict(zip(NOMINATION_RESULT_COLS, (
+        np.repeat(agents, len(types)), np.tile(types, len(agents)),
+        rows(box_rate), rows(loadability), rows(freight_cost), rows(num_bl), rows(market_rate),
+        rows(nomination_rate), rows(tran_cbm), rows(tran_bl), rows(tran_pro),
+        rows(rebate_cbm), rows(rebate_bl), rows(rebate_container),
+        rows(nomination_cbm), rows(nomination_bl), rows(con_cbm), rows(con_bl),
+        rows(free_hand_volume), rows(free_hand_bl), rows(pro_free_hand), rows(pro_nomination), rows(pro_sum),
+    ))))
+
+@timed
+def agent_compare(df,nom_df,input_dict,exchange_df,slabs=None):
+    coeffs = agent_coefficients(df, exchange_df)
+    caps = charge_caps(df, exchange_df)
+    comp_df = expand_ladder(coeffs, slabs, caps)
+    nomination_df = nomination_compare(coeffs, nom_df, input_dict)
+    return comp_df,nomination_df
@@ -0,0 +1,126 @@
+# ------------------------------------------------------------------
+# Shared Data/ files – locked, atomic, version-checked writes
+#
+# A writer takes an exclusive lock on "<file>.lock", checks the file still
+# has the version it was edited from, writes a temp file next to it and
+# renames it over the original. Readers take no lock: they open either the
+# old or the new complete file, never one that is half written, and a
+# failed write leaves the original untouched.
+# ------------------------------------------------------------------
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:   # Windows
+    fcntl = None
+    import msvcrt
+
+LOCK_TIMEOUT = 30     # seconds to wait for another writer
+_POLL = 0.05
+
+class VersionConflict(RuntimeError):
+    """The file (or saved comparison) changed since the caller read it."""
+
+def file_version(path) -> int:
+    """Version of a file; changes whenever it is rewritten (0 if it does not exist).
+
+    Every write installs a new inode, so the version differs even when two
+    writes land within the file system's timestamp resolution.
+    """
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return 0
+    return hash((st.st_mtime_ns, st.st_ino, st.st_size))
+
+def _try_lock(f) -> bool:
+    try:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        return True
+    except OSError:
+        return False
+
+def _unlock(f):
+    if fcntl is not None:
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+@contextmanager
+def file_lock(path, timeout=LOCK_TIMEOUT):
+    """Exclusive writer lock on path (held on "<path>.lock", which is left in place)."""
+    with open(f"{path}.lock", "a+") as f:
+        deadline = time.monotonic() + timeout
+        while not _try_lock(f):
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"{path} is locked by another writer")
+            time.sleep(_POLL)
+        try:
+            yield
+        finally:
+            _unlock(f)
+
+def _replace(src, dst, attempts=10):
+    # Windows refuses to replace a file another process has open; retry briefly
+    for attempt in range(attempts):
+        try:
+            os.replace(src, dst)
+            return
+        except PermissionError:
+            if attempt == attempts - 1:
+                raise
+            time.sleep(_POLL * (attempt + 1))
+
+@contextmanager
+def atomic_path(path, copy=False):
+    """Yield a temp path beside path to write; renamed over path on success.
+
+    The temp file keeps path's extension (so Excel engines recognise it) and,
+    with copy, starts as a copy of path. It is removed if the block fails.
+    """
+    directory, name = os.path.split(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(dir=directory, prefix=f".{name}.", suffix=os.path.splitext(name)[1])
+    os.close(fd)
+    try:
+        if os.path.exists(path):
+            if copy:
+                shutil.copyfile(path, tmp)
+            shutil.copymode(path, tmp)
+        yield tmp
+        with open(tmp, "rb+") as f:
+            os.fsync(f.fileno())
+        _replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+def write_file(path, write, expected_version=None, copy=False, timeout=LOCK_TIMEOUT,
+               installed=None) -> int:
+    """Run write(temp_path) and atomically install the result at path.
+
+    expected_version is the file_version() the data was read at; if the file
+    has changed since, VersionConflict is raised and nothing is written.
+    copy seeds the temp file with the current file (for in-place edits such
+    as replacing one sheet). installed() runs once the new file is in place,
+    still under the lock, so follow-up records are made in write order and
+    only for data that was actually published. Returns the new version.
+    """
+    with file_lock(path, timeout):
+        current = file_version(path)
+        if expected_version is not None and current != expected_version:
+            raise VersionConflict(f"{os.path.basename(path)} was changed by someone else")
+        with atomic_path(path, copy) as tmp:
+            write(tmp)
+        if installed is not None:
+            installed()
+        return file_version(path)
@@ -0,0 +1,86 @@
+# ------------------------------------------------------------------
+# Live recalculation – debounced background worker
+#
+# The UI submits the current inputs on every rerun; a single worker thread
+# drops superseded submissions straight away, waits until the newest one is
+# debounce seconds old and runs only that, so a burst of edits costs one
+# calculation, debounce after the last edit. Results are read back with latest()
+# without blocking the script thread.
+# ------------------------------------------------------------------
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Any, Optional
+
+DEBOUNCE_SECONDS = 0.4
+
+@dataclass
+class LiveResult:
+    generation: int
+    value: Any = None
+    error: Optional[BaseException] = None
+
+class LiveCalculator:
+    """Run fn(*args) in the background for the newest inputs only."""
+
+    def __init__(self, debounce=DEBOUNCE_SECONDS):
+        self.debounce = debounce
+        self._pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="live-calc")
+        self._lock = threading.Lock()
+        self._generation = 0      # newest submission
+        self._key = None          # inputs signature of the newest submission
+        self._submitted = 0.0     # time.monotonic() of the newest submission
+        self._latest = None       # newest completed LiveResult
+        self._closed = False
+
+    def submit(self, key, fn, *args) -> bool:
+        """Queue a calculation for inputs identified by key; False if they are unchanged."""
+        with self._lock:
+            if key == self._key:
+                return False
+            self._key = key
+            self._generation += 1
+            self._submitted = time.monotonic()
+            generation = self._generation
+        self._pool.submit(self._run, generation, fn, args)
+        return True
+
+    def _wait(self, generation) -> bool:
+        """Sleep until generation is debounce seconds old; False once it is superseded."""
+        while True:
+            with self._lock:
+                if self._closed or generation != self._generation:
+                    return False
+                remaining = self._submitted + self.debounce - time.monotonic()
+            if remaining <= 0:
+                return True
+            time.sleep(remaining)
+
+    def _run(self, generation, fn, args):
+        if not self._wait(generation):
+            return  # newer inputs arrived; their own job runs them
+        try:
+            result = LiveResult(generation, value=fn(*args))
+        except Exception as e:
+            result = LiveResult(generation, error=e)
+        with self._lock:
+            if self._latest is None or generation > self._latest.generation:
+                self._latest = result
+
+    def latest(self) -> Optional[LiveResult]:
+        """Newest completed result (None before the first one)."""
+        with self._lock:
+            return self._latest
+
+    def pending(self) -> bool:
+        """True while the newest submission has not completed."""
+        with self._lock:
+            done = self._latest.generation if self._latest is not None else 0
+            return done != self._generation
+
+    def shutdown(self):
+        """Stop the worker without waiting: jobs not yet started are dropped."""
+        with self._lock:
+            self._closed = True
+        self._pool.shutdown(wait=False, cancel_futures=True)
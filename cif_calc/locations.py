@@ -0,0 +1,34 @@
+# ------------------------------------------------------------------
+# Port-of-discharge list (Data/locations.xlsx, sheet "POD locations")
+# ------------------------------------------------------------------
+from cif_calc.files import file_version, write_file
+from cif_calc.paths import LOCATIONS_PATH
+from cif_calc.timing import timed
+
+POD_SHEET = "POD locations"
+
+def pod_locations_version(path=LOCATIONS_PATH) -> int:
+    """Version of the locations workbook; changes whenever it is rewritten."""
+    return file_version(path)
+
+@timed
+def load_pod_locations(path=LOCATIONS_PATH):
+    import pandas as pd
+    return pd.read_excel(path, sheet_name=POD_SHEET)
+
+def save_pod_locations(df, path=LOCATIONS_PATH, expected_version=None) -> int:
+    """Replace the POD sheet, keeping any other sheets in the workbook.
+
+    The sheet is swapped in a copy that then atomically replaces the
+    workbook; VersionConflict if it changed since expected_version.
+    Returns the new pod_locations_version.
+    """
+    import pandas as pd
+
+    def write(tmp):
+        with pd.ExcelWriter(tmp, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
+            df.to_excel(writer, sheet_name=POD_SHEET, index=False)
+    return write_file(path, write, expected_version, copy=True)
+
+def pod_list(df):
+    return sorted(df['POD'].dropna().unique())
@@ -0,0 +1,11 @@
+# ------------------------------------------------------------------
+# Data locations (relative to the app's working directory)
+# ------------------------------------------------------------------
+import os
+
+DATA_DIR = "Data"
+SAVED_DIR = os.path.join(DATA_DIR, "Saved")
+EXCHANGE_PATH = os.path.join(DATA_DIR, "Exchange Rates.xlsx")
+LOCATIONS_PATH = os.path.join(DATA_DIR, "locations.xlsx")
+RATE_HISTORY_PATH = os.path.join(DATA_DIR, "rate_history.sqlite")
+STORE_PATH = os.path.join(SAVED_DIR, "comparisons.sqlite")
@@ -0,0 +1,191 @@
+# ------------------------------------------------------------------
+# Exchange-rate table, and its timestamped history
+#
+# "Exchange Rates.xlsx" holds the current rate per currency and is what the
+# rates tab edits. Every save also records the rates in a small SQLite
+# table keyed on (currency, effective time), each save with its own, later
+# timestamp; the rates in use before the first recorded save count as
+# effective since EARLIEST. A comparison stores the timestamp it was
+# calculated at (its "Rate Date"), so recalculating it finds the same
+# rates however many saves follow. RateHistory loads the table into sorted
+# arrays, so the rates "as of" any times are a single binary search
+# (np.searchsorted).
+# ------------------------------------------------------------------
+import os
+import sqlite3
+from contextlib import closing
+from datetime import date, datetime, time, timedelta
+
+from cif_calc.files import file_version, write_file
+from cif_calc.paths import EXCHANGE_PATH, RATE_HISTORY_PATH
+from cif_calc.timing import timed
+
+EARLIEST = "1900-01-01"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS rate_history (
+    currency   TEXT NOT NULL,
+    effective  TEXT NOT NULL,   -- ISO timestamp the rate applies from
+    rate       REAL,            -- NULL: no longer quoted from that date
+    PRIMARY KEY (currency, effective)
+) WITHOUT ROWID;
+"""
+
+def rates_version(path=EXCHANGE_PATH) -> int:
+    """Version of the stored rates; changes whenever the file is rewritten."""
+    return file_version(path)
+
+@timed
+def load_exchange_rates(path=EXCHANGE_PATH):
+    """Returns the exchange‑rate DataFrame directly from Excel."""
+    import pandas as pd
+    return pd.read_excel(path)
+
+def save_exchange_rates(df, path=EXCHANGE_PATH, expected_version=None,
+                        history_path=RATE_HISTORY_PATH, effective=None) -> int:
+    """Atomically replace the rates; VersionConflict if they changed since expected_version.
+
+    The new rates are recorded in the history as effective from effective
+    (default: the moment of the save), once the file is replaced. Returns
+    the new rates_version.
+    """
+    previous = {}
+
+    def write(tmp):
+        if not _has_history(history_path) and os.path.exists(path):
+            previous["rates"] = load_exchange_rates(path)   # seeds the history; path is replaced next
+        df.to_excel(tmp, index=False)
+
+    def installed():
+        # Still under the rates file's lock, so concurrent saves are recorded in order
+        record_rates(df, effective, history_path, previous=previous.get("rates"))
+    return write_file(path, write, expected_version, installed=installed)
+
+def _connect_history(path):
+    conn = sqlite3.connect(path, timeout=30)
+    conn.executescript(_SCHEMA)
+    return conn
+
+def _has_history(path) -> bool:
+    if not os.path.exists(path):
+        return False
+    with closing(_connect_history(path)) as conn:
+        return conn.execute("SELECT 1 FROM rate_history LIMIT 1").fetchone() is not None
+
+def _iso(ts) -> str:
+    return ts.isoformat(timespec="microseconds")
+
+def rate_time(when=None) -> str:
+    """The history key (ISO timestamp) of the rates in force at when.
+
+    None is now; a bare date (date object or "YYYY-MM-DD") is the end of
+    that day, or now for today, so it includes every save made on it.
+    """
+    import pandas as pd
+
+    current = datetime.now()
+    if when is None:
+        return _iso(current)
+    if (isinstance(when, date) and not isinstance(when, datetime)) or (isinstance(when, str) and len(when) == 10):
+        end = datetime.combine(pd.Timestamp(when).date(), time.max)
+        return _iso(min(end, current))
+    return _iso(pd.Timestamp(when).to_pydatetime())
+
+def record_rates(df, effective=None, path=RATE_HISTORY_PATH, previous=EXCHANGE_PATH) -> str:
+    """Record df's rates as effective from effective (default now); returns its history key.
+
+    Every save gets its own, strictly later key, so a comparison calculated
+    between two saves on the same day still finds the rates it used.
+    Currencies recorded before but missing from df stop being quoted from
+    then. On the first record, the previous rates (a workbook path or an
+    exchange-rate DataFrame) are kept as the rates effective since EARLIEST.
+    """
+    import pandas as pd
+
+    stamp = _iso(pd.Timestamp(effective).to_pydatetime()) if effective is not None else rate_time()
+    rates = (df.dropna(subset=["Currency"]).drop_duplicates("Currency", keep="last")
+             .set_index("Currency")["Exchange Rate to USD"])
+    rates = pd.to_numeric(rates, errors="coerce")
+    with closing(_connect_history(path)) as conn, conn:
+        conn.execute("BEGIN IMMEDIATE")
+        latest = conn.execute("SELECT MAX(effective) FROM rate_history").fetchone()[0]
+        if effective is None and latest is not None and stamp <= latest:
+            stamp = _iso(pd.Timestamp(latest).to_pydatetime() + timedelta(microseconds=1))
+        known = {r[0] for r in conn.execute("SELECT DISTINCT currency FROM rate_history")}
+        if isinstance(previous, (str, os.PathLike)):
+            previous = load_exchange_rates(previous) if not known and os.path.exists(previous) else None
+        if not known and previous is not None:
+            seed = previous.dropna(subset=["Currency"]).drop_duplicates("Currency", keep="last")
+            conn.executemany("INSERT OR REPLACE INTO rate_history VALUES (?, ?, ?)",
+                             [(str(c), EARLIEST, float(r)) for c, r in
+                              zip(seed["Currency"], pd.to_numeric(seed["Exchange Rate to USD"], errors="coerce"))])
+            known = set(seed["Currency"].astype(str))
+        rows = [(str(c), stamp, None if pd.isna(r) else float(r)) for c, r in rates.items()]
+        rows += [(c, stamp, None) for c in sorted(known - set(rates.index.astype(str)))]
+        conn.executemany("INSERT OR REPLACE INTO rate_history VALUES (?, ?, ?)", rows)
+    return stamp
+
+class RateHistory:
+    """Timestamped rates per currency, sorted by (currency, effective time) for binary-search lookups."""
+
+    def __init__(self, currency, effective, rate):
+        import numpy as np
+        import pandas as pd
+
+        self.currencies, codes = np.unique(np.asarray(currency, dtype=str), return_inverse=True)
+        times = pd.to_datetime(pd.Series(effective, dtype=object), format="ISO8601").to_numpy("datetime64[us]")
+        # Times as ranks among the distinct times, so (currency, rank) packs into one sortable int64
+        self._times = np.unique(times)
+        self._stride = len(self._times) + 1
+        ranks = np.searchsorted(self._times, times)
+        order = np.lexsort((ranks, codes))
+        self._codes = codes[order]
+        self._rates = np.asarray(rate, dtype=float)[order]
+        self._keys = self._codes.astype(np.int64) * self._stride + ranks[order]
+
+    def __len__(self):
+        return len(self._keys)
+
+    def rate_matrix(self, times):
+        """Rates in force at each of times (rows, see rate_time) for every currency (columns), NaN where none."""
+        import numpy as np
+        import pandas as pd
+
+        times = [rate_time(t) for t in times]
+        at_time = pd.to_datetime(pd.Series(times, dtype=object), format="ISO8601").to_numpy("datetime64[us]")
+        # Rank of the last recorded time at or before each time (-1 before the first)
+        ranks = np.searchsorted(self._times, at_time, side="right") - 1
+        wanted = np.arange(len(self.currencies))
+        # Last entry at or before each time: one searchsorted over every (time, currency) pair
+        at = np.searchsorted(self._keys, wanted[None, :] * self._stride + ranks[:, None], side="right") - 1
+        clipped = at.clip(0)
+        found = (at >= 0) & (self._codes[clipped] == wanted[None, :])
+        return pd.DataFrame(np.where(found, self._rates[clipped], np.nan),
+                            index=pd.Index(times, name="Rate Date"), columns=self.currencies)
+
+    def as_of(self, when=None):
+        """The exchange-rate table (Currency, Exchange Rate to USD) in force at when (default now)."""
+        row = self.rate_matrix([when]).iloc[0].dropna()
+        return row.rename("Exchange Rate to USD").rename_axis("Currency").reset_index()
+
+@timed
+def load_rate_history(path=RATE_HISTORY_PATH, current=EXCHANGE_PATH) -> RateHistory:
+    """The recorded history; without one, the current workbook's rates effective since EARLIEST."""
+    import pandas as pd
+
+    rows = []
+    if os.path.exists(path):
+        with closing(_connect_history(path)) as conn:
+            rows = conn.execute("SELECT currency, effective, rate FROM rate_history").fetchall()
+    if not rows:
+        df = load_exchange_rates(current).dropna(subset=["Currency"])
+        rows = [(c, EARLIEST, r) for c, r in
+                zip(df["Currency"], pd.to_numeric(df["Exchange Rate to USD"], errors="coerce"))]
+    currency, effective, rate = zip(*rows) if rows else ((), (), ())
+    return RateHistory(currency, effective, [float("nan") if r is None else r for r in rate])
+
+def rate_history_version(path=RATE_HISTORY_PATH) -> int:
+    return file_version(path)
+
+def currency_list(df):
+    return sorted(df["Currency"].dropna().unique().tolist())
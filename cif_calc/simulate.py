@@ -0,0 +1,155 @@
+# ------------------------------------------------------------------
+# Monte Carlo profitability – nom() over uncertain volume, rates and FX
+#
+# Every draw fixes a considered CBM / BL count, market rate, box rate and a
+# factor per rebate currency; the "Sum of Profitability" of every agent is
+# then nom()'s formula over (draws, agents) arrays, in chunks of draws
+# (and blocks of agents for the percentiles), so memory does not grow with
+# agents x draws.
+# ------------------------------------------------------------------
+import numpy as np
+import pandas as pd
+
+from cif_calc.engine import nomination_support
+from cif_calc.workbook import INPUT_FIELDS
+
+DEFAULT_DRAWS = 100_000
+DEFAULT_PERCENTILES = (5, 25, 50, 75, 95)
+CHUNK_DRAWS = 8192
+BLOCK_CELLS = 1 << 21   # agents x draws held at once for the percentiles
+
+# Simulated inputs; anything not given a distribution stays at its input value
+SIM_VARIABLES = ["Considered CBM", "Considered BLs", "Market Rate (USD)", "Box Rate (USD)"]
+DISTRIBUTIONS = {"normal", "uniform", "triangular", "lognormal"}
+
+def _draw(rng, spec, size):
+    """spec is a number (fixed) or (distribution, *numpy parameters)."""
+    if np.isscalar(spec):
+        return np.full(size, float(spec))
+    name, *params = spec
+    if name not in DISTRIBUTIONS:
+        raise ValueError(f"Unknown distribution {name!r}; use one of {sorted(DISTRIBUTIONS)}")
+    return getattr(rng, name)(*params, size=size)
+
+def rebate_currencies(in_df) -> pd.Series:
+    """Currency of each agent's (first) Rebate row, indexed by Agent Name."""
+    rebates = in_df[in_df["Description"] == "Rebate"].drop_duplicates("Agent Name")
+    return rebates.set_index("Agent Name")["Currency"]
+
+def _fx_factors(rng, currencies, fx_vol, draws):
+    """(draws, currencies) lognormal factors with mean 1; USD never moves."""
+    if not isinstance(fx_vol, dict):
+        fx_vol = {cur: fx_vol for cur in currencies}
+    sigma = np.array([0.0 if cur == "USD" else float(fx_vol.get(cur, 0.0)) for cur in currencies])
+    return np.exp(rng.standard_normal((draws, len(currencies))) * sigma - sigma ** 2 / 2)
+
+def simulate_container(coeffs, nom_df, inputs, variables=None, draws=DEFAULT_DRAWS, seed=None,
+                       rebate_currency=None, fx_vol=0.0, percentiles=DEFAULT_PERCENTILES):
+    """Profit distribution of every agent for one container type.
+
+    inputs are that container's values in INPUT_FIELDS order (as in input_dict).
+    variables maps SIM_VARIABLES to a distribution, e.g.
+    {"Considered CBM": ("triangular", 15, 20, 22), "Market Rate (USD)": ("normal", -10, 3)};
+    Considered CBM / BLs default to loadability / BLs less transhipment.
+    rebate_currency (see rebate_currencies) and fx_vol (a sigma, or one per
+    currency) let rebates move with the exchange rate. seed may be an int,
+    SeedSequence or Generator.
+
+    Returns one row per agent: Mean, Std, a column per percentile and
+    "P(Best)", the share of draws in which the agent is the most profitable.
+    """
+    rng = np.random.default_rng(seed)
+    fields = dict(zip(INPUT_FIELDS, (float(v) for v in inputs)))
+    variables = dict(variables or {})
+    unknown = set(variables) - set(SIM_VARIABLES)
+    if unknown:
+        raise ValueError(f"Cannot simulate {', '.join(sorted(unknown))}")
+    base = {
+        "Considered CBM": fields["Loadability"] - fields["Transhipment CBM"],
+        "Considered BLs": fields["Number of BLs"] - fields["Transhipment Number of BLs"],
+        "Market Rate (USD)": fields["Market Rate (USD)"],
+        "Box Rate (USD)": fields["Box Rate (USD)"],
+    }
+    # All draws up front, in a fixed order, so results only depend on the seed
+    drawn = {name: _draw(rng, variables.get(name, base[name]), draws) for name in SIM_VARIABLES}
+
+    agents = coeffs.index.to_numpy()
+    support = nomination_support(nom_df, agents)
+    nomination_rate, nomination_cbm, nomination_bl = (
+        support[c].to_numpy(dtype=float) for c in ("Nomination Rate", "Nomination CBM", "Nomination BL"))
+    rebate_cbm, rebate_bl, rebate_container = (
+        coeffs[c].to_numpy(dtype=float) for c in ("Rebate Per CBM", "Rebate Per BL", "Rebate Per Container"))
+
+    if rebate_currency is not None and fx_vol:
+        cur = pd.Series(rebate_currency).reindex(agents).fillna("USD").astype(str).to_numpy()
+        currencies, cur_code = np.unique(cur, return_inverse=True)
+        fx = _fx_factors(rng, currencies, fx_vol, draws)
+    else:
+        cur_code, fx = None, np.ones((draws, 1))   # no FX movement
+
+    # nom()'s Sum of Profitability, regrouped into draw-only, agent-only and
+    # cross terms (the freight cost on nominated CBM cancels against the
+    # free-hand one); rebates scale with the draw's FX factor
+    con_cbm, con_bl, market = (drawn[k] for k in ("Considered CBM", "Considered BLs", "Market Rate (USD)"))
+    freight_cost = drawn["Box Rate (USD)"] / fields["Loadability"]
+    draw_term = (market - freight_cost) * con_cbm + fields["Transhipment CBM"] * fields["Transhipment Profitability Per CBM"]
+    agent_term = nomination_rate * nomination_cbm
+
+    def profit(lo, hi, cols):
+        """Sum of Profitability of draws lo:hi (rows) for the agents cols (columns)."""
+        free_hand_volume = con_cbm[lo:hi, None] - nomination_cbm[cols]
+        free_hand_bl = np.trunc(con_bl[lo:hi, None] - nomination_bl[cols])
+        rebates = free_hand_volume * rebate_cbm[cols] + free_hand_bl * rebate_bl[cols] + rebate_container[cols]
+        if fx.shape[1] > 1:
+            rebates *= fx[lo:hi][:, cur_code[cols]]
+        return rebates + (draw_term[lo:hi, None] + agent_term[cols]) - np.multiply.outer(market[lo:hi], nomination_cbm[cols])
+
+    # Moments and percentiles need all of an agent's draws: a block of agents at a
+    # time, a chunk of draws at a time, so memory stays at about BLOCK_CELLS
+    # values however many agents and draws. The best agent of every draw is
+    # carried across the blocks (first agent on ties, as np.argmax).
+    stats = np.empty((len(agents), 2 + len(percentiles)))
+    best_profit = np.full(draws, -np.inf)
+    best_agent = np.zeros(draws, dtype=np.int64)
+    block = max(1, BLOCK_CELLS // max(draws, 1))
+    for first in range(0, len(agents), block):
+        cols = slice(first, min(first + block, len(agents)))
+        values = np.empty((cols.stop - first, draws), dtype=np.float32)   # agents x draws
+        for lo in range(0, draws, CHUNK_DRAWS):
+            hi = min(lo + CHUNK_DRAWS, draws)
+            pro_sum = profit(lo, hi, cols)
+            values[:, lo:hi] = pro_sum.T
+            top = pro_sum.max(axis=1)
+            better = top > best_profit[lo:hi]
+            best_profit[lo:hi][better] = top[better]
+            best_agent[lo:hi][better] = first + np.argmax(pro_sum[better], axis=1)
+        stats[cols, 0] = values.mean(axis=1, dtype=np.float64)
+        stats[cols, 1] = values.std(axis=1, dtype=np.float64)
+        stats[cols, 2:] = np.percentile(values, percentiles, axis=1).T
+    wins = np.bincount(best_agent, minlength=len(agents))
+
+    summary = pd.DataFrame({"Agent Name": agents, "Mean": stats[:, 0], "Std": stats[:, 1]})
+    for i, p in enumerate(percentiles):
+        summary[f"P{p:g}"] = stats[:, 2 + i]
+    summary["P(Best)"] = wins / draws
+    return summary
+
+def run_simulation(coeffs, nom_df, input_dict, variables=None, draws=DEFAULT_DRAWS, seed=None,
+             rebate_currency=None, fx_vol=0.0, percentiles=DEFAULT_PERCENTILES):
+    """simulate_container() for every container type of input_dict, stacked.
+
+    variables may be one mapping for all container types or
+    {container type: mapping}; each container type gets its own stream
+    derived from seed.
+    """
+    variables = variables or {}
+    per_type = any(k in input_dict for k in variables)
+    streams = np.random.SeedSequence(seed).spawn(len(input_dict))
+    frames = []
+    for (ctype, inputs), stream in zip(input_dict.items(), streams):
+        spec = variables.get(ctype) if per_type else variables
+        frames.append(simulate_container(
+            coeffs, nom_df, inputs, spec, draws, np.random.default_rng(stream),
+            rebate_currency, fx_vol, percentiles).assign(**{"Container Type": ctype}))
+    result = pd.concat(frames, ignore_index=True)
+    return result[["Container Type"] + [c for c in result.columns if c != "Container Type"]]
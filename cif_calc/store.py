@@ -0,0 +1,401 @@
+# ------------------------------------------------------------------
+# Saved comparisons – embedded SQLite store
+#
+# Every sheet of a comparison (Info, agent sheets, Nomination Support
+# Details, Comparison, Nomination) is kept as an Arrow IPC blob, so loading
+# is a single indexed read with exact dtypes and no Excel parsing, and the
+# store does not depend on the pandas version that wrote it. Object columns
+# mixing text and numbers (the Info sheet, raw agent sheets) cannot be one
+# Arrow type; they are stored as JSON text per cell and decoded on load.
+# The .xlsx workbook is only produced on download (export_workbook).
+# ------------------------------------------------------------------
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import tempfile
+import zipfile
+from contextlib import closing
+from datetime import datetime
+from io import BytesIO
+
+from cif_calc.files import VersionConflict
+from cif_calc.paths import STORE_PATH
+from cif_calc.timing import timed
+
+logger = logging.getLogger(__name__)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS comparisons (
+    name     TEXT PRIMARY KEY,
+    created  TEXT NOT NULL,
+    updated  TEXT NOT NULL,
+    version  INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS comparisons_created ON comparisons(created);
+CREATE TABLE IF NOT EXISTS meta (
+    key    TEXT PRIMARY KEY,
+    value  TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sheets (
+    comparison  TEXT NOT NULL REFERENCES comparisons(name) ON DELETE CASCADE,
+    position    INTEGER NOT NULL,
+    sheet       TEXT NOT NULL,
+    frame       BLOB NOT NULL,
+    PRIMARY KEY (comparison, sheet)
+);
+
+-- Search index, kept in step with every save / delete
+CREATE TABLE IF NOT EXISTS comparison_index (
+    name    TEXT PRIMARY KEY REFERENCES comparisons(name) ON DELETE CASCADE,
+    pol     TEXT,
+    pod     TEXT,
+    agents  INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS comparison_index_pod ON comparison_index(pod);
+CREATE TABLE IF NOT EXISTS comparison_agents (
+    name   TEXT NOT NULL REFERENCES comparisons(name) ON DELETE CASCADE,
+    agent  TEXT NOT NULL,
+    PRIMARY KEY (name, agent)
+);
+CREATE INDEX IF NOT EXISTS comparison_agents_agent ON comparison_agents(agent COLLATE NOCASE);
+CREATE TABLE IF NOT EXISTS comparison_best (
+    name   TEXT NOT NULL REFERENCES comparisons(name) ON DELETE CASCADE,
+    cbm    REAL NOT NULL,
+    agent  TEXT,
+    net    REAL,
+    PRIMARY KEY (name, cbm)
+);
+"""
+
+def connect(path=STORE_PATH) -> sqlite3.Connection:
+    """Open the store, creating the schema on first use."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")   # readers never wait for a writer
+    conn.execute("PRAGMA foreign_keys=ON")
+    conn.executescript(_SCHEMA)
+    return conn
+
+def _meta(conn, key):
+    row = conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+    return row[0] if row else None
+
+def _set_meta(conn, key, value):
+    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+def _json_cell(value):
+    if hasattr(value, "item"):   # numpy scalar
+        return value.item()
+    return str(value)
+
+def encode_frame(df) -> bytes:
+    """A DataFrame as Arrow IPC stream bytes (column names as text)."""
+    import pyarrow as pa
+
+    df = df.copy(deep=False)
+    df.columns = [str(c) for c in df.columns]
+    json_cols = []
+    for i, col in enumerate(df.columns):
+        if df.dtypes.iloc[i] == object:
+            try:
+                pa.array(df.iloc[:, i], from_pandas=True)
+            except (pa.ArrowInvalid, pa.ArrowTypeError):
+                df.isetitem(i, [None if v is None else json.dumps(v, default=_json_cell) for v in df.iloc[:, i]])
+                json_cols.append(col)
+    table = pa.Table.from_pandas(df, preserve_index=True)
+    table = table.replace_schema_metadata({**table.schema.metadata, b"cif_json_columns": json.dumps(json_cols)})
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+def decode_frame(blob):
+    """The DataFrame written by encode_frame."""
+    import pyarrow as pa
+
+    table = pa.ipc.open_stream(blob).read_all()
+    df = table.to_pandas()
+    for col in json.loads(table.schema.metadata.get(b"cif_json_columns", b"[]")):
+        # Null cells come back as None or NaN depending on the pandas version
+        df[col] = [json.loads(v) if isinstance(v, str) else None for v in df[col]]
+    return df
+
+def _blank_to_nan(df):
+    """Empty text cells as NaN, as a round-trip through a workbook leaves them."""
+    import numpy as np
+    return df.replace("", np.nan)
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+def list_comparisons(path=STORE_PATH) -> list:
+    with closing(connect(path)) as conn:
+        return [r[0] for r in conn.execute("SELECT name FROM comparisons ORDER BY name")]
+
+def comparison_version(name, path=STORE_PATH):
+    """Version counter of a comparison (bumped on every save), or None."""
+    with closing(connect(path)) as conn:
+        row = conn.execute("SELECT version FROM comparisons WHERE name = ?", (name,)).fetchone()
+    return row[0] if row else None
+
+def sheet_names(name, path=STORE_PATH) -> list:
+    with closing(connect(path)) as conn:
+        return [r[0] for r in conn.execute(
+            "SELECT sheet FROM sheets WHERE comparison = ? ORDER BY position", (name,))]
+
+@timed
+def load_comparison(name, sheets=None, path=STORE_PATH) -> dict:
+    """{sheet name: DataFrame} in sheet order; only the requested sheets if given.
+
+    Sheets that are not requested are never read from disk or decoded.
+    """
+    sql = "SELECT sheet, frame FROM sheets WHERE comparison = ?"
+    params = [name]
+    if sheets is not None:
+        sheets = list(sheets)
+        sql += f" AND sheet IN ({', '.join('?' * len(sheets))})"
+        params += sheets
+    with closing(connect(path)) as conn:
+        rows = conn.execute(sql + " ORDER BY position", params).fetchall()
+        if not rows and conn.execute("SELECT 1 FROM comparisons WHERE name = ?", (name,)).fetchone() is None:
+            raise KeyError(f"No saved comparison named {name!r}")
+    return {sheet: decode_frame(frame) for sheet, frame in rows}
+
+@timed
+def load_sheet(name, sheet, path=STORE_PATH):
+    """A single sheet of a comparison."""
+    frames = load_comparison(name, [sheet], path)
+    if sheet not in frames:
+        raise KeyError(f"{name!r} has no sheet {sheet!r}")
+    return frames[sheet]
+
+def _index_entry(sheets):
+    """Search metadata of a comparison: (pol, pod, agents, [(cbm, best agent, best net)])."""
+    from cif_calc.workbook import SPECIAL_SHEETS
+
+    pol = pod = None
+    info = sheets.get("Info")
+    if info is not None and "Field" in info.columns and len(info.columns) > 1:
+        fields = info.set_index("Field").iloc[:, 0]
+        pol, pod = fields.get("POL"), fields.get("POD")
+
+    comp = sheets.get("Comparison")
+    if comp is not None and "Agent Name" in comp.columns:
+        agents = comp["Agent Name"].dropna().astype(str).unique().tolist()
+    else:
+        agents = [s for s in sheets if s not in SPECIAL_SHEETS]
+
+    best = []
+    if comp is not None and "Type" in comp.columns:
+        net = comp[comp["Type"] == "Net Charges"].set_index("Agent Name")
+        slab_cols = [c for c in net.columns if str(c).startswith("CBM ")]
+        if len(net) and slab_cols:
+            values = net[slab_cols].apply(lambda c: c.astype(float))
+            best = [(float(c[4:]), str(values[c].idxmin()), float(values[c].min()))
+                    for c in slab_cols if values[c].notna().any()]
+    return (None if pol is None else str(pol), None if pod is None else str(pod), agents, best)
+
+def _write_index(conn, name, sheets):
+    pol, pod, agents, best = _index_entry(sheets)
+    for table in ("comparison_index", "comparison_agents", "comparison_best"):
+        conn.execute(f"DELETE FROM {table} WHERE name = ?", (name,))
+    conn.execute("INSERT INTO comparison_index (name, pol, pod, agents) VALUES (?, ?, ?, ?)",
+                 (name, pol, pod, len(agents)))
+    conn.executemany("INSERT OR IGNORE INTO comparison_agents (name, agent) VALUES (?, ?)",
+                     [(name, a) for a in agents])
+    conn.executemany("INSERT INTO comparison_best (name, cbm, agent, net) VALUES (?, ?, ?, ?)",
+                     [(name, *b) for b in best])
+
+@timed
+def save_comparison(name, sheets, path=STORE_PATH, expected_version=None, created=None) -> int:
+    """Create or replace a comparison; returns its new version.
+
+    expected_version is the comparison_version() the sheets were based on
+    (0 for a comparison that must not exist yet); if another save got in
+    first, VersionConflict is raised and nothing is written. created (ISO
+    time, default now) only applies to a new comparison. Blank text cells
+    are stored as NaN, as the saved workbooks had them.
+    """
+    blobs = [(name, pos, sheet, encode_frame(_blank_to_nan(df)))
+             for pos, (sheet, df) in enumerate(sheets.items())]
+    now = _now()
+    with closing(connect(path)) as conn, conn:
+        conn.execute("BEGIN IMMEDIATE")   # hold the write lock from the version check to the commit
+        if expected_version is not None:
+            row = conn.execute("SELECT version FROM comparisons WHERE name = ?", (name,)).fetchone()
+            if (row[0] if row else 0) != expected_version:
+                raise VersionConflict(f"{name!r} was saved by someone else in the meantime")
+        conn.execute(
+            "INSERT INTO comparisons (name, created, updated, version) VALUES (?, ?, ?, 1) "
+            "ON CONFLICT(name) DO UPDATE SET updated = excluded.updated, version = version + 1",
+            (name, created or now, now))
+        conn.execute("DELETE FROM sheets WHERE comparison = ?", (name,))
+        conn.executemany(
+            "INSERT INTO sheets (comparison, position, sheet, frame) VALUES (?, ?, ?, ?)", blobs)
+        _write_index(conn, name, sheets)
+        return conn.execute("SELECT version FROM comparisons WHERE name = ?", (name,)).fetchone()[0]
+
+def delete_comparison(name, path=STORE_PATH):
+    with closing(connect(path)) as conn, conn:
+        conn.execute("DELETE FROM comparisons WHERE name = ?", (name,))
+
+def index_missing(path=STORE_PATH) -> int:
+    """Index comparisons saved before the search index existed; returns how many."""
+    with closing(connect(path)) as conn:
+        names = [r[0] for r in conn.execute(
+            "SELECT name FROM comparisons WHERE name NOT IN (SELECT name FROM comparison_index)")]
+    for name in names:
+        sheets = load_comparison(name, path=path)
+        with closing(connect(path)) as conn, conn:
+            _write_index(conn, name, sheets)
+    return len(names)
+
+def indexed_values(column, path=STORE_PATH) -> list:
+    """Distinct POL / POD values in the index, for filter dropdowns."""
+    if column not in ("pol", "pod"):
+        raise ValueError(f"Unknown index column {column!r}")
+    with closing(connect(path)) as conn:
+        return [r[0] for r in conn.execute(
+            f"SELECT DISTINCT {column} FROM comparison_index WHERE {column} IS NOT NULL ORDER BY {column}")]
+
+def search_comparisons(pod=None, pol=None, agent=None, since=None, until=None,
+                       cbm=None, max_net=None, path=STORE_PATH):
+    """Filter saved comparisons through the index, without loading any sheet.
+
+    agent matches case-insensitively on part of a name; since / until are dates
+    (or ISO strings) on the creation time; cbm picks the slab whose best net charge
+    is reported (and compared with max_net). Returns a DataFrame, newest first.
+    """
+    import pandas as pd
+
+    index_missing(path)
+    where, params = [], []
+    if pod:
+        where.append("i.pod = ?"); params.append(pod)
+    if pol:
+        where.append("i.pol = ?"); params.append(pol)
+    if agent:
+        where.append("i.name IN (SELECT name FROM comparison_agents WHERE agent LIKE ?)")
+        params.append(f"%{agent}%")
+    if since:
+        where.append("c.created >= ?"); params.append(str(since))
+    if until:
+        where.append("c.created < date(?, '+1 day')"); params.append(str(until))
+    best_join = ""
+    if cbm is not None:
+        best_join = "LEFT JOIN comparison_best b ON b.name = i.name AND b.cbm = ?"
+        params.insert(0, float(cbm))
+        if max_net is not None:
+            where.append("b.net <= ?"); params.append(float(max_net))
+
+    sql = f"""
+        SELECT i.name AS "Name", i.pol AS "POL", i.pod AS "POD", i.agents AS "Agents",
+               c.created AS "Created", c.updated AS "Updated"
+               {', b.agent AS "Best Agent", b.net AS "Best Net Charges"' if cbm is not None else ''}
+        FROM comparison_index i JOIN comparisons c ON c.name = i.name
+        {best_join}
+        {'WHERE ' + ' AND '.join(where) if where else ''}
+        ORDER BY c.created DESC, i.name
+    """
+    with closing(connect(path)) as conn:
+        return pd.read_sql_query(sql, conn, params=params)
+
+def add_empty_agent(name, base="NewAgent", path=STORE_PATH, expected_version=None) -> str:
+    """Add an empty agent sheet (NewAgent1, NewAgent2, …) before the result sheets."""
+    import pandas as pd
+    from cif_calc.workbook import AGENT_SHEET_HEADERS, SPECIAL_SHEETS
+
+    if expected_version is None:
+        expected_version = comparison_version(name, path)
+    sheets = load_comparison(name, path=path)
+    count = 1
+    while f"{base}{count}" in sheets:
+        count += 1
+    new_sheet = f"{base}{count}"
+
+    sheets[new_sheet] = pd.DataFrame(columns=AGENT_SHEET_HEADERS)
+    order = [s for s in sheets if s != new_sheet]
+    agents = [i for i, s in enumerate(order) if s not in SPECIAL_SHEETS]
+    order.insert(agents[-1] + 1 if agents else int("Info" in order), new_sheet)
+    save_comparison(name, {s: sheets[s] for s in order}, path, expected_version)
+    return new_sheet
+
+@timed
+def export_workbook(name, path=STORE_PATH) -> bytes:
+    """The comparison as .xlsx bytes, generated on demand."""
+    from cif_calc.workbook import write_workbook
+
+    buf = BytesIO()
+    write_workbook(load_comparison(name, path=path), buf)
+    return buf.getvalue()
+
+# Archives stay in memory up to this size and spill to a temp file beyond it
+ARCHIVE_SPOOL_BYTES = 32 * 1024 * 1024
+
+def archive_signature(path=STORE_PATH) -> str:
+    """Changes whenever a comparison is added, saved or deleted."""
+    with closing(connect(path)) as conn:
+        rows = conn.execute("SELECT name, version FROM comparisons ORDER BY name").fetchall()
+    return hashlib.sha1(repr(rows).encode()).hexdigest()
+
+@timed
+def write_archive(target, names=None, path=STORE_PATH):
+    """Zip the comparisons' workbooks into target, holding one workbook in memory at a time."""
+    names = list_comparisons(path) if names is None else names
+    with zipfile.ZipFile(target, "w") as zipf:
+        for name in names:
+            zipf.writestr(f"{name}.xlsx", export_workbook(name, path))
+
+def export_archive(path=STORE_PATH):
+    """Every comparison as a zip in a rewound SpooledTemporaryFile."""
+    spool = tempfile.SpooledTemporaryFile(max_size=ARCHIVE_SPOOL_BYTES)
+    write_archive(spool, path=path)
+    spool.seek(0)
+    return spool
+
+def import_workbook(xlsx_path, name=None, path=STORE_PATH) -> str:
+    """Copy a saved .xlsx comparison into the store, created when the file was last written."""
+    import pandas as pd
+
+    name = name or os.path.splitext(os.path.basename(xlsx_path))[0]
+    created = datetime.fromtimestamp(os.path.getmtime(xlsx_path)).isoformat(timespec="seconds")
+    save_comparison(name, pd.read_excel(xlsx_path, sheet_name=None), path, created=created)
+    return name
+
+def _is_comparison_workbook(xlsx_path) -> bool:
+    from openpyxl import load_workbook
+
+    wb = load_workbook(xlsx_path, read_only=True)
+    try:
+        return {"Info", "Comparison"} <= set(wb.sheetnames)
+    finally:
+        wb.close()
+
+def import_saved_workbooks(directory, path=STORE_PATH, force=False):
+    """One-time migration of the comparison workbooks in directory into the store.
+
+    Runs once per store (recorded in its meta table) unless force. Only
+    workbooks with Info and Comparison sheets that are not in the store yet
+    are imported. Returns (imported names, [(file, error)] that failed).
+    """
+    with closing(connect(path)) as conn:
+        if _meta(conn, "saved_workbooks_imported") and not force:
+            return [], []
+    known = set(list_comparisons(path))
+    imported, failed = [], []
+    for f in sorted(os.listdir(directory)) if os.path.isdir(directory) else []:
+        name, ext = os.path.splitext(f)
+        if ext.lower() != ".xlsx" or name in known or f.startswith((".", "~$")):
+            continue
+        xlsx_path = os.path.join(directory, f)
+        try:
+            if _is_comparison_workbook(xlsx_path):
+                imported.append(import_workbook(xlsx_path, name, path))
+        except Exception as e:
+            logger.warning("Could not import %s: %s", xlsx_path, e)
+            failed.append((f, str(e)))
+    with closing(connect(path)) as conn, conn:
+        _set_meta(conn, "saved_workbooks_imported", _now())
+    return imported, failed
@@ -0,0 +1,186 @@
+# ------------------------------------------------------------------
+# Scenario sweep – one agent set across many PODs and container inputs
+#
+#   python -m cif_calc.sweep --comparison Tender_2025 --scenarios grid.xlsx
+#   python -m cif_calc.sweep --xlsx Data/Saved/Tender.xlsx --scenarios grid.csv -o sweep.csv
+#   python -m cif_calc.sweep --comparison Tender_2025 --pods Dubai Jebel\ Ali -o grid.xlsx --grid-only
+#
+# A scenarios table has one row per POD x scenario x container type with
+# the Info-sheet input fields (see SCENARIO_COLS). Every row is evaluated
+# for every agent at once as (scenarios, agents) arrays.
+# ------------------------------------------------------------------
+import argparse
+import itertools
+import os
+import sys
+import time
+
+from cif_calc.paths import EXCHANGE_PATH, RATE_HISTORY_PATH, STORE_PATH
+from cif_calc.workbook import INPUT_FIELDS
+
+SCENARIO_KEYS = ["POD", "Scenario", "Container Type"]
+SCENARIO_COLS = SCENARIO_KEYS + INPUT_FIELDS
+
+RESULT_COLS = [
+    "Considered CBM", "Considered BLs", "Freight Cost", "Nomination Rate", "Nomination CBM",
+    "Free Hand CBM", "Free Hand BL", "Profitability on Free Hand", "Profitability on Nomination",
+    "Sum of Profitability", "Net Charges", "Rank",
+]
+
+def scenario_grid(pods, input_dict, variations=None):
+    """Scenarios table for every POD and every combination of variations.
+
+    input_dict holds the base inputs per container type (as in agent_compare);
+    variations maps (container type, input field) to the values to try, e.g.
+    {("20'STD", "Box Rate (USD)"): [1600, 1800, 2000]}. Scenarios are numbered
+    from 1 in the same order for every POD.
+    """
+    import pandas as pd
+
+    variations = dict(variations or {})
+    for ctype, field in variations:
+        if ctype not in input_dict or field not in INPUT_FIELDS:
+            raise ValueError(f"Unknown input {ctype} / {field}")
+    combos = list(itertools.product(*variations.values()))
+
+    rows = []
+    for pod in pods:
+        for scenario, values in enumerate(combos, start=1):
+            chosen = dict(zip(variations, values))
+            for ctype, base in input_dict.items():
+                fields = {f: chosen.get((ctype, f), v) for f, v in zip(INPUT_FIELDS, base)}
+                rows.append({"POD": pod, "Scenario": scenario, "Container Type": ctype, **fields})
+    return pd.DataFrame(rows, columns=SCENARIO_COLS)
+
+def run_sweep(coeffs, nom_df, scenarios, caps=None):
+    """Evaluate nom() and the net charge for every scenario row x agent.
+
+    coeffs / caps come from agent_coefficients / charge_caps; the net charge
+    is taken at each scenario's considered CBM (loadability less transhipment).
+    Returns a long table: SCENARIO_KEYS, "Agent Name", RESULT_COLS, one row per
+    scenario row and agent, ready for pivot_table. "Rank" is 1 for the most
+    profitable agent of each POD / scenario / container type.
+    """
+    import numpy as np
+    import pandas as pd
+    from cif_calc.engine import charge_ladder, nom, nomination_support
+
+    missing = [c for c in SCENARIO_COLS if c not in scenarios.columns]
+    if missing:
+        raise ValueError(f"Scenarios are missing {', '.join(missing)}")
+    agents = coeffs.index.to_numpy()
+    n_scen, n_agents = len(scenarios), len(agents)
+
+    def col(name):   # scenario inputs as a (scenarios, 1) column
+        return pd.to_numeric(scenarios[name], errors="coerce").to_numpy(dtype=float)[:, None]
+
+    loadability, box_rate, num_bl, market_rate = (
+        col(f) for f in ("Loadability", "Box Rate (USD)", "Number of BLs", "Market Rate (USD)"))
+    tran_cbm, tran_bl, tran_pro = (
+        col(f) for f in ("Transhipment CBM", "Transhipment Number of BLs", "Transhipment Profitability Per CBM"))
+    con_cbm = loadability - tran_cbm
+    con_bl = num_bl - tran_bl
+    with np.errstate(divide="ignore", invalid="ignore"):
+        freight_cost = np.where(loadability != 0, box_rate / loadability, np.nan)
+
+    support = nomination_support(nom_df, agents)
+    nomination_rate, nomination_cbm, nomination_bl = (
+        support[c].to_numpy(dtype=float)[None, :] for c in ("Nomination Rate", "Nomination CBM", "Nomination BL"))
+    rebate_cbm, rebate_bl, rebate_container = (
+        coeffs[c].to_numpy(dtype=float)[None, :] for c in ("Rebate Per CBM", "Rebate Per BL", "Rebate Per Container"))
+
+    # nom() works on arrays; NaN inputs would break its integer BL count
+    free_hand_volume, free_hand_bl, pro_free_hand, pro_nomination, pro_sum = nom(
+        np.nan_to_num(con_cbm), np.nan_to_num(con_bl), freight_cost, market_rate,
+        nomination_rate, nomination_cbm, nomination_bl,
+        rebate_cbm, rebate_bl, rebate_container, tran_cbm, tran_pro)
+
+    # Net charges at each distinct considered CBM, computed once per volume
+    volumes, which = np.unique(np.nan_to_num(con_cbm[:, 0]), return_inverse=True)
+    net = charge_ladder(coeffs, volumes, caps)[:, 4, :][:, which].T    # (scenarios, agents)
+
+    order = np.argsort(-np.nan_to_num(pro_sum, nan=-np.inf), axis=1, kind="stable")
+    rank = np.empty_like(order)
+    np.put_along_axis(rank, order, np.arange(1, n_agents + 1)[None, :], axis=1)
+
+    def flat(a):
+        return np.broadcast_to(a, (n_scen, n_agents)).ravel()
+
+    keys = scenarios[SCENARIO_KEYS].reset_index(drop=True)
+    result = keys.loc[keys.index.repeat(n_agents)].reset_index(drop=True)
+    result["Agent Name"] = np.tile(agents, n_scen)
+    for name, values in zip(RESULT_COLS, (
+            con_cbm, con_bl, freight_cost, nomination_rate, nomination_cbm,
+            free_hand_volume, free_hand_bl, pro_free_hand, pro_nomination,
+            pro_sum, net, rank)):
+        result[name] = flat(values)
+    return result
+
+def _agent_set(args, history):
+    from cif_calc import store
+    from cif_calc.engine import agent_coefficients, charge_caps
+    from cif_calc.workbook import comparison_inputs, read_comparison_workbook
+
+    if args.xlsx:
+        saved = read_comparison_workbook(args.xlsx)
+    else:
+        saved = comparison_inputs(store.load_comparison(args.comparison, path=args.store))
+    # The comparison's own rate date unless --as-of overrides it
+    exchange_df = history.as_of(args.as_of or saved["rate_date"])
+    in_df = saved["in_df"]
+    return agent_coefficients(in_df, exchange_df), charge_caps(in_df, exchange_df), saved
+
+def _write_table(df, path, sheet):
+    from cif_calc.workbook import write_workbook
+    if path.lower().endswith(".csv"):
+        df.to_csv(path, index=False)
+    else:
+        write_workbook({sheet: df}, path)
+
+def _read_table(path):
+    import pandas as pd
+    return pd.read_csv(path) if path.lower().endswith(".csv") else pd.read_excel(path)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate one agent set over many PODs and container inputs.")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--comparison", help="saved comparison (in the store) supplying the agents")
+    source.add_argument("--xlsx", help="comparison workbook supplying the agents")
+    grid = parser.add_mutually_exclusive_group(required=True)
+    grid.add_argument("--scenarios", help=f".xlsx / .csv with columns: {', '.join(SCENARIO_COLS)}")
+    grid.add_argument("--pods", nargs="+",
+                      help="use the comparison's own container inputs for each of these PODs")
+    parser.add_argument("--grid-only", action="store_true",
+                        help="write the scenarios table (to edit and pass back with --scenarios) and stop")
+    parser.add_argument("-o", "--output", default="sweep.xlsx", help=".xlsx or .csv (default: %(default)s)")
+    parser.add_argument("--store", default=STORE_PATH, help="saved-comparison store (default: %(default)s)")
+    parser.add_argument("--exchange-rates", default=EXCHANGE_PATH,
+                        help="exchange-rate workbook, used while there is no rate history (default: %(default)s)")
+    parser.add_argument("--rate-history", default=RATE_HISTORY_PATH,
+                        help="dated exchange-rate history (default: %(default)s)")
+    parser.add_argument("--as-of", metavar="YYYY-MM-DD[THH:MM:SS]",
+                        help="exchange rates in force then, a bare date meaning the end of that day "
+                             "(default: the comparison's rate date)")
+    args = parser.parse_args(argv)
+
+    from cif_calc.rates import load_rate_history
+
+    coeffs, caps, saved = _agent_set(args, load_rate_history(args.rate_history, args.exchange_rates))
+    scenarios = (_read_table(args.scenarios) if args.scenarios
+                 else scenario_grid(args.pods, saved["input_dict"]))
+    if args.grid_only:
+        _write_table(scenarios, args.output, "Scenarios")
+        print(f"{len(scenarios)} scenario rows -> {os.path.abspath(args.output)}")
+        return 0
+
+    start = time.perf_counter()
+    result = run_sweep(coeffs, saved["nom_df"], scenarios, caps)
+    elapsed = time.perf_counter() - start
+
+    _write_table(result, args.output, "Sweep")
+    print(f"{len(scenarios)} scenario rows x {len(coeffs)} agents = {len(result)} results "
+          f"in {elapsed:.2f}s -> {os.path.abspath(args.output)}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
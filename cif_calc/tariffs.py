@@ -0,0 +1,275 @@
+# ------------------------------------------------------------------
+# Bulk tariff import – agent charge sheets from .xlsx / .csv
+#
+# A tariff file uses the saved agent-sheet layout (AGENT_SHEET_HEADERS):
+# a CSV with an "Agent Name" column, or a workbook with one sheet per agent
+# (a saved comparison workbook works as is). Nomination support comes from
+# a "Nomination Support Details" sheet or Nomination Rate / CBM / BL columns
+# next to the charges. Every check runs over whole columns at once and
+# reports each bad cell with its sheet and spreadsheet row.
+# ------------------------------------------------------------------
+import os
+
+import numpy as np
+import pandas as pd
+
+from cif_calc.engine import MONEY_COLS, NOMINATION_COLS
+from cif_calc.timing import timed
+from cif_calc.workbook import AGENT_SHEET_HEADERS, NOM_SHEET, SPECIAL_SHEETS
+
+TARIFF_ERROR_COLS = ["Sheet", "Row", "Agent Name", "Column", "Problem", "Value"]
+NUMERIC_COLS = MONEY_COLS + ["Vat(%)", "Per Container"]
+
+def read_tariff_file(source, name=None) -> dict:
+    """{sheet: frame} of a tariff file (path or file-like with name).
+
+    A CSV is a single sheet named after the file.
+    """
+    name = name or getattr(source, "name", None) or str(source)
+    if name.lower().endswith(".csv"):
+        return {os.path.splitext(os.path.basename(name))[0]: pd.read_csv(source, dtype=object)}
+    return pd.read_excel(source, sheet_name=None, dtype=object)
+
+def _blank(values):
+    """Empty / whitespace-only cells of a Series or DataFrame."""
+    if isinstance(values, pd.DataFrame):
+        return values.apply(_blank)
+    return values.isna() | values.astype(str).str.strip().eq("")
+
+def _errors(df, mask, problem):
+    """One error row per True cell of mask (same index / columns as df)."""
+    hits = mask.stack()
+    hits = hits[hits]
+    rows, cols = hits.index.get_level_values(0), hits.index.get_level_values(1)
+    values = df.to_numpy(dtype=object)[df.index.get_indexer(rows), df.columns.get_indexer(cols)]
+    return pd.DataFrame({
+        "Sheet": df.loc[rows, "Sheet"].to_numpy(),
+        "Row": df.loc[rows, "Row"].to_numpy(),
+        "Agent Name": df.loc[rows, "Agent Name"].to_numpy(),
+        "Column": cols.to_numpy(),
+        "Problem": problem,
+        "Value": values,
+    }, columns=TARIFF_ERROR_COLS)
+
+def _numbers(df, cols, errors):
+    """cols of df as floats (blank -> NaN); non-numeric cells are reported."""
+    values = df[cols]
+    numbers = values.apply(pd.to_numeric, errors="coerce")
+    errors.append(_errors(df, numbers.isna() & ~_blank(values), "not a number"))
+    return numbers
+
+def _charge_rows(sheets):
+    """All agent rows in one frame, with their sheet and spreadsheet row."""
+    frames = []
+    for sheet, df in sheets.items():
+        if sheet in SPECIAL_SHEETS or "Description" not in df.columns:
+            continue
+        df = df.copy()
+        # A per-agent sheet may leave the name to the sheet, or fill it once
+        if "Agent Name" not in df.columns:
+            df["Agent Name"] = sheet
+        names = df["Agent Name"].where(~_blank(df["Agent Name"]))
+        if names.nunique() <= 1:
+            names = names.ffill().bfill()
+        else:
+            # Several agents in one sheet: a blank only continues the agent
+            # named on both sides of it; any other blank is reported
+            before, after = names.ffill(), names.bfill()
+            names = names.fillna(before.where(before == after))
+        df["Agent Name"] = names
+        df["Sheet"] = sheet
+        df["Row"] = np.arange(len(df)) + 2      # header is row 1
+        frames.append(df)
+    if not frames:
+        raise ValueError("No agent sheet found (expected a 'Description' column)")
+    rows = pd.concat(frames, ignore_index=True)
+    for col in AGENT_SHEET_HEADERS + NOMINATION_COLS:
+        if col not in rows.columns:
+            rows[col] = np.nan
+    rows["Description"] = rows["Description"].fillna("").astype(str).str.strip()
+    return rows[rows["Description"] != ""].reset_index(drop=True)
+
+def tariff_frames(sheets, currencies):
+    """Validate a tariff file and build the calculator's (in_df, nom_df).
+
+    currencies are the known exchange-rate currencies. Returns
+    (in_df, nom_df, errors); errors has TARIFF_ERROR_COLS, one row per bad
+    cell, and in_df / nom_df should only be used when it is empty.
+    """
+    rows = _charge_rows(sheets)
+    errors = []
+
+    missing_agent = pd.DataFrame({"Agent Name": rows["Agent Name"].isna()})
+    errors.append(_errors(rows, missing_agent, "missing agent name"))
+
+    numbers = _numbers(rows, NUMERIC_COLS, errors)
+    # Remarks rows keep their note in the Currency column
+    is_remark = rows["Description"].eq("Remarks")
+    currency = rows["Currency"].fillna("").astype(str).str.strip()
+    unknown = ~is_remark & ~currency.isin(list(currencies))
+    errors.append(_errors(rows, pd.DataFrame({"Currency": unknown}), "unknown currency"))
+
+    is_rebate = rows["Description"].eq("Rebate")
+    extra_rebate = is_rebate & rows.loc[is_rebate, "Agent Name"].duplicated().reindex(rows.index, fill_value=False)
+    errors.append(_errors(rows, pd.DataFrame({"Description": extra_rebate}), "more than one Rebate row"))
+
+    in_df = rows[AGENT_SHEET_HEADERS].copy()
+    in_df["Currency"] = currency.where(~is_remark, rows["Currency"].fillna(""))
+    in_df[NUMERIC_COLS] = numbers.astype(object).where(numbers.notna(), "")
+    agents = in_df["Agent Name"].dropna().unique()
+
+    # Nomination support: its own sheet, else columns beside the charges
+    if NOM_SHEET in sheets:
+        nom = sheets[NOM_SHEET].copy()
+        for col in NOMINATION_COLS:
+            if col not in nom.columns:
+                nom[col] = np.nan
+        nom = nom.assign(Sheet=NOM_SHEET, Row=np.arange(len(nom)) + 2)
+        nom[NOMINATION_COLS] = _numbers(nom, NOMINATION_COLS, errors)
+    else:
+        nom = rows[["Agent Name"]].assign(**_numbers(rows, NOMINATION_COLS, errors))
+    nom_df = (nom.dropna(subset=["Agent Name"]).groupby("Agent Name", sort=False)[NOMINATION_COLS].first()
+              .reindex(agents).fillna(0).rename_axis("Agent Name").reset_index())
+
+    errors = pd.concat(errors, ignore_index=True).sort_values(["Sheet", "Row"], kind="stable")
+    return in_df, nom_df, errors.reset_index(drop=True)
+
+@timed
+def import_tariffs(source, currencies, name=None):
+    """read_tariff_file() + tariff_frames()."""
+    return tariff_frames(read_tariff_file(source, name), currencies)
+
+# ------------------------------------------------------------------
+# Agent forms – the calculator's per-agent widgets
+# ------------------------------------------------------------------
+DEFAULT_CHARGE_ROWS = 8
+
+def form_frames(state, agent_ids):
+    """(in_df, nom_df) from the agent forms' widget values.
+
+    state is any mapping of widget key -> value (st.session_state in the
+    app); agent_ids are the form ids in tab order. Blank charge heads are
+    skipped; every agent gets a Remarks and a Rebate row.
+    """
+    get = state.get
+    rows, nom_rows = [], []
+    blank = {"Per CBM": "", "Per Ton": "", "Minimum": "", "Maximum": "", "Per BL": "", "Vat(%)": "",
+             "Per Container": ""}
+
+    for agent_id in agent_ids:
+        agent_name = get(f"agent_name_{agent_id}", f"Agent {agent_id}")
+        nom_rows.append({
+            "Agent Name": agent_name,
+            "Nomination Rate": get(f"nom_support_rate_{agent_id}", 0),
+            "Nomination CBM": get(f"nom_support_cbm_{agent_id}", 0),
+            "Nomination BL": get(f"nom_support_bl_{agent_id}", 0),
+        })
+
+        for i in range(1, get(f"{agent_id}_num_charge_rows", DEFAULT_CHARGE_ROWS) + 1):
+            desc = get(f"{agent_id}_desc_{i}", "")
+            if desc.strip() == "":
+                continue
+            rows.append({
+                "Agent Name": agent_name,
+                "Description": desc,
+                "Currency": get(f"{agent_id}_currency_{i}", ""),
+                "Per CBM": get(f"{agent_id}_cbm_{i}", ""),
+                "Per Ton": get(f"{agent_id}_ton_{i}", ""),
+                "Minimum": get(f"{agent_id}_min_{i}", ""),
+                "Maximum": get(f"{agent_id}_max_{i}", ""),
+                "Per BL": get(f"{agent_id}_bl_{i}", ""),
+                "Vat(%)": get(f"{agent_id}_vat_{i}", ""),
+                "Per Container": "",
+            })
+
+        rows.append({"Agent Name": agent_name, "Description": "Remarks",
+                     **blank, "Currency": get(f"{agent_id}_desc_notes", "")})
+        rows.append({
+            **blank,
+            "Agent Name": agent_name,
+            "Description": "Rebate",
+            "Currency": get(f"{agent_id}_rebate_currency", ""),
+            "Per CBM": get(f"{agent_id}_rebate_cbm", ""),
+            "Per Ton": get(f"{agent_id}_rebate_ton", ""),
+            "Per BL": get(f"{agent_id}_rebate_bl", ""),
+            "Per Container": get(f"{agent_id}_rebate_container", ""),
+        })
+
+    in_df = pd.DataFrame(rows, columns=AGENT_SHEET_HEADERS)
+    nom_df = pd.DataFrame(nom_rows, columns=["Agent Name"] + NOMINATION_COLS)
+    return in_df, nom_df
+
+def form_keys(state, agent_ids) -> list:
+    """Keys of state holding the agent forms' values (everything form_frames reads)."""
+    named = {f"{field}_{a}" for a in agent_ids
+             for field in ("agent_name", "nom_support_rate", "nom_support_cbm", "nom_support_bl")}
+    prefixes = tuple(f"{a}_" for a in agent_ids)
+    return [k for k in state.keys() if isinstance(k, str) and (k in named or k.startswith(prefixes))]
+
+# ------------------------------------------------------------------
+# Agent grid – the calculator's table entry mode
+#
+# One table of charge heads (a row per agent x charge head) and one of
+# per-agent terms (nomination support, rebate, remarks). grid_frames turns
+# them into the same (in_df, nom_df) the agent forms produce.
+# ------------------------------------------------------------------
+GRID_CHARGE_COLS = ["Agent Name", "Description", "Currency", "Per CBM", "Per Ton", "Minimum", "Maximum",
+                    "Per BL", "Vat(%)"]
+REBATE_COLS = {"Rebate Per CBM": "Per CBM", "Rebate Per Ton": "Per Ton", "Rebate Per BL": "Per BL",
+               "Rebate Per Container": "Per Container"}
+GRID_TERM_COLS = ["Agent Name"] + NOMINATION_COLS + ["Rebate Currency"] + list(REBATE_COLS) + ["Remarks"]
+
+def _text(s):
+    return s.fillna("").astype(str).str.strip()
+
+def grid_frames(charges, terms):
+    """(in_df, nom_df) from the agent grid's charges and terms tables.
+
+    Every agent of terms gets its Remarks and Rebate rows after its charge
+    heads, as the agent forms write them; charge rows without an agent or a
+    description are skipped. Blank amounts stay blank.
+    """
+    terms = terms.assign(**{"Agent Name": _text(terms["Agent Name"])})
+    terms = terms[terms["Agent Name"] != ""].drop_duplicates("Agent Name")
+    charges = charges.assign(**{"Agent Name": _text(charges["Agent Name"]),
+                                "Description": _text(charges["Description"])})
+    charges = charges[(charges["Agent Name"] != "") & (charges["Description"] != "")]
+
+    remarks = pd.DataFrame({"Agent Name": terms["Agent Name"], "Description": "Remarks",
+                            "Currency": _text(terms["Remarks"])})
+    rebates = terms.rename(columns={"Rebate Currency": "Currency", **REBATE_COLS}).assign(Description="Rebate")
+    in_df = pd.concat([charges, remarks, rebates], ignore_index=True).reindex(columns=AGENT_SHEET_HEADERS)
+
+    # Group each agent's rows together, agents in order of first appearance
+    codes, agents = pd.factorize(in_df["Agent Name"])
+    in_df = in_df.iloc[np.argsort(codes, kind="stable")].reset_index(drop=True)
+    in_df[NUMERIC_COLS] = in_df[NUMERIC_COLS].astype(object).where(in_df[NUMERIC_COLS].notna(), "")
+    in_df["Currency"] = in_df["Currency"].fillna("")
+
+    nom_df = (terms.set_index("Agent Name")[NOMINATION_COLS].apply(pd.to_numeric, errors="coerce")
+              .reindex(agents).fillna(0).rename_axis("Agent Name").reset_index())
+    return in_df, nom_df
+
+def agent_grid(in_df, nom_df):
+    """The agent grid's (charges, terms) tables for an existing (in_df, nom_df)."""
+    description = _text(in_df["Description"]) if "Description" in in_df else pd.Series(dtype=object)
+    charges = in_df[~description.isin(["Rebate", "Remarks"])].reindex(columns=GRID_CHARGE_COLS)
+    charges[GRID_CHARGE_COLS[3:]] = charges[GRID_CHARGE_COLS[3:]].apply(pd.to_numeric, errors="coerce").astype(float)
+
+    agents = pd.unique(pd.concat([in_df.get("Agent Name", pd.Series(dtype=object)), nom_df["Agent Name"]]).dropna())
+    first = in_df.drop_duplicates(["Agent Name", "Description"]).set_index(["Description", "Agent Name"])
+
+    def per_agent(description, col):
+        if description not in first.index.get_level_values(0):
+            return pd.Series(np.nan, index=agents)
+        return first.loc[description][col].reindex(agents)
+
+    terms = pd.DataFrame({"Agent Name": agents})
+    support = nom_df.drop_duplicates("Agent Name").set_index("Agent Name").reindex(columns=NOMINATION_COLS)
+    for col in NOMINATION_COLS:
+        terms[col] = pd.to_numeric(support[col].reindex(agents), errors="coerce").fillna(0).to_numpy()
+    terms["Rebate Currency"] = per_agent("Rebate", "Currency").fillna("USD").to_numpy()
+    for grid_col, col in REBATE_COLS.items():
+        terms[grid_col] = pd.to_numeric(per_agent("Rebate", col), errors="coerce").to_numpy(dtype=float)
+    terms["Remarks"] = per_agent("Remarks", "Currency").fillna("").to_numpy()
+    return charges.reset_index(drop=True), terms[GRID_TERM_COLS]
@@ -0,0 +1,140 @@
+# ------------------------------------------------------------------
+# Timing spans – opt-in instrumentation of the hot paths
+#
+#   CIF_TIMING=1 streamlit run main.py                  # spans + timing panel
+#   CIF_TIMING=1 CIF_TIMING_LOG=timing.jsonl python -m cif_calc.batch
+#
+# Off by default: span() then hands back one shared no-op context manager
+# and @timed returns the function undecorated, so the instrumentation costs
+# a flag check. On, every span feeds rolling per-stage statistics (the last
+# ROLLING_WINDOW durations) and is logged as one JSON line on the
+# "cif_calc.timing" logger (to CIF_TIMING_LOG, else stderr). The flag is
+# read once at import.
+# ------------------------------------------------------------------
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+ROLLING_WINDOW = 200
+
+logger = logging.getLogger(__name__)
+
+_enabled = os.environ.get("CIF_TIMING", "").strip().lower() not in ("", "0", "false", "no")
+_lock = threading.Lock()
+_samples = {}                 # stage -> deque of recent durations (seconds)
+_calls = {}                   # stage -> calls since start / reset
+_local = threading.local()    # spans of the current rerun, per script thread
+
+def enabled() -> bool:
+    return _enabled
+
+def _record(stage, seconds, fields):
+    with _lock:
+        if stage not in _samples:
+            _samples[stage] = deque(maxlen=ROLLING_WINDOW)
+        _samples[stage].append(seconds)
+        _calls[stage] = _calls.get(stage, 0) + 1
+    rerun = getattr(_local, "rerun", None)
+    if rerun is not None:
+        rerun.append((stage, seconds))
+    logger.info(json.dumps({"ts": round(time.time(), 3), "stage": stage, "ms": round(seconds * 1000, 3),
+                            "thread": threading.current_thread().name, **fields}, default=str))
+
+class _NoSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def end(self):
+        pass
+
+_NO_SPAN = _NoSpan()
+
+class _Span:
+    __slots__ = ("stage", "fields", "start")
+
+    def __init__(self, stage, fields):
+        self.stage, self.fields, self.start = stage, fields, None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        fields = dict(self.fields, error=exc_type.__name__) if exc_type is not None else self.fields
+        _record(self.stage, time.perf_counter() - self.start, fields)
+        return False
+
+    def end(self):
+        self.__exit__(None, None, None)
+
+def span(stage, **fields):
+    """Context manager timing one stage; fields are added to its log line."""
+    return _Span(stage, fields) if _enabled else _NO_SPAN
+
+def timed(fn=None, *, stage=None):
+    """Decorator: span() around every call, named "<module>.<function>" by default."""
+    def decorate(fn):
+        if not _enabled:
+            return fn
+        name = stage or f"{fn.__module__.rsplit('.', 1)[-1]}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with _Span(name, {}):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate(fn) if fn is not None else decorate
+
+def begin_rerun(stage="rerun"):
+    """Start collecting this thread's spans as one rerun; returns the running span (call .end())."""
+    if not _enabled:
+        return _NO_SPAN
+    _local.rerun = []
+    return _Span(stage, {}).__enter__()
+
+def rerun_spans() -> list:
+    """(stage, seconds) of the spans finished so far in this thread's rerun, in order."""
+    return list(getattr(_local, "rerun", None) or [])
+
+def _percentile(ordered, q):
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+def stats() -> list:
+    """Rolling statistics per stage (milliseconds), slowest mean first."""
+    with _lock:
+        snapshot = {stage: (list(d), _calls[stage]) for stage, d in _samples.items()}
+    rows = []
+    for stage, (durations, calls) in snapshot.items():
+        ordered = sorted(durations)
+        rows.append({
+            "Stage": stage, "Calls": calls, "Last (ms)": durations[-1] * 1000,
+            "Mean (ms)": sum(durations) / len(durations) * 1000,
+            "P50 (ms)": _percentile(ordered, 50) * 1000, "P95 (ms)": _percentile(ordered, 95) * 1000,
+            "Max (ms)": ordered[-1] * 1000,
+        })
+    return sorted(rows, key=lambda r: -r["Mean (ms)"])
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _calls.clear()
+
+def _configure_logging():
+    path = os.environ.get("CIF_TIMING_LOG")
+    handler = logging.FileHandler(path, encoding="utf-8") if path else logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    logger.addHandler(handler)
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+
+if _enabled:
+    _configure_logging()
@@ -0,0 +1,157 @@
+# ------------------------------------------------------------------
+# Saved comparison workbooks – layout shared by the UI and batch jobs
+# ------------------------------------------------------------------
+import os
+import re
+
+from cif_calc.files import atomic_path
+from cif_calc.timing import timed
+
+# Container types the calculator offers; a comparison uses any subset of them.
+# Adding a type here is all it takes: inputs, Info columns and results follow.
+CONTAINER_TYPES = ["20'STD", "40'STD", "40'HC", "45'HC"]
+DEFAULT_CONTAINER_TYPES = ["20'STD", "40'STD"]
+NOM_SHEET = "Nomination Support Details"
+SPECIAL_SHEETS = ["Info", "Comparison", "Nomination", NOM_SHEET]
+
+# Info-sheet fields in input_dict order (after POL / POD)
+INPUT_FIELDS = [
+    "Loadability", "Box Rate (USD)", "Number of BLs", "Market Rate (USD)",
+    "Transhipment CBM", "Transhipment Number of BLs", "Transhipment Profitability Per CBM",
+]
+INFO_FIELDS = ["POL", "POD", "Loadability", "Box Rate (USD)", "Number of BLs", "Market Rate (USD)",
+               "Transhipment CBM", "Transhipment Number of BLs", "Transhipment Profitability Per CBM"]
+# Last Info row: when the exchange rates the comparison used were in force, as a
+# rate-history key (cif_calc.rates.rate_time); absent in older comparisons
+RATE_DATE_FIELD = "Rate Date"
+
+def to_safe_sheet(name: str) -> str:
+    # Trim to 31 chars, remove forbidden chars
+    name = re.sub(r"[\[\]\*:/\\?]", "", name)[:31]
+    return name or "Sheet"
+
+def container_info(pol, pod, input_dict, rate_date=None):
+    """The "Info" sheet: one column of inputs per container type of input_dict.
+
+    rate_date (when the exchange rates used were in force: a timestamp, or a
+    date for the end of that day) is recorded as its rate-history key.
+    """
+    import pandas as pd
+    info = {"Field": INFO_FIELDS}
+    for ctype, inputs in input_dict.items():
+        info[ctype] = [pol, pod] + list(inputs)
+    if rate_date is not None:
+        from cif_calc.rates import rate_time
+        day = rate_time(rate_date)
+        info["Field"] = INFO_FIELDS + [RATE_DATE_FIELD]
+        for ctype in input_dict:
+            info[ctype] = info[ctype] + [day]
+    return pd.DataFrame(info)
+
+def rate_date_from_info(info_df):
+    """The rate-history key an "Info" sheet was calculated with (an ISO timestamp or date), or None."""
+    import pandas as pd
+    info = info_df.set_index("Field")
+    if RATE_DATE_FIELD not in info.index or info.columns.empty:
+        return None
+    value = info.at[RATE_DATE_FIELD, info.columns[0]]
+    if isinstance(value, str):
+        return value.strip() or None
+    return None if pd.isna(value) else pd.Timestamp(value).isoformat()
+
+def input_dict_from_info(info_df):
+    """Rebuild (pol, pod, input_dict) from an "Info" sheet (one column per container type)."""
+    info = info_df.set_index("Field")
+    types = list(info.columns)
+    if not types:
+        raise ValueError("'Info' sheet has no container type columns")
+    pol = info.at["POL", types[0]] if "POL" in info.index else ""
+    pod = info.at["POD", types[0]] if "POD" in info.index else ""
+    input_dict = {ctype: [float(info.at[field, ctype]) for field in INPUT_FIELDS]
+                  for ctype in types}
+    return pol, pod, input_dict
+
+def comparison_inputs(sheets) -> dict:
+    """Rebuild what agent_compare works on from a saved comparison's sheets.
+
+    Returns pol, pod, input_dict, rate_date (None if not recorded), in_df
+    (all agent sheets) and nom_df.
+    """
+    import pandas as pd
+    if "Info" not in sheets:
+        raise ValueError("no 'Info' sheet")
+    pol, pod, input_dict = input_dict_from_info(sheets["Info"])
+
+    agent_dfs = [df.assign(**{"Agent Name": df["Agent Name"].ffill().bfill()})
+                 for name, df in sheets.items()
+                 if name not in SPECIAL_SHEETS and "Description" in df.columns and not df.empty]
+    in_df = pd.concat(agent_dfs, ignore_index=True) if agent_dfs else pd.DataFrame()
+    nom_df = sheets.get(NOM_SHEET, pd.DataFrame(columns=["Agent Name"]))
+    return {"pol": pol, "pod": pod, "input_dict": input_dict, "rate_date": rate_date_from_info(sheets["Info"]),
+            "in_df": in_df, "nom_df": nom_df}
+
+@timed
+def read_comparison_workbook(path) -> dict:
+    """comparison_inputs() of a saved .xlsx workbook."""
+    import pandas as pd
+    return comparison_inputs(pd.read_excel(path, sheet_name=None))
+
+def comparison_sheets(info_df, in_df, nom_df, comp_df, nomination_df) -> dict:
+    """The standard comparison layout as {sheet name: frame}, in sheet order."""
+    sheets = {"Info": info_df}
+    for agent, grp in in_df.groupby("Agent Name", sort=False):
+        sheets[to_safe_sheet(agent)] = grp
+    sheets[NOM_SHEET] = nom_df
+    sheets["Comparison"] = comp_df
+    sheets["Nomination"] = nomination_df
+    return sheets
+
+@timed
+def write_workbook(sheets, target):
+    """Write {sheet name: frame} to an .xlsx path or file-like target.
+
+    Rows are streamed with xlsxwriter's constant_memory mode (each row is
+    flushed once the next one starts), instead of DataFrame.to_excel, which
+    writes column by column and keeps every cell of the workbook in memory.
+    The layout matches to_excel(index=False): bold header row, blank NaN cells.
+    A path is written beside the target and renamed over it, so a failed
+    write never leaves a truncated workbook.
+    """
+    if isinstance(target, (str, os.PathLike)):
+        with atomic_path(target) as tmp:
+            _stream_workbook(sheets, tmp)
+    else:
+        _stream_workbook(sheets, target)
+
+def _stream_workbook(sheets, target):
+    import pandas as pd
+    import xlsxwriter
+
+    with xlsxwriter.Workbook(target, {"constant_memory": True, "nan_inf_to_errors": True}) as wb:
+        header_fmt = wb.add_format({"bold": True, "border": 1, "align": "center", "valign": "top"})
+        date_fmt = wb.add_format({"num_format": "yyyy-mm-dd hh:mm:ss"})
+        for sheet, df in sheets.items():
+            ws = wb.add_worksheet(sheet)
+            ws.write_row(0, 0, [str(c) for c in df.columns], header_fmt)
+            date_cols = [i for i, dtype in enumerate(df.dtypes) if pd.api.types.is_datetime64_any_dtype(dtype)]
+            # Python scalars with None for missing values
+            values = df.astype(object).where(df.notna(), None).to_numpy()
+            for r, row in enumerate(values, start=1):
+                ws.write_row(r, 0, row)
+                for c in date_cols:
+                    if row[c] is not None:
+                        ws.write_datetime(r, c, row[c].to_pydatetime(), date_fmt)
+
+def sheets_digest(sheets) -> str:
+    """Content hash of {sheet name: frame}, for memoising generated workbooks."""
+    import hashlib
+    import pandas as pd
+
+    h = hashlib.sha1()
+    for sheet, df in sheets.items():
+        h.update(repr((sheet, list(df.columns), df.shape)).encode())
+        h.update(pd.util.hash_pandas_object(df, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+AGENT_SHEET_HEADERS = ["Agent Name", "Description", "Currency", "Per CBM", "Per Ton", "Minimum",
+                       "Maximum", "Per BL", "Vat(%)", "Per Container"]
@@ -3,12 +3,16 @@
 # ----------------------------------------------------------------------
 import streamlit as st
 import pandas as pd
-import numpy as np
 import os
 import re
+import threading
 from io import BytesIO
-import zipfile
-import openpyxl
+
+import cif_calc
+from cif_calc import timing
+from cif_calc.paths import SAVED_DIR, EXCHANGE_PATH, LOCATIONS_PATH, RATE_HISTORY_PATH
+from cif_calc.workbook import (CONTAINER_TYPES, DEFAULT_CONTAINER_TYPES, INPUT_FIELDS, input_dict_from_info,
+                               rate_date_from_info)
 
 # ----------------------------------------------------------------------
 # 0.  Page setup (MUST be first Streamlit call)
@@ -18,171 +22,190 @@ st.set_page_config(
     page_icon="📦",
     layout="wide",
 )
+# Per-stage timings of this rerun for the timing panel (no-op unless CIF_TIMING=1)
+rerun_span = timing.begin_rerun()
 
 # Ensure data directories exist ------------------------------------------------
-DATA_DIR = "Data"
-SAVED_DIR = os.path.join(DATA_DIR, "Saved")
-EXCHANGE_PATH = os.path.join(DATA_DIR, "Exchange Rates.xlsx")
 os.makedirs(SAVED_DIR, exist_ok=True)
 
 # ---------------------------------------------------------------------------------------
-# 1.  Helper – Load & cache exchange‑rate table
+# 1.  Helper – Load & cache exchange‑rate table
 # ---------------------------------------------------------------------------------------
-@st.cache_data(show_spinner=False)
-def load_exchange_rates() -> pd.DataFrame:
+# Caches are keyed on the rates version, so a save in any session is picked up
+# by every session on its next rerun without flushing unrelated caches.
+@st.cache_data(show_spinner=False, max_entries=4)
+def load_exchange_rates(version: int) -> pd.DataFrame:
     """Returns the exchange‑rate DataFrame directly from Excel."""
-    return pd.read_excel(EXCHANGE_PATH)
+    return cif_calc.load_exchange_rates(EXCHANGE_PATH)
+
+save_exchange_rates = cif_calc.save_exchange_rates
+
+rates_version = cif_calc.rates_version(EXCHANGE_PATH)
+exchange_df = load_exchange_rates(rates_version)
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def get_currency_list(version: int):
+    return cif_calc.currency_list(load_exchange_rates(version))
+
+currency_options = get_currency_list(rates_version)
+
+# Dated rates: every save is recorded in the rate history, so a comparison can
+# be calculated (and later re-calculated) with the rates in force at a chosen time
+@st.cache_data(show_spinner=False, max_entries=4)
+def load_rate_history(version: int, history_version: int):
+    return cif_calc.load_rate_history(RATE_HISTORY_PATH, EXCHANGE_PATH)
 
-def save_exchange_rates(df: pd.DataFrame):
-    df.to_excel(EXCHANGE_PATH, index=False)
+@st.cache_data(show_spinner=False, max_entries=32)
+def exchange_rates_as_of(when: str, version: int, history_version: int) -> pd.DataFrame:
+    return load_rate_history(version, history_version).as_of(when)
 
-exchange_df = load_exchange_rates()
+def rates_as_of(when) -> pd.DataFrame:
+    """Rates in force at when: a date (its end, or now for today) or a saved Rate Date key."""
+    key = when.isoformat() if hasattr(when, "isoformat") else str(when)
+    return exchange_rates_as_of(key, rates_version, cif_calc.rate_history_version(RATE_HISTORY_PATH))
+
+# ---------------------------------------------------------------------------------------
+# 2.  Helper – Load & cache POD locations (keyed on the file's version)
+# ---------------------------------------------------------------------------------------
+def pod_locations_version() -> int:
+    return cif_calc.pod_locations_version(LOCATIONS_PATH)
 
 @st.cache_data(show_spinner=False)
-def get_currency_list(df: pd.DataFrame):
-    return sorted(df["Currency"].dropna().unique().tolist())
+def load_pod_locations(version: int) -> pd.DataFrame:
+    return cif_calc.load_pod_locations(LOCATIONS_PATH)
 
-currency_options = get_currency_list(exchange_df)
+@st.cache_data(show_spinner=False)
+def get_pod_list(version: int):
+    return cif_calc.pod_list(load_pod_locations(version))
+
+# ---------------------------------------------------------------------------------------
+# 3.  Helper – Saved comparisons, loaded one sheet at a time
+# ---------------------------------------------------------------------------------------
+# Keyed on the comparison's version, which every save bumps, so an edited
+# comparison is re-read while untouched sheets stay cached.
+@st.cache_data(show_spinner=False, max_entries=64)
+def saved_sheet_names(name: str, version: int):
+    return cif_calc.sheet_names(name)
+
+@st.cache_data(show_spinner=False, max_entries=512)
+def load_saved_sheet(name: str, version: int, sheet: str) -> pd.DataFrame:
+    return cif_calc.load_sheet(name, sheet)
+
+# "Download All" archive: built on the first click after any save / delete and
+# shared by every session until the store changes again.
+@st.cache_resource(show_spinner=False, max_entries=1)
+def all_comparisons_archive(signature: str):
+    return cif_calc.export_archive(), threading.Lock()
+
+def all_comparisons_zip() -> bytes:
+    spool, lock = all_comparisons_archive(cif_calc.archive_signature())
+    with lock:  # the spooled file's position is shared between sessions
+        spool.seek(0)
+        return spool.read()
+
+# Editors of shared files remember the file version their pending edits start
+# from, so a save can be refused if someone else saved in between.
+def editor_base(key, version):
+    """Version a data editor's pending edits are based on (the current one until the first edit)."""
+    edits = st.session_state.get(key) or {}
+    if not any(edits.get(k) for k in ("edited_rows", "added_rows", "deleted_rows")):
+        st.session_state[f"{key}_base"] = version
+    return st.session_state[f"{key}_base"]
+
+def reset_editor(key):
+    """Drop a data editor's pending edits and base version."""
+    st.session_state.pop(key, None)
+    st.session_state.pop(f"{key}_base", None)
+
+PREVIEW_PAGE_ROWS = 100
+
+def paged_dataframe(df, key):
+    """Read-only preview that only sends one page of rows to the browser."""
+    pages = max(1, -(-len(df) // PREVIEW_PAGE_ROWS))
+    page = 1
+    if pages > 1:
+        page = st.number_input(f"Page (of {pages})", min_value=1, max_value=pages, value=1, key=key)
+    start = (page - 1) * PREVIEW_PAGE_ROWS
+    st.dataframe(df.iloc[start:start + PREVIEW_PAGE_ROWS], use_container_width=True)
+    if pages > 1:
+        st.caption(f"Rows {start + 1}–{min(start + PREVIEW_PAGE_ROWS, len(df))} of {len(df)}")
 
 # ------------------------------------------------------------------
-# 6.  Comparison engine
+# 6.  Comparison engine (cif_calc/engine.py)
 # ------------------------------------------------------------------
-def nom(con_cbm,con_bl,freight_cost,market_rate,nomination_rate,nomination_cbm,nomination_bl,rebate_cbm,rebate_bl,rebate_per_container,tran_cbm_f,tran_pro_per_cbm_f):
-    free_hand_volume = float(con_cbm) - float(nomination_cbm)
-    free_hand_bl = int(con_bl-nomination_bl)
-
-    pro_free_hand = (free_hand_volume*market_rate)+(free_hand_volume*rebate_cbm)-(free_hand_volume*freight_cost)+(free_hand_bl*rebate_bl)
-    pro_nomination = (nomination_rate-freight_cost)*nomination_cbm
-
-    pro_sum = pro_free_hand+pro_nomination+rebate_per_container+(tran_cbm_f*tran_pro_per_cbm_f)
-
-    return free_hand_volume,free_hand_bl,pro_free_hand,pro_nomination,pro_sum
-
-def agent_compare(df,nom_df,input_dict,exchange_df):
-    money_cols = ['Per CBM', 'Per Ton', 'Minimum', 'Maximum', 'Per BL']
-
-    loadability_20_f = input_dict["20'STD"][0]
-    box_rate_20_f = input_dict["20'STD"][1]
-    num_bl_20_f = input_dict["20'STD"][2]
-    market_rate_20_f = input_dict["20'STD"][3]
-    tran_cbm_20_f = input_dict["20'STD"][4]
-    tran_num_bl_20_f = input_dict["20'STD"][5]
-    tran_pro_per_cbm_20_f = input_dict["20'STD"][6]
-    con_cbm_20 = float(loadability_20_f)-float(tran_cbm_20_f)
-    freight_cost_20 = float(box_rate_20_f)/float(loadability_20_f)
-    con_bl_20 = float(num_bl_20_f)-float(tran_num_bl_20_f)
-
-    loadability_40_f = input_dict["40'STD"][0]
-    box_rate_40_f = input_dict["40'STD"][1]
-    num_bl_40_f = input_dict["40'STD"][2]
-    market_rate_40_f = input_dict["40'STD"][3]
-    tran_cbm_40_f = input_dict["40'STD"][4]
-    tran_num_bl_40_f = input_dict["40'STD"][5]
-    tran_pro_per_cbm_40_f = input_dict["20'STD"][6]
-    con_cbm_40 = float(loadability_40_f)-float(tran_cbm_40_f)
-    freight_cost_40 = float(box_rate_40_f)/float(loadability_40_f)
-    con_bl_40 = float(num_bl_40_f)-float(tran_num_bl_40_f)
-
-    # Clean numeric columns
-    df[money_cols] = (df[money_cols]
-                    .replace(r'^\s*$', np.nan, regex=True)
-                    .apply(pd.to_numeric, errors='coerce')
-                    .fillna(0))
-
-    # Currency → USD map
-    rate_map = dict(zip(exchange_df['Currency'],
-                        exchange_df['Exchange Rate to USD'].astype(float)))
-    rate_map.setdefault('USD', 1.0)
-
-    # Output rows
-    rows_out = []
-    nomination_out = []
-    for agent, grp in df.groupby('Agent Name', sort=False):
-        rebate_df  = grp[grp['Description'] == 'Rebate']
-        remarks_df = grp[grp['Description'] == 'Remarks']
-        charge_df  = grp[~grp['Description'].isin(['Rebate', 'Remarks'])]
-
-        remark = remarks_df['Currency'].iloc[0] if not remarks_df.empty else ""
-        nomination_rate = nom_df[nom_df['Agent Name'] == agent]["Nomination Rate"].values[0]
-        nomination_cbm = nom_df[nom_df['Agent Name'] == agent]["Nomination CBM"].values[0]
-        nomination_bl = nom_df[nom_df['Agent Name'] == agent]["Nomination BL"].values[0]
-
-        # Rebates
-        if rebate_df.empty:
-            rebate_cbm = rebate_per_ton = rebate_bl = rebate_per_container = 0.0
-        else:
-            r_cur = rebate_df.iloc[0]['Currency']
-            r_rate = rate_map.get(r_cur, np.nan)
-            rebate_cbm     = rebate_df.iloc[0]['Per CBM'] * r_rate if not np.isnan(r_rate) else 0
-            rebate_bl      = rebate_df.iloc[0]['Per BL']  * r_rate if not np.isnan(r_rate) else 0
-            rebate_per_ton = rebate_df.iloc[0]['Per Ton'] * r_rate if not np.isnan(r_rate) else 0
-            rebate_per_container = float(rebate_df.iloc[0]["Per Container"]) * r_rate if not np.isnan(r_rate) else 0
-
-        free_hand_volume_20,free_hand_bl_20,pro_free_hand_20,pro_nomination_20,pro_sum_20 = nom(con_cbm_20,con_bl_20,freight_cost_20,market_rate_20_f,
-                                                                                                nomination_rate,nomination_cbm,nomination_bl,rebate_cbm,rebate_bl,
-                                                                                                rebate_per_container,tran_cbm_20_f,tran_pro_per_cbm_20_f)
-        free_hand_volume_40,free_hand_bl_40,pro_free_hand_40,pro_nomination_40,pro_sum_40 = nom(con_cbm_40,con_bl_40,freight_cost_40,market_rate_40_f,
-                                                                                                nomination_rate,nomination_cbm,nomination_bl,rebate_cbm,rebate_bl,
-                                                                                                rebate_per_container,tran_cbm_40_f,tran_pro_per_cbm_40_f)
-        
-        now_row1 = {"Agent Name":agent,"Container Type":"20'STD","Box Rate":box_rate_20_f,"Total Loadability":loadability_20_f,
-                    "Freight Cost":freight_cost_20,"Total Number of BLs":num_bl_20_f,"Market Rate":market_rate_20_f,
-                    "Nomination Rate":nomination_rate,"Transhipment CBM":tran_cbm_20_f,"Transhipment Number of BLs":tran_num_bl_20_f,
-                    "Transhipment Profitability Per CBM":tran_pro_per_cbm_20_f,"Rebate Per CBM":rebate_cbm,"Rebate Per BL":rebate_bl,
-                    "Rebate Per Container":rebate_per_container,"Nomination CBM":nomination_cbm,
-                    "Nomination BL":nomination_bl,"Considered CBM":con_cbm_20,"Considered BLs":con_bl_20,
-                    "Free Hand CBM":free_hand_volume_20,"Free Hand BL":free_hand_bl_20,"Profitability on Free Hand":pro_free_hand_20,
-                    "Profitability on Nomination":pro_nomination_20,"Sum of Profitability":pro_sum_20}
-        
-        now_row2 = {"Agent Name":agent,"Container Type":"40'STD","Box Rate":box_rate_40_f,"Total Loadability":loadability_40_f,
-                    "Freight Cost":freight_cost_40,"Total Number of BLs":num_bl_40_f,"Market Rate":market_rate_40_f,
-                    "Nomination Rate":nomination_rate,"Transhipment CBM":tran_cbm_40_f,"Transhipment Number of BLs":tran_num_bl_40_f,
-                    "Transhipment Profitability Per CBM":tran_pro_per_cbm_20_f,"Rebate Per CBM":rebate_cbm,"Rebate Per BL":rebate_bl,
-                    "Rebate Per Container":rebate_per_container,"Nomination CBM":nomination_cbm,
-                    "Nomination BL":nomination_bl,"Considered CBM":con_cbm_40,"Considered BLs":con_bl_40,
-                    "Free Hand CBM":free_hand_volume_40,"Free Hand BL":free_hand_bl_40,"Profitability on Free Hand":pro_free_hand_40,
-                    "Profitability on Nomination":pro_nomination_40,"Sum of Profitability":pro_sum_40}
-        
-        nomination_out.extend([now_row1, now_row2])
-
-        # Total charges
-        totals = charge_df.apply(
-            lambda row: row[money_cols] * rate_map.get(row['Currency'], np.nan),
-            axis=1
-        ).sum()
-        tot_cbm, tot_bl, tot_ton = totals['Per CBM'], totals['Per BL'], totals['Per Ton']
-
-        row1 = {"Agent Name": agent, "Remarks": remark, "Type": "Destination Charges"}
-        row2 = {"Agent Name": agent, "Remarks": remark, "Type": "Fixed Charges (BL)"}
-        row3 = {"Agent Name": agent, "Remarks": remark, "Type": "Rebate (CBM or Ton)"}
-        row4 = {"Agent Name": agent, "Remarks": remark, "Type": "Rebate (BL)"}
-        row5 = {"Agent Name": agent, "Remarks": remark, "Type": "Net Charges"}
-
-        for n in range(1, 31):
-            tpc = tot_cbm * n
-            tpt = tot_ton * (n / 2)  # as per your logic: ton weight = CBM / 2
-
-            if tpc > tpt:
-                con = tpc
-                rcon = rebate_cbm * n
-            else:
-                con = tpt
-                rcon = rebate_per_ton * (n / 2)
+from cif_calc import (
+    DEFAULT_MAX_CBM, DEFAULT_CBM_STEP, agent_coefficients, charge_caps,
+    cbm_slabs, cheapest_bands, expand_ladder, nomination_compare, pairwise_crossovers,
+    container_info, comparison_sheets, sheets_digest, write_workbook,
+    agent_grid, form_frames, form_keys, grid_frames,
+)
+from cif_calc.tariffs import REBATE_COLS
 
-            dest_chg = tot_bl + con
-            net = dest_chg - rcon - rebate_bl
+def selected_slabs():
+    """CBM slabs chosen in the calculator's slab settings."""
+    return cbm_slabs(st.session_state.get("slab_max", DEFAULT_MAX_CBM),
+                     st.session_state.get("slab_step", DEFAULT_CBM_STEP))
 
-            row1[f"CBM {n}"] = round(con, 2)
-            row2[f"CBM {n}"] = round(tot_bl, 2)
-            row3[f"CBM {n}"] = round(rcon, 2)
-            row4[f"CBM {n}"] = round(rebate_bl, 2)
-            row5[f"CBM {n}"] = round(net, 2)
+# ------------------------------------------------------------------
+# 7.  Container-level input form, one per container type
+# ------------------------------------------------------------------
+# (Info field, label, widget key prefix)
+CONTAINER_FIELDS = [
+    ("Box Rate (USD)", "**Box Rate (USD)**", "box_rate"),
+    ("Loadability", "**Loadability (numeric)**", "load"),
+    ("Number of BLs", "**Number of BLs (numeric)**", "num_bl"),
+    ("Market Rate (USD)", "**Market Rate (USD)**", "mkt_rate"),
+]
+TRANSHIPMENT_FIELDS = [
+    ("Transhipment CBM", "**CBM (numeric)**", "tran_cbm"),
+    ("Transhipment Number of BLs", "**# of BLs (numeric)**", "tran_num_bl"),
+    ("Transhipment Profitability Per CBM", "**Profitability Per CBM**", "tran_pro_per_cbm"),
+]
+
+def container_key(ctype) -> str:
+    """Widget key part of a container type: 20'STD -> 20, 40'HC -> 40hc."""
+    return re.sub(r"[^0-9a-z]", "", ctype.lower().replace("std", ""))
+
+def container_form(ctype, values=None, key_suffix=""):
+    """Expander with one container type's inputs; returns {Info field: text}."""
+    values = values or {}
+    key = container_key(ctype)
+    title = ctype.replace("'", "' ")   # 20'STD -> 20' STD
+    raw = {}
+    with st.expander(f"***📦 {title} Information***", expanded=True):
+        cols = st.columns(5)
+        for col, (field, label, prefix) in zip(cols, CONTAINER_FIELDS):
+            raw[field] = col.text_input(label, values.get(field, "0"), key=f"{prefix}_{key}{key_suffix}")
 
-        rows_out.extend([row1, row2, row3, row4, row5])
+        # Freight cost display (in new column next to box rate & loadability)
+        try:
+            box = float(raw["Box Rate (USD)"])
+            load = float(raw["Loadability"])
+            if load > 0:
+                cols[4].metric("📉 Freight Cost Per CBM", f"${box / load:.2f}")
+            else:
+                cols[4].write("Enter loadability > 0")
+        except ValueError:
+            cols[4].write("Waiting for valid numbers")
+
+        st.markdown("**Transhipment**")
+        for col, (field, label, prefix) in zip(st.columns(5), TRANSHIPMENT_FIELDS):
+            raw[field] = col.text_input(label, values.get(field, "0"), key=f"{prefix}_{key}{key_suffix}")
+    return raw
 
-    comp_df = pd.DataFrame(rows_out)
-    nomination_df = pd.DataFrame(nomination_out)
-    return comp_df,nomination_df
+def parse_container_inputs(container_raw) -> dict:
+    """input_dict from container_form() values; ValueError if one is not numeric."""
+    if not container_raw:
+        raise ValueError("Select at least one container type.")
+    return {ctype: [float(raw[field]) for field in INPUT_FIELDS] for ctype, raw in container_raw.items()}
+
+# ------------------------------------------------------------------
+# 8.  Bulk tariff import (cif_calc/tariffs.py)
+# ------------------------------------------------------------------
+# Keyed on the file's bytes, so reruns with the same upload skip re-validation.
+@st.cache_data(show_spinner=False, max_entries=8)
+def import_tariff_file(data: bytes, name: str, version: int):
+    return cif_calc.import_tariffs(BytesIO(data), get_currency_list(version), name=name)
 
 # ==============================================================================
 # MAIN NAVIGATION TABS
@@ -198,11 +221,10 @@ main_tabs = st.tabs([
 # ==============================================================================
 # TAB 1: COMPARISON CALCULATOR
 # ==============================================================================
-with main_tabs[0]:
+with main_tabs[0], timing.span("render.calculator"):
     st.title("LCL Destination Charges Comparison Calculator")
 
-    locations_df = pd.read_excel(r"Data/locations.xlsx", sheet_name="POD locations")
-    pod_list = sorted(locations_df['POD'].dropna().unique())
+    pod_list = get_pod_list(pod_locations_version())
     # Create two columns for POL and POD dropdowns
     col1, col2 = st.columns(2)
 
@@ -214,56 +236,39 @@ with main_tabs[0]:
     # ------------------------------------------------------------------
     # 2.  Container‑level inputs
     # ------------------------------------------------------------------
-    with st.expander("***📦 20' STD Information***", expanded=True):
-        c1, c2, c3, c4, c5 = st.columns(5)
-        box_rate_20    = c1.text_input("**Box Rate (USD)**", "0", key="box_rate_20")
-        loadability_20 = c2.text_input("**Loadability (numeric)**", "0", key="load_20")
-        num_bl_20      = c3.text_input("**Number of BLs (numeric)**", "0", key="num_bl_20")
-        market_rate_20 = c4.text_input("**Market Rate (USD)**", "0", key="mkt_rate_20")
-        
-        # Freight cost display (in new column next to box rate & loadability)
-        try:
-            box_20 = float(box_rate_20)
-            load_20 = float(loadability_20)
-            if load_20 > 0:
-                freight_cost_20 = box_20 / load_20
-                c5.metric("📉 Freight Cost Per CBM", f"${freight_cost_20:.2f}")
-            else:
-                c5.write("Enter loadability > 0")
-        except ValueError:
-            c5.write("Waiting for valid numbers")
+    container_types = st.multiselect("**Container Types**", CONTAINER_TYPES, default=DEFAULT_CONTAINER_TYPES,
+                                     key="container_types")
+    container_raw = {ctype: container_form(ctype) for ctype in container_types}
 
-        # Transhipment
-        st.markdown("**Transhipment**")
-        t1, t2, t3, t4, t5 = st.columns(5)
-        tran_cbm_20    = t1.text_input("**CBM (numeric)**", "0", key="tran_cbm_20")
-        tran_num_bl_20 = t2.text_input("**# of BLs (numeric)**", "0", key="tran_num_bl_20")
-        tran_pro_per_cbm_20 = t3.text_input("**Profitability Per CBM**", "0", key="tran_pro_per_cbm_20")
-
-
-    with st.expander("***📦 40' STD Information***", expanded=True):
-        c1, c2, c3, c4, c5 = st.columns(5)
-        box_rate_40       = c1.text_input("**Box Rate (USD)**", "0", key="box_rate_40")
-        loadability_40    = c2.text_input("**Loadability (numeric)**", "0", key="load_40")
-        num_bl_40         = c3.text_input("**Number of BLs (numeric)**", "0", key="num_bl_40")
-        market_rate_40    = c4.text_input("**Market Rate (USD)**", "0", key="mkt_rate_40")
-        # Freight cost display (in new column next to box rate & loadability)
-        try:
-            box_40 = float(box_rate_40)
-            load_40 = float(loadability_40)
-            if load_40 > 0:
-                freight_cost_40 = box_40 / load_40
-                c5.metric("📉 Freight Cost Per CBM", f"${freight_cost_40:.2f}")
+    # ------------------------------------------------------------------
+    # 2‑B.  Bulk import – a whole tariff file instead of the agent forms
+    # ------------------------------------------------------------------
+    with st.expander("***📥 Import Agent Tariffs***", expanded="imported_tariffs" in st.session_state):
+        st.caption("An .xlsx with one sheet per agent, or a .csv with an Agent Name column, in the saved "
+                   "agent-sheet layout. Nomination support comes from a 'Nomination Support Details' "
+                   "sheet or Nomination Rate / CBM / BL columns.")
+        upload = st.file_uploader("Tariff file", type=["xlsx", "csv"], key="tariff_upload")
+        if upload is not None:
+            try:
+                in_imp, nom_imp, problems = import_tariff_file(upload.getvalue(), upload.name, rates_version)
+            except ValueError as e:
+                st.error(f"Could not read {upload.name}: {e}")
             else:
-                c5.write("Enter loadability > 0")
-        except ValueError:
-            c5.write("Waiting for valid numbers")
+                if not problems.empty:
+                    st.error(f"{len(problems)} problem(s) in {upload.name}; fix them and upload the file again.")
+                    paged_dataframe(problems, key="tariff_problems_page")
+                elif st.button(f"✅ Use {in_imp['Agent Name'].nunique()} agents from {upload.name}"):
+                    st.session_state["imported_tariffs"] = (in_imp, nom_imp, upload.name)
+                    st.rerun()
 
-        st.markdown("**Transhipment**")
-        t1,t2,t3,t4,t5 = st.columns(5)
-        tran_cbm_40    = t1.text_input("**CBM (numeric)**", "0", key="tran_cbm_40")
-        tran_num_bl_40 = t2.text_input("**# of BLs (numeric)**", "0", key="tran_num_bl_40")
-        tran_pro_per_cbm_40 = t3.text_input("**Profitability Per CBM**", "0", key="tran_pro_per_cbm_40")
+        imported = st.session_state.get("imported_tariffs")
+        if imported is not None:
+            st.success(f"Calculating with {imported[0]['Agent Name'].nunique()} imported agents "
+                       f"from {imported[2]}; the agent forms are hidden.")
+            paged_dataframe(imported[0], key="imported_tariffs_page")
+            if st.button("✏️ Back to manual entry"):
+                del st.session_state["imported_tariffs"]
+                st.rerun()
 
     # ------------------------------------------------------------------
     # 3.  Session‑state setup for dynamic agents
@@ -272,7 +277,26 @@ with main_tabs[0]:
         st.session_state.agent_ids  = [1]
         st.session_state.agent_names = {1: "Agent 1"}
 
-    if st.button("➕ Add Agent"):
+    # Forms: a tab of widgets per agent. Grid: two tables for all agents, read
+    # back as dataframes, so the page does not grow by 8 widgets per charge head.
+    def enter_agent_grid():
+        if st.session_state.agent_entry_mode != "Grid":
+            return
+        # Reseed from the forms unless they are unchanged since the grid was last seeded
+        seed = agent_grid(*extract_agent_data())
+        last, previous = st.session_state.get("agent_grid_last"), st.session_state.get("agent_grid_seed")
+        unchanged = previous is not None and all(a.equals(b) for a, b in zip(seed, previous))
+        st.session_state["agent_grid_seed"] = seed
+        st.session_state["agent_grid_base"] = last if last is not None and unchanged else seed
+
+    entry_mode = "Import" if imported is not None else st.radio(
+        "**Agent entry**", ["Forms", "Grid"], horizontal=True, key="agent_entry_mode",
+        on_change=enter_agent_grid,
+        help="Grid lists every agent's charge heads in one table, which stays quick with many agents. "
+             "It is filled from the forms each time you switch to it, keeping earlier grid edits only "
+             "while the forms are unchanged. Grid edits are not copied back to the forms.")
+
+    if entry_mode == "Forms" and st.button("➕ Add Agent"):
         new_id = max(st.session_state.agent_ids) + 1
         st.session_state.agent_ids.append(new_id)
         st.session_state.agent_names[new_id] = f"Agent {new_id}"
@@ -284,68 +308,16 @@ with main_tabs[0]:
     # ------------------------------------------------------------------
     # 4.  Data‑collector helpers
     # ------------------------------------------------------------------
-    def extract_agent_data() -> pd.DataFrame:
-        rows = []
-        nom_rows = []
-
-        for agent_id in st.session_state.agent_ids:
-            agent_name = st.session_state.get(f"agent_name_{agent_id}", f"Agent {agent_id}")
-            nomination_rate = st.session_state.get(f"nom_support_rate_{agent_id}", 0)
-            nomination_cbm = st.session_state.get(f"nom_support_cbm_{agent_id}", 0)
-            nomination_bl = st.session_state.get(f"nom_support_bl_{agent_id}", 0)
-
-            nom_rows.append({
-                "Agent Name": agent_name,
-                "Nomination Rate": nomination_rate,
-                "Nomination CBM": nomination_cbm,
-                "Nomination BL": nomination_bl
-            })
-
-            # 🔁 Extract dynamic number of charge head rows
-            num_rows = st.session_state.get(f"{agent_id}_num_charge_rows", 8)
-            for i in range(1, num_rows + 1):
-                desc = st.session_state.get(f"{agent_id}_desc_{i}", "")
-                if desc.strip() == "":
-                    continue  # skip empty rows
-
-                rows.append({
-                    "Agent Name": agent_name,
-                    "Description": desc,
-                    "Currency":    st.session_state.get(f"{agent_id}_currency_{i}", ""),
-                    "Per CBM":     st.session_state.get(f"{agent_id}_cbm_{i}", ""),
-                    "Per Ton":     st.session_state.get(f"{agent_id}_ton_{i}", ""),
-                    "Minimum":     st.session_state.get(f"{agent_id}_min_{i}", ""),
-                    "Maximum":     st.session_state.get(f"{agent_id}_max_{i}", ""),
-                    "Per BL":      st.session_state.get(f"{agent_id}_bl_{i}", ""),
-                    "Vat(%)" :     st.session_state.get(f"{agent_id}_vat_{i}",""),
-                    "Per Container": ""
-                })
-
-            # 📝 Notes row (Charge Head 9 Notes)
-            rows.append({
-                "Agent Name": agent_name,
-                "Description": "Remarks",
-                "Currency":    st.session_state.get(f"{agent_id}_desc_9_notes", ""),
-                "Per CBM": "", "Per Ton": "", "Minimum": "", "Maximum": "", "Per BL": "", "Vat(%)" : "", "Per Container": ""
-            })
-
-            # 🎯 Rebate row
-            rows.append({
-                "Agent Name": agent_name,
-                "Description": "Rebate",
-                "Currency": st.session_state.get(f"{agent_id}_rebate_currency", ""),
-                "Per CBM":   st.session_state.get(f"{agent_id}_rebate_cbm", ""),
-                "Per Ton":   st.session_state.get(f"{agent_id}_rebate_ton", ""),
-                "Minimum": "", "Maximum": "",
-                "Per BL":    st.session_state.get(f"{agent_id}_rebate_bl", ""), "Vat(%)" : "",
-                "Per Container": st.session_state.get(f"{agent_id}_rebate_container", "")
-            })
+    def extract_agent_data():
+        return form_frames(st.session_state, st.session_state.agent_ids)
 
-        df = pd.DataFrame(rows)
-        agent_df = df[df["Description"].fillna("").str.strip() != ""]  # remove blank desc rows
-        nomination_df = pd.DataFrame(nom_rows)
-
-        return agent_df, nomination_df
+    def agent_data():
+        """(in_df, nom_df) to calculate with, from the imported tariffs, the grid or the forms."""
+        if entry_mode == "Import":
+            return imported[0].copy(), imported[1]
+        if entry_mode == "Grid":
+            return grid_frames(*grid_tables)
+        return extract_agent_data()
 
 
     # ------------------------------------------------------------------
@@ -435,11 +407,57 @@ with main_tabs[0]:
         r4.text_input("", key=f"{agent_id}_rebate_bl", label_visibility="collapsed")
         r5.text_input("", key=f"{agent_id}_rebate_container", label_visibility="collapsed")
 
-    # render each agent tab
-    tabs = st.tabs([f"Agent {aid}" for aid in st.session_state.agent_ids])
-    for tab, aid in zip(tabs, st.session_state.agent_ids):
-        with tab:
-            agent_form(aid)
+    # render each agent tab (imported tariffs skip the per-field widgets)
+    def agent_grid_editor():
+        """Terms and charge-head tables for every agent; returns the edited (charges, terms)."""
+        charges, terms = st.session_state["agent_grid_base"]
+        usd = "USD" if "USD" in currency_options else None
+
+        def amount(label, **kw):
+            return st.column_config.NumberColumn(label, step=kw.pop("step", 0.01), format=kw.pop("format", "%.2f"), **kw)
+
+        def currency(label):
+            return st.column_config.SelectboxColumn(label, options=currency_options, default=usd, required=True)
+
+        st.markdown("***Agents – Nomination Support, Rebates & Notes***")
+        terms = st.data_editor(
+            terms, key="agent_grid_terms", num_rows="dynamic", use_container_width=True, hide_index=True,
+            column_config={
+                "Agent Name": st.column_config.TextColumn("Agent Name", required=True),
+                "Nomination Rate": amount("Nomination Rate(USD)", min_value=0.0, step=0.1),
+                "Nomination CBM": amount("Nomination CBM", min_value=0.0, step=0.1),
+                "Nomination BL": amount("Nomination BL", min_value=0, step=1, format="%d"),
+                "Rebate Currency": currency("Rebate Currency"),
+                **{col: amount(col) for col in REBATE_COLS},
+                "Remarks": st.column_config.TextColumn("Charge Head Notes"),
+            })
+        agents = [a for a in terms["Agent Name"].dropna().astype(str).str.strip().unique() if a]
+
+        st.markdown("***Destination Charges (CIF)***")
+        charges = st.data_editor(
+            charges, key="agent_grid_charges", num_rows="dynamic", use_container_width=True, hide_index=True,
+            column_config={
+                "Agent Name": st.column_config.SelectboxColumn("Agent Name", options=agents, required=True),
+                "Description": st.column_config.TextColumn("Charge Head", required=True),
+                "Currency": currency("Currency"),
+                **{col: amount(col) for col in ["Per CBM", "Per Ton", "Minimum", "Maximum", "Per BL", "Vat(%)"]},
+            })
+        st.session_state["agent_grid_last"] = (charges, terms)
+        return charges, terms
+
+    with timing.span("render.agents", mode=entry_mode):
+        if entry_mode != "Forms":
+            # Streamlit drops the values of widgets a run does not draw; keep the
+            # forms' so switching back (and reseeding the grid) finds them intact
+            for key in form_keys(st.session_state, st.session_state.agent_ids):
+                st.session_state[key] = st.session_state[key]
+        if entry_mode == "Grid":
+            grid_tables = agent_grid_editor()
+        elif entry_mode == "Forms":
+            tabs = st.tabs([f"Agent {aid}" for aid in st.session_state.agent_ids])
+            for tab, aid in zip(tabs, st.session_state.agent_ids):
+                with tab:
+                    agent_form(aid)
 
     st.markdown("""
     <div style="color: red; font-weight: bold;">
@@ -447,94 +465,147 @@ with main_tabs[0]:
     </div>
     """, unsafe_allow_html=True)
 
+    with st.expander("***📐 CBM Slabs***"):
+        s1, s2, _ = st.columns(3)
+        slab_max = s1.number_input("**Up to CBM**", min_value=1.0, value=float(DEFAULT_MAX_CBM), step=1.0,
+                                   key="slab_max")
+        # The step can never exceed the largest slab, so there is always at least one slab
+        s2.number_input("**Step (CBM)**", min_value=0.1, max_value=float(slab_max), value=DEFAULT_CBM_STEP,
+                        step=0.5, key="slab_step")
+
+    rate_date = st.date_input("💱 **Exchange rates as of**", value=pd.Timestamp.today().date(),
+                              max_value=pd.Timestamp.today().date(), key="rates_as_of",
+                              help="Charges are converted to USD with the rates in force on this day; "
+                                   "the date is saved with the comparison.")
+    calc_rates = rates_as_of(rate_date)
+
+    @timing.timed(stage="calculate")
+    def run_calculation(pol, pod, in_df, nom_df, input_dict, exchange_df, slabs, max_cbm, rate_date):
+        """Everything the results area shows.
+
+        Takes every input as an argument and makes no Streamlit calls, so it can run off the script thread.
+        """
+        coeffs = agent_coefficients(in_df, exchange_df)
+        caps = charge_caps(in_df, exchange_df)
+        return {
+            "container_info": container_info(pol, pod, input_dict, rate_date),
+            "last_input_df": in_df,
+            "last_nom_df": nom_df,
+            "last_coefficients": coeffs,
+            "last_caps": caps,
+            "last_nomination_df": nomination_compare(coeffs, nom_df, input_dict),
+            "comp_df": expand_ladder(coeffs, slabs, caps),
+            "bands": cheapest_bands(coeffs, max_cbm, caps=caps),
+            "crossovers": pairwise_crossovers(coeffs, max_cbm, caps=caps),
+        }
+
+    @timing.timed(stage="render.results")
+    def show_results(result):
+        # Download / save work on whatever was shown last
+        for key in ("container_info", "last_input_df", "last_nom_df", "last_coefficients",
+                    "last_caps", "last_nomination_df"):
+            st.session_state[key] = result[key]
+
+        st.dataframe(result["comp_df"])
+        st.dataframe(result["last_nom_df"])
+        st.dataframe(result["last_nomination_df"])
+
+        st.markdown("**📈 Cheapest agent by CBM band**")
+        st.dataframe(result["bands"])
+        with st.expander("Breakeven volumes between agents"):
+            st.dataframe(result["crossovers"])
+
     st.markdown("### 🛠️ Actions")
     calc_btn, dl_placeholder, save_placeholder = st.columns([1, 1, 1])
+    live_mode = st.toggle("⚡ Live results", key="live_mode",
+                          help="Recalculate in the background whenever an input changes.")
 
     # 7‑A Calculate
-    if calc_btn.button("🧮 Calculate"):
+    if not live_mode and "live_calculator" in st.session_state:
+        # Live mode switched off: stop its worker, and start afresh if it is switched on again
+        st.session_state.pop("live_calculator").shutdown()
+        for key in ("live_generation", "live_result"):
+            st.session_state.pop(key, None)
+
+    if live_mode:
+        if "live_calculator" not in st.session_state:
+            st.session_state["live_calculator"] = cif_calc.LiveCalculator()
+        live_calc = st.session_state["live_calculator"]
         try:
-            box_rate_20_f = float(box_rate_20)
-            loadability_20_f = float(loadability_20)
-            num_bl_20_f = float(num_bl_20)
-            market_rate_20_f = float(market_rate_20)
-            tran_cbm_20_f = float(tran_cbm_20)
-            tran_num_bl_20_f = float(tran_num_bl_20)
-            tran_pro_per_cbm_20_f = float(tran_pro_per_cbm_20)
-
-            box_rate_40_f = float(box_rate_40)
-            loadability_40_f = float(loadability_40)
-            num_bl_40_f = float(num_bl_40)
-            market_rate_40_f = float(market_rate_40)
-            tran_cbm_40_f = float(tran_cbm_40)
-            tran_num_bl_40_f = float(tran_num_bl_40)
-            tran_pro_per_cbm_40_f = float(tran_pro_per_cbm_40)
-
+            input_dict = parse_container_inputs(container_raw)
         except ValueError:
-            st.error("Loadability, Box Rate, and Origin Charges must be numeric.")
-            st.stop()
-
-        input_dict = {
-                "20'STD": [
-                    loadability_20_f, box_rate_20_f, num_bl_20_f, market_rate_20_f,
-                    tran_cbm_20_f, tran_num_bl_20_f, tran_pro_per_cbm_20_f
-                ],
-                "40'STD": [
-                    loadability_40_f, box_rate_40_f, num_bl_40_f, market_rate_40_f,
-                    tran_cbm_40_f, tran_num_bl_40_f, tran_pro_per_cbm_40_f
-                ]
-        }
-        in_df, nom_df  = extract_agent_data()
-        comp_df,nomination_df = agent_compare(in_df,nom_df,input_dict,exchange_df)
-
-        st.session_state["container_info"] = pd.DataFrame({
-                "Field": [
-                    "POL","POD","Loadability", "Box Rate (USD)", "Number of BLs", "Market Rate (USD)",
-                    "Transhipment CBM", "Transhipment Number of BLs", "Transhipment Profitability Per CBM"
-                ],
-                "20'STD": [
-                    pol,pod,loadability_20_f, box_rate_20_f, num_bl_20_f, market_rate_20_f,
-                    tran_cbm_20_f, tran_num_bl_20_f, tran_pro_per_cbm_20_f
-                ],
-                "40'STD": [
-                    pol,pod,loadability_40_f, box_rate_40_f, num_bl_40_f, market_rate_40_f,
-                    tran_cbm_40_f, tran_num_bl_40_f, tran_pro_per_cbm_40_f
-                ]
-            })
+            input_dict = None  # keep showing the last result until the inputs are numeric again
+        if input_dict is not None:
+            in_df, nom_df = agent_data()
+            slabs = selected_slabs()
+            key = (sheets_digest({"in": in_df, "nom": nom_df}), repr(input_dict), pol, pod,
+                   tuple(slabs), rates_version, str(rate_date))
+            live_calc.submit(key, run_calculation, pol, pod, in_df, nom_df, input_dict, calc_rates, slabs,
+                             st.session_state.get("slab_max", DEFAULT_MAX_CBM), rate_date)
+
+        # Polls the worker; only this small fragment reruns, so typing is never
+        # blocked. A new result triggers one full rerun, which renders it and
+        # refreshes the download / save actions below.
+        @st.fragment(run_every=0.5)
+        def live_status():
+            done = live_calc.latest()
+            if live_calc.pending():
+                st.caption("⏳ Updating…")
+            if done is not None and done.error is not None:
+                st.caption(f"Latest inputs could not be calculated: {done.error}")
+            elif done is not None and st.session_state.get("live_generation") != done.generation:
+                st.session_state["live_generation"] = done.generation
+                st.session_state["live_result"] = done.value
+                st.rerun()
 
-        st.session_state["last_input_df"]  = in_df
-        st.session_state["last_nom_df"] = nom_df
-        st.session_state["last_result_df"] = comp_df
-        st.session_state["last_nomination_df"] = nomination_df
+        live_status()
+        if "live_result" in st.session_state:
+            show_results(st.session_state["live_result"])
 
+    elif calc_btn.button("🧮 Calculate"):
+        try:
+            input_dict = parse_container_inputs(container_raw)
+        except ValueError:
+            st.error("Loadability, Box Rate, and Origin Charges must be numeric." if container_raw
+                     else "Select at least one container type.")
+            st.stop()
 
+        in_df, nom_df = agent_data()
+        result = run_calculation(pol, pod, in_df, nom_df, input_dict, calc_rates, selected_slabs(),
+                                 st.session_state.get("slab_max", DEFAULT_MAX_CBM), rate_date)
         st.success("Calculation complete.")
-        st.dataframe(comp_df)
-        st.dataframe(nom_df)
-        st.dataframe(nomination_df)
+        show_results(result)
 
     # 7‑B Download (only if data exists)
-    def to_safe_sheet(name: str) -> str:
-        # Trim to 31 chars, remove forbidden chars
-        name = re.sub(r"[\[\]\*:/\\?]", "", name)[:31]
-        return name or "Sheet"
+    if all(k in st.session_state for k in ("container_info", "last_input_df", "last_coefficients","last_nomination_df")):
+        last = {k: st.session_state.get(k) for k in (
+            "container_info", "last_input_df", "last_nom_df", "last_coefficients", "last_caps", "last_nomination_df")}
+        slabs = selected_slabs()
+
+        def result_sheets():
+            # Slab columns are expanded from the coefficients only for export / save
+            result_df = expand_ladder(last["last_coefficients"], slabs, last["last_caps"])
+            return comparison_sheets(last["container_info"], last["last_input_df"], last["last_nom_df"],
+                                     result_df, last["last_nomination_df"])
+
+        # One report per session, rebuilt only when the result frames change
+        report_memo = st.session_state.setdefault("report_memo", {})
+
+        def report_xlsx():
+            sheets = result_sheets()
+            digest = sheets_digest(sheets)
+            if report_memo.get("digest") != digest:
+                report_memo.clear()  # release the previous report before writing the next
+                buf = BytesIO()
+                write_workbook(sheets, buf)
+                report_memo.update(digest=digest, data=buf.getvalue())
+            return report_memo["data"]
 
-    if all(k in st.session_state for k in ("container_info", "last_input_df", "last_result_df","last_nomination_df")):
         with dl_placeholder:
-            buf = BytesIO()
-            with pd.ExcelWriter(buf, engine="xlsxwriter") as writer:
-                st.session_state["container_info"].to_excel(writer, sheet_name="Info", index=False)
-
-                for agent, grp in st.session_state["last_input_df"].groupby("Agent Name", sort=False):
-                    grp.to_excel(writer, sheet_name=to_safe_sheet(agent), index=False)
-
-                st.session_state["last_nom_df"].to_excel(writer, sheet_name="Nomination Support Details", index=False)
-                st.session_state["last_result_df"].to_excel(writer, sheet_name="Comparison", index=False)
-                st.session_state["last_nomination_df"].to_excel(writer, sheet_name="Nomination", index = False)
-
-            buf.seek(0)
+            # Generated only when the button is clicked
             st.download_button(
                 "📥 Download Excel",
-                data=buf.getvalue(),
+                data=report_xlsx,
                 file_name="cif_charge_report.xlsx",
                 mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
             )
@@ -557,21 +628,46 @@ with main_tabs[0]:
                         st.error("Filename cannot be empty.")
                     else:
                         safe_name = re.sub(r"[^A-Za-z0-9 _-]", "", filename).replace(" ", "_")
-                        file_path = os.path.join(SAVED_DIR, f"{safe_name}.xlsx")
-                        if os.path.exists(file_path):
-                            st.warning("A file with this name already exists and will be overwritten.")
-                        with pd.ExcelWriter(file_path, engine="xlsxwriter") as writer:
-                            st.session_state["container_info"].to_excel(writer, sheet_name="Info", index=False)
-                            for agent, grp in st.session_state["last_input_df"].groupby("Agent Name", sort=False):
-                                grp.to_excel(writer, sheet_name=to_safe_sheet(agent), index=False)
-                            st.session_state["last_nom_df"].to_excel(writer, sheet_name="Nomination Support Details", index=False)
-                            st.session_state["last_result_df"].to_excel(writer, sheet_name="Comparison", index=False)
-                            st.session_state["last_nomination_df"].to_excel(writer, sheet_name="Nomination", index = False)
-                        st.success(f"Comparison saved as '{safe_name}.xlsx' in the Saved folder.")
+                        if safe_name in cif_calc.list_comparisons():
+                            st.warning("A comparison with this name already exists and will be overwritten.")
+                        cif_calc.save_comparison(safe_name, result_sheets())
+                        st.success(f"Comparison saved as '{safe_name}' in Saved Comparisons.")
                         st.session_state.save_mode = False
                 if cancel_col.button("❌ Cancel"):
                     st.session_state.save_mode = False
                     st.rerun()
+
+        # 7‑D Profitability simulation ----------------------------------------
+        with st.expander("🎲 Profitability Simulation"):
+            st.caption("Draws considered CBM, BLs, market rate and rebate exchange rates around the "
+                       "calculated inputs and reports each agent's profit spread and chance of being the best.")
+            m1, m2, m3, m4 = st.columns(4)
+            sim_draws = m1.number_input("Draws", min_value=1_000, max_value=500_000, value=100_000, step=10_000)
+            sim_seed = m2.number_input("Seed", min_value=0, value=0, step=1)
+            cbm_spread = m3.number_input("CBM spread (±%)", min_value=0.0, max_value=100.0, value=10.0, step=1.0)
+            market_sd = m4.number_input("Market rate std. dev. (USD)", min_value=0.0, value=2.0, step=0.5)
+            fx_vol = st.number_input("Exchange-rate volatility (σ)", min_value=0.0, max_value=1.0, value=0.05, step=0.01)
+
+            if st.button("▶️ Run Simulation"):
+                _, _, sim_inputs = input_dict_from_info(last["container_info"])
+                variables = {}
+                for ctype, inputs in sim_inputs.items():
+                    fields = dict(zip(INPUT_FIELDS, inputs))
+                    cbm = fields["Loadability"] - fields["Transhipment CBM"]
+                    bls = fields["Number of BLs"] - fields["Transhipment Number of BLs"]
+                    spread = cbm_spread / 100
+                    variables[ctype] = {
+                        "Considered CBM": ("uniform", cbm * (1 - spread), cbm * (1 + spread)),
+                        "Considered BLs": ("uniform", bls * (1 - spread), bls * (1 + spread)),
+                        "Market Rate (USD)": ("normal", fields["Market Rate (USD)"], market_sd),
+                    }
+                with st.spinner("Simulating…"):
+                    st.session_state["simulation"] = cif_calc.run_simulation(
+                        last["last_coefficients"], last["last_nom_df"], sim_inputs, variables,
+                        draws=int(sim_draws), seed=int(sim_seed),
+                        rebate_currency=cif_calc.rebate_currencies(last["last_input_df"]), fx_vol=fx_vol)
+            if "simulation" in st.session_state:
+                st.dataframe(st.session_state["simulation"], use_container_width=True, hide_index=True)
     else:
         with dl_placeholder:
             st.caption("Run **Calculate** first to enable download and save options.")
@@ -579,65 +675,91 @@ with main_tabs[0]:
 # ==============================================================================
 # TAB 2: SAVED COMPARISONS
 # ==============================================================================
-import streamlit as st
-import pandas as pd
-import os
-from io import BytesIO
-import zipfile
-import openpyxl
-
-with main_tabs[1]:
+with main_tabs[1], timing.span("render.saved"):
     st.title("📂 Saved Comparisons")
 
-    saved_files = [f for f in os.listdir(SAVED_DIR) if f.lower().endswith(".xlsx")]
+    # Older .xlsx saves -> store, once per store
+    _, import_failures = cif_calc.import_saved_workbooks(SAVED_DIR)
+    if import_failures:
+        st.warning("Some saved workbooks could not be imported: "
+                   + "; ".join(f"{f} ({e})" for f, e in import_failures))
+    saved_names = cif_calc.list_comparisons()
 
-    if not saved_files:
+    if not saved_names:
         st.info("No saved comparisons found. Return to the first tab, perform a calculation, and save it.")
     else:
+        with st.expander("🔎 Search Saved Comparisons"):
+            f1, f2, f3 = st.columns(3)
+            with f1:
+                pod_filter = st.selectbox("POD", ["All"] + cif_calc.indexed_values("pod"), key="search_pod")
+                agent_filter = st.text_input("Agent name contains", key="search_agent")
+            with f2:
+                date_filter = st.date_input("Created between", value=(), key="search_dates")
+                cbm_filter = st.number_input("Best net charges at CBM", min_value=0.0, value=None,
+                                             step=1.0, key="search_cbm")
+            with f3:
+                max_net_filter = st.number_input("Max best net charges (USD)", value=None,
+                                                 key="search_max_net")
+
+            dates = list(date_filter) if isinstance(date_filter, (list, tuple)) else [date_filter]
+            results = cif_calc.search_comparisons(
+                pod=None if pod_filter == "All" else pod_filter,
+                agent=agent_filter.strip() or None,
+                since=dates[0] if dates else None,
+                until=dates[-1] if dates else None,
+                cbm=cbm_filter,
+                max_net=max_net_filter if cbm_filter is not None else None,
+            )
+            st.dataframe(results, use_container_width=True, hide_index=True)
+        matching = [n for n in saved_names if n in set(results["Name"])]
+        if not matching:
+            st.info("No saved comparisons match the search filters.")
+
+    if saved_names and matching:
         col1, col2 = st.columns([3, 1])
         with col1:
-            selected_file = st.selectbox("Select a saved comparison to view:", saved_files)
+            selected_name = st.selectbox("Select a saved comparison to view:", matching)
 
         with col2:
-            zip_buffer = BytesIO()
-            with zipfile.ZipFile(zip_buffer, "w") as zipf:
-                for f in saved_files:
-                    zipf.write(os.path.join(SAVED_DIR, f), arcname=f)
-            zip_buffer.seek(0)
+            # The archive is only built when clicked (and reused until the store changes)
             st.download_button(
                 label="🛆 Download All",
-                data=zip_buffer,
+                data=all_comparisons_zip,
                 file_name="All_Comparisons.zip",
                 mime="application/zip"
             )
 
-        if selected_file:
-            file_path = os.path.join(SAVED_DIR, selected_file)
+        if selected_name:
+            legacy_path = os.path.join(SAVED_DIR, f"{selected_name}.xlsx")
+
+            saved_version = cif_calc.comparison_version(selected_name)
+            # Version this session started editing from; saves are refused once
+            # someone else has saved the comparison since
+            opened_key = f"opened_version_{selected_name}"
+            opened_version = st.session_state.setdefault(opened_key, saved_version)
+            if opened_version != saved_version:
+                st.warning(f"'{selected_name}' was saved by someone else since you opened it. The latest "
+                           "version is shown; reload it before saving changes.")
+                if st.button("🔄 Reload latest version"):
+                    st.session_state.pop(opened_key)
+                    st.rerun()
 
             if st.button("➕ Add New Agent Sheet"):
-                wb = openpyxl.load_workbook(file_path)
-                existing = wb.sheetnames
-                base = "NewAgent"
-                count = 1
-                while f"{base}{count}" in existing:
-                    count += 1
-                new_sheet = f"{base}{count}"
-                headers = ["Agent Name", "Description", "Currency", "Per CBM", "Per Ton", "Minimum", "Maximum", "Per BL", "Vat(%)", "Per Container"]
-                ws = wb.create_sheet(title=new_sheet)
-                for col_num, header in enumerate(headers, 1):
-                    ws.cell(row=1, column=col_num, value=header)
-                wb.save(file_path)
-                wb.close()
-                st.success(f"✅ '{new_sheet}' added.")
-                st.rerun()
+                try:
+                    new_sheet = cif_calc.add_empty_agent(selected_name, expected_version=opened_version)
+                    st.session_state.pop(opened_key)
+                    st.success(f"✅ '{new_sheet}' added.")
+                    st.rerun()
+                except cif_calc.VersionConflict:
+                    st.error(f"'{selected_name}' was changed by someone else; reload it first.")
+
+            sheet_names = saved_sheet_names(selected_name, saved_version)
 
-            with open(file_path, "rb") as raw_file:
-                file_bytes = BytesIO(raw_file.read())
-            xl = pd.ExcelFile(file_bytes)
-            sheet_names = xl.sheet_names
+            def saved_sheet(sheet):
+                return load_saved_sheet(selected_name, saved_version, sheet)
 
             nom_sheet_name = "Nomination Support Details"
-            nom_df = xl.parse(nom_sheet_name) if nom_sheet_name in sheet_names else pd.DataFrame()
+            nom_df = saved_sheet(nom_sheet_name) if nom_sheet_name in sheet_names else pd.DataFrame()
 
             special_sheets = ["Info", "Comparison", "Nomination", nom_sheet_name]
             agent_sheets = [s for s in sheet_names if s not in special_sheets]
@@ -652,13 +774,13 @@ with main_tabs[1]:
 
             view_tabs = st.tabs(tab_order)
             nom_dict = {}
+            info_raw = {}
             agents_data = {}
 
             for sheet, tab in zip(tab_order, view_tabs):
                 with tab:
-                    df = xl.parse(sheet)
-
                     if sheet in agent_sheets:
+                        df = saved_sheet(sheet)
                         st.subheader(f"✏️ Edit Agent Sheet: {sheet}")
 
                         agent_name_val = df["Agent Name"].iloc[0] if "Agent Name" in df.columns and not df.empty else ""
@@ -796,10 +918,16 @@ with main_tabs[1]:
                         remarks_ = st.text_area("📒 Remarks", value=remarks_text or "", key=f"remarks_{sheet}")
 
                         rebate_currency = rebate_row["Currency"].values[0] if not rebate_row.empty else "USD"
-                        rebate_cbm = rebate_row["Per CBM"].values[0] if not rebate_row.empty else 0.0
-                        rebate_ton = rebate_row["Per Ton"].values[0] if not rebate_row.empty else 0.0
-                        rebate_bl = rebate_row["Per BL"].values[0] if not rebate_row.empty else 0.0
-                        rebate_container = rebate_row["Per Container"].values[0] if not rebate_row.empty else 0.0
+                        def rebate_value(col):
+                            # Blank / text cells count as 0, however the sheet was saved
+                            if rebate_row.empty or col not in rebate_row.columns:
+                                return 0.0
+                            return float(pd.to_numeric(rebate_row[col], errors="coerce").fillna(0).values[0])
+
+                        rebate_cbm = rebate_value("Per CBM")
+                        rebate_ton = rebate_value("Per Ton")
+                        rebate_bl = rebate_value("Per BL")
+                        rebate_container = rebate_value("Per Container")
 
                         st.markdown("### 💰 Rebate Details")
                         rc1, rc2, rc3, rc4, rc5 = st.columns(5)
@@ -847,6 +975,7 @@ with main_tabs[1]:
 
 
                     elif sheet == "Info":
+                        df = saved_sheet(sheet)
                         st.subheader("✏️ Edit Info Sheet")
 
                         info_dict = df.set_index("Field").T.to_dict()
@@ -857,91 +986,32 @@ with main_tabs[1]:
                             except:
                                 return "0"
 
-                        with st.expander("***📦 20' STD Information***", expanded=True):
-                            c1, c2, c3, c4, c5 = st.columns(5)
-                            box_rate_20    = c1.text_input("**Box Rate (USD)**", get_val("Box Rate (USD)", "20'STD"), key=f"box_rate_20_{sheet}")
-                            loadability_20 = c2.text_input("**Loadability (numeric)**", get_val("Loadability", "20'STD"), key=f"load_20_{sheet}")
-                            num_bl_20      = c3.text_input("**Number of BLs (numeric)**", get_val("Number of BLs", "20'STD"), key=f"num_bl_20_{sheet}")
-                            market_rate_20 = c4.text_input("**Market Rate (USD)**", get_val("Market Rate (USD)", "20'STD"), key=f"mkt_rate_20_{sheet}")
-
-                            try:
-                                box_20 = float(box_rate_20)
-                                load_20 = float(loadability_20)
-                                if load_20 > 0:
-                                    freight_cost_20 = box_20 / load_20
-                                    c5.metric("📉 Freight Cost Per CBM", f"${freight_cost_20:.2f}")
-                                else:
-                                    c5.write("Enter loadability > 0")
-                            except ValueError:
-                                c5.write("Waiting for valid numbers")
-
-                            st.markdown("**Transhipment**")
-                            t1, t2, t3, _, _ = st.columns(5)
-                            tran_cbm_20        = t1.text_input("**CBM (numeric)**", get_val("Transhipment CBM", "20'STD"), key=f"tran_cbm_20_{sheet}")
-                            tran_num_bl_20     = t2.text_input("**# of BLs (numeric)**", get_val("Transhipment Number of BLs", "20'STD"), key=f"tran_num_bl_20_{sheet}")
-                            tran_pro_per_cbm_20 = t3.text_input("**Profitability Per CBM**", get_val("Transhipment Profitability Per CBM", "20'STD"), key=f"tran_pro_per_cbm_20_{sheet}")
-
-                        with st.expander("***📦 40' STD Information***", expanded=True):
-                            c1, c2, c3, c4, c5 = st.columns(5)
-                            box_rate_40    = c1.text_input("**Box Rate (USD)**", get_val("Box Rate (USD)", "40'STD"), key=f"box_rate_40_{sheet}")
-                            loadability_40 = c2.text_input("**Loadability (numeric)**", get_val("Loadability", "40'STD"), key=f"load_40_{sheet}")
-                            num_bl_40      = c3.text_input("**Number of BLs (numeric)**", get_val("Number of BLs", "40'STD"), key=f"num_bl_40_{sheet}")
-                            market_rate_40 = c4.text_input("**Market Rate (USD)**", get_val("Market Rate (USD)", "40'STD"), key=f"mkt_rate_40_{sheet}")
-
-                            try:
-                                box_40 = float(box_rate_40)
-                                load_40 = float(loadability_40)
-                                if load_40 > 0:
-                                    freight_cost_40 = box_40 / load_40
-                                    c5.metric("📉 Freight Cost Per CBM", f"${freight_cost_40:.2f}")
-                                else:
-                                    c5.write("Enter loadability > 0")
-                            except ValueError:
-                                c5.write("Waiting for valid numbers")
-
-                            st.markdown("**Transhipment**")
-                            t1, t2, t3, _, _ = st.columns(5)
-                            tran_cbm_40        = t1.text_input("**CBM (numeric)**", get_val("Transhipment CBM", "40'STD"), key=f"tran_cbm_40_{sheet}")
-                            tran_num_bl_40     = t2.text_input("**# of BLs (numeric)**", get_val("Transhipment Number of BLs", "40'STD"), key=f"tran_num_bl_40_{sheet}")
-                            tran_pro_per_cbm_40 = t3.text_input("**Profitability Per CBM**", get_val("Transhipment Profitability Per CBM", "40'STD"), key=f"tran_pro_per_cbm_40_{sheet}")
+                        info_raw = {ctype: container_form(ctype, {field: get_val(field, ctype) for field in INPUT_FIELDS},
+                                                          key_suffix=f"_{sheet}")
+                                    for ctype in df.columns if ctype != "Field"}
+
+                        # Keeping the saved rate date re-calculates with exactly the saved rates
+                        saved_rate_date = rate_date_from_info(df)
+                        st.date_input("💱 Exchange rates as of",
+                                      value=pd.Timestamp(saved_rate_date or pd.Timestamp.today()).date(),
+                                      max_value=pd.Timestamp.today().date(), key=f"rates_as_of_{selected_name}")
+                        if saved_rate_date is None:
+                            st.caption("Saved before rate dates were recorded: re-calculating uses the current "
+                                       "rates unless you pick another day.")
                     else:
                         st.subheader(f"🔍 Preview: {sheet}")
-                        st.dataframe(df, use_container_width=True)
+                        # Result sheets are read-only and wide: only read them when asked
+                        if st.toggle("Show sheet", key=f"show_{selected_name}_{sheet}"):
+                            paged_dataframe(saved_sheet(sheet), key=f"page_{selected_name}_{sheet}")
 
             col_re, col_dl, col_del = st.columns([1, 1, 1])
             if col_re.button("🧮 Re-Calculate"):
                 try:
-                    box_rate_20_f = float(box_rate_20)
-                    loadability_20_f = float(loadability_20)
-                    num_bl_20_f = float(num_bl_20)
-                    market_rate_20_f = float(market_rate_20)
-                    tran_cbm_20_f = float(tran_cbm_20)
-                    tran_num_bl_20_f = float(tran_num_bl_20)
-                    tran_pro_per_cbm_20_f = float(tran_pro_per_cbm_20)
-
-                    box_rate_40_f = float(box_rate_40)
-                    loadability_40_f = float(loadability_40)
-                    num_bl_40_f = float(num_bl_40)
-                    market_rate_40_f = float(market_rate_40)
-                    tran_cbm_40_f = float(tran_cbm_40)
-                    tran_num_bl_40_f = float(tran_num_bl_40)
-                    tran_pro_per_cbm_40_f = float(tran_pro_per_cbm_40)
-
+                    input_dict = parse_container_inputs(info_raw)
                 except ValueError:
                     st.error("Loadability, Box Rate, and Origin Charges must be numeric.")
                     st.stop()
 
-                input_dict = {
-                        "20'STD": [
-                            loadability_20_f, box_rate_20_f, num_bl_20_f, market_rate_20_f,
-                            tran_cbm_20_f, tran_num_bl_20_f, tran_pro_per_cbm_20_f
-                        ],
-                        "40'STD": [
-                            loadability_40_f, box_rate_40_f, num_bl_40_f, market_rate_40_f,
-                            tran_cbm_40_f, tran_num_bl_40_f, tran_pro_per_cbm_40_f
-                        ]
-                }
-
                 # Convert nom_dict to DataFrame
                 nom_df = pd.DataFrame(nom_dict.values())
 
@@ -957,28 +1027,31 @@ with main_tabs[1]:
                 else:
                     in_df = pd.DataFrame()  # Empty fallback
 
-                # Run the comparison
-                comp_df, nomination_df = agent_compare(in_df, nom_df, input_dict, exchange_df)
+                # The comparison's own POL / POD and rate date, not the calculator tab's
+                saved_info = saved_sheet("Info") if "Info" in sheet_names else None
+                saved_pol, saved_pod, _ = (input_dict_from_info(saved_info) if saved_info is not None
+                                           else ("", "", None))
+                saved_key = rate_date_from_info(saved_info) if saved_info is not None else None
+                picked_day = st.session_state.get(f"rates_as_of_{selected_name}")
+                if saved_key and (picked_day is None or picked_day == pd.Timestamp(saved_key).date()):
+                    rate_key = saved_key   # the exact rates it was calculated with
+                else:
+                    rate_key = cif_calc.rate_time(picked_day)
+
+                # Run the comparison with the rates of its rate date
+                saved_rates = rates_as_of(rate_key)
+                coeffs = agent_coefficients(in_df, saved_rates)
+                caps = charge_caps(in_df, saved_rates)
+                nomination_df = nomination_compare(coeffs, nom_df, input_dict)
+                comp_df = expand_ladder(coeffs, selected_slabs(), caps)
 
                 # Save to session
-                st.session_state["container_info"] = pd.DataFrame({
-                    "Field": [
-                        "POL", "POD", "Loadability", "Box Rate (USD)", "Number of BLs", "Market Rate (USD)",
-                        "Transhipment CBM", "Transhipment Number of BLs", "Transhipment Profitability Per CBM"
-                    ],
-                    "20'STD": [
-                        pol, pod, loadability_20_f, box_rate_20_f, num_bl_20_f, market_rate_20_f,
-                        tran_cbm_20_f, tran_num_bl_20_f, tran_pro_per_cbm_20_f
-                    ],
-                    "40'STD": [
-                        pol, pod, loadability_40_f, box_rate_40_f, num_bl_40_f, market_rate_40_f,
-                        tran_cbm_40_f, tran_num_bl_40_f, tran_pro_per_cbm_40_f
-                    ]
-                })
+                st.session_state["container_info"] = container_info(saved_pol, saved_pod, input_dict, rate_key)
 
                 st.session_state["last_input_df"] = in_df
                 st.session_state["last_nom_df"] = nom_df
-                st.session_state["last_result_df"] = comp_df
+                st.session_state["last_coefficients"] = coeffs
+                st.session_state["last_caps"] = caps
                 st.session_state["last_nomination_df"] = nomination_df
 
                 st.success("✅ Recalculation complete.")
@@ -986,35 +1059,26 @@ with main_tabs[1]:
                 st.dataframe(nom_df)
                 st.dataframe(nomination_df)
 
-                # Overwrite the selected Excel file with all updated sheets
-                with pd.ExcelWriter(file_path, engine="xlsxwriter") as writer:
-                    # Save container info
-                    st.session_state["container_info"].to_excel(writer, sheet_name="Info", index=False)
-
-                    # Save each agent sheet separately
-                    for agent_name, df in agents_data.items():
-                        safe_name = re.sub(r"[\[\]\*:/\\?]", "", agent_name)[:31] or "Sheet"
-                        df.to_excel(writer, sheet_name=safe_name, index=False)
-
-                    # Save updated Nomination Support Details
-                    nom_df.to_excel(writer, sheet_name="Nomination Support Details", index=False)
-
-                    # Save calculated results
-                    st.session_state["last_result_df"].to_excel(writer, sheet_name="Comparison", index=False)
-                    st.session_state["last_nomination_df"].to_excel(writer, sheet_name="Nomination", index=False)
-
-                st.success(f"💾 Changes saved to '{selected_file}' successfully.")
+                # Overwrite the saved comparison with all updated sheets, unless someone
+                # else saved it since it was opened here
+                try:
+                    st.session_state[opened_key] = cif_calc.save_comparison(selected_name, comparison_sheets(
+                        st.session_state["container_info"], in_df, nom_df, comp_df, nomination_df),
+                        expected_version=opened_version)
+                    st.success(f"💾 Changes saved to '{selected_name}' successfully.")
+                except cif_calc.VersionConflict:
+                    st.error(f"'{selected_name}' was changed by someone else while you were editing it. "
+                             "Your changes were not saved; reload the latest version and try again.")
 
 
 
             with col_dl:
-                with open(file_path, "rb") as fp:
-                    st.download_button(
-                        label="📅 Download this comparison",
-                        data=fp.read(),
-                        file_name=selected_file,
-                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
-                    )
+                st.download_button(
+                    label="📅 Download this comparison",
+                    data=lambda: cif_calc.export_workbook(selected_name),
+                    file_name=f"{selected_name}.xlsx",
+                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+                )
             with col_del:
                 if "delete_mode" not in st.session_state:
                     st.session_state.delete_mode = False
@@ -1027,7 +1091,9 @@ with main_tabs[1]:
                     c1, c2 = st.columns(2)
                     if c1.button("✅ Yes, delete"):
                         try:
-                            os.remove(file_path)
+                            cif_calc.delete_comparison(selected_name)
+                            if os.path.exists(legacy_path):
+                                os.remove(legacy_path)
                             st.success("Deleted successfully.")
                             st.session_state.delete_mode = False
                             st.rerun()
@@ -1039,9 +1105,15 @@ with main_tabs[1]:
 
 
 
-with main_tabs[2]:
+with main_tabs[2], timing.span("render.exchange_rates"):
     st.title("💱 Edit Exchange Rates")
     st.caption("You can update or add new exchange rates. Click save to apply changes.")
+    if st.session_state.pop("rates_saved", False):
+        st.success("Exchange rates saved successfully.")
+    if st.session_state.pop("rates_conflict", False):
+        st.error("Someone else saved the exchange rates while you were editing; their rates are shown "
+                 "below and your changes were not saved.")
+    rates_base = editor_base("exchange_editor", rates_version)
 
     edited_df = st.data_editor(
         exchange_df,
@@ -1054,21 +1126,33 @@ with main_tabs[2]:
         if "Currency" in edited_df.columns and "Exchange Rate to USD" in edited_df.columns:
             try:
                 edited_df["Exchange Rate to USD"] = pd.to_numeric(edited_df["Exchange Rate to USD"])
-                save_exchange_rates(edited_df)
-                st.success("Exchange rates saved successfully. Please refresh to see changes.")
-                st.cache_data.clear()
+                save_exchange_rates(edited_df, EXCHANGE_PATH, expected_version=rates_base)
+                st.session_state["rates_saved"] = True
+            except cif_calc.VersionConflict:
+                st.session_state["rates_conflict"] = True
             except Exception as e:
                 st.error(f"Error saving exchange rates: {e}")
+            if "rates_saved" in st.session_state or "rates_conflict" in st.session_state:
+                # New version -> fresh cache entries; reset the editor's pending edits
+                reset_editor("exchange_editor")
+                st.rerun()
         else:
             st.error("Please ensure 'Currency' and 'Exchange Rate to USD' columns exist.")
 
-with main_tabs[3]:
+with main_tabs[3], timing.span("render.pods"):
     st.title("🚢 Edit Port Of Discharge")
     st.caption("You can update or add new PODs. Click save to apply changes.")
 
+    if st.session_state.pop("pods_saved", False):
+        st.success("POD list saved successfully.")
+    if st.session_state.pop("pods_conflict", False):
+        st.error("Someone else saved the POD list while you were editing; their list is shown "
+                 "below and your changes were not saved.")
+
     # Load POD Excel Sheet
-    pod_path = "Data/locations.xlsx"
-    pod_df = pd.read_excel(pod_path, sheet_name="POD locations")
+    pods_version = pod_locations_version()
+    pod_df = load_pod_locations(pods_version)
+    pods_base = editor_base("pod_editor", pods_version)
 
     # Data Editor
     edited_pod_df = st.data_editor(
@@ -1081,9 +1165,28 @@ with main_tabs[3]:
     # Save Button
     if st.button("💾 Save PODs"):
         try:
-            # Overwrite same sheet in the Excel file
-            with pd.ExcelWriter(pod_path, engine="openpyxl", mode="a", if_sheet_exists="replace") as writer:
-                edited_pod_df.to_excel(writer, sheet_name="POD locations", index=False)
-            st.success("POD list saved successfully. Please refresh to see changes.")
+            # Replace the POD sheet of the Excel file
+            cif_calc.save_pod_locations(edited_pod_df, LOCATIONS_PATH, expected_version=pods_base)
+            st.session_state["pods_saved"] = True
+        except cif_calc.VersionConflict:
+            st.session_state["pods_conflict"] = True
         except Exception as e:
             st.error(f"Error saving PODs: {e}")
+        if "pods_saved" in st.session_state or "pods_conflict" in st.session_state:
+            reset_editor("pod_editor")
+            st.rerun()
+
+# ==============================================================================
+# TIMING PANEL (only with CIF_TIMING=1)
+# ==============================================================================
+if timing.enabled():
+    rerun_span.end()
+    with st.sidebar.expander("***⏱️ Timing***", expanded=True):
+        st.markdown("**This rerun**")
+        st.dataframe(pd.DataFrame([(stage, seconds * 1000) for stage, seconds in timing.rerun_spans()],
+                                  columns=["Stage", "ms"]), hide_index=True, use_container_width=True)
+        st.markdown(f"**Rolling (last {timing.ROLLING_WINDOW} calls per stage)**")
+        st.dataframe(pd.DataFrame(timing.stats()), hide_index=True, use_container_width=True)
+        if st.button("Reset timings"):
+            timing.reset()
+            st.rerun()
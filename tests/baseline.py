@@ -0,0 +1,147 @@
+# ------------------------------------------------------------------
+# Reference engine – the calculator's original per-agent loop
+#
+# Copied verbatim from main.py as it was before the engine moved into
+# cif_calc (20'STD / 40'STD only, slabs CBM 1..30, no Minimum / Maximum
+# caps). The vectorized engine must reproduce its numbers; only used by
+# the tests.
+# ------------------------------------------------------------------
+import numpy as np
+import pandas as pd
+
+def nom(con_cbm,con_bl,freight_cost,market_rate,nomination_rate,nomination_cbm,nomination_bl,rebate_cbm,rebate_bl,rebate_per_container,tran_cbm_f,tran_pro_per_cbm_f):
+    free_hand_volume = float(con_cbm) - float(nomination_cbm)
+    free_hand_bl = int(con_bl-nomination_bl)
+
+    pro_free_hand = (free_hand_volume*market_rate)+(free_hand_volume*rebate_cbm)-(free_hand_volume*freight_cost)+(free_hand_bl*rebate_bl)
+    pro_nomination = (nomination_rate-freight_cost)*nomination_cbm
+
+    pro_sum = pro_free_hand+pro_nomination+rebate_per_container+(tran_cbm_f*tran_pro_per_cbm_f)
+
+    return free_hand_volume,free_hand_bl,pro_free_hand,pro_nomination,pro_sum
+
+def agent_compare(df,nom_df,input_dict,exchange_df):
+    money_cols = ['Per CBM', 'Per Ton', 'Minimum', 'Maximum', 'Per BL']
+
+    loadability_20_f = input_dict["20'STD"][0]
+    box_rate_20_f = input_dict["20'STD"][1]
+    num_bl_20_f = input_dict["20'STD"][2]
+    market_rate_20_f = input_dict["20'STD"][3]
+    tran_cbm_20_f = input_dict["20'STD"][4]
+    tran_num_bl_20_f = input_dict["20'STD"][5]
+    tran_pro_per_cbm_20_f = input_dict["20'STD"][6]
+    con_cbm_20 = float(loadability_20_f)-float(tran_cbm_20_f)
+    freight_cost_20 = float(box_rate_20_f)/float(loadability_20_f)
+    con_bl_20 = float(num_bl_20_f)-float(tran_num_bl_20_f)
+
+    loadability_40_f = input_dict["40'STD"][0]
+    box_rate_40_f = input_dict["40'STD"][1]
+    num_bl_40_f = input_dict["40'STD"][2]
+    market_rate_40_f = input_dict["40'STD"][3]
+    tran_cbm_40_f = input_dict["40'STD"][4]
+    tran_num_bl_40_f = input_dict["40'STD"][5]
+    tran_pro_per_cbm_40_f = input_dict["20'STD"][6]
+    con_cbm_40 = float(loadability_40_f)-float(tran_cbm_40_f)
+    freight_cost_40 = float(box_rate_40_f)/float(loadability_40_f)
+    con_bl_40 = float(num_bl_40_f)-float(tran_num_bl_40_f)
+
+    # Clean numeric columns
+    df[money_cols] = (df[money_cols]
+                    .replace(r'^\s*$', np.nan, regex=True)
+                    .apply(pd.to_numeric, errors='coerce')
+                    .fillna(0))
+
+    # Currency → USD map
+    rate_map = dict(zip(exchange_df['Currency'],
+                        exchange_df['Exchange Rate to USD'].astype(float)))
+    rate_map.setdefault('USD', 1.0)
+
+    # Output rows
+    rows_out = []
+    nomination_out = []
+    for agent, grp in df.groupby('Agent Name', sort=False):
+        rebate_df  = grp[grp['Description'] == 'Rebate']
+        remarks_df = grp[grp['Description'] == 'Remarks']
+        charge_df  = grp[~grp['Description'].isin(['Rebate', 'Remarks'])]
+
+        remark = remarks_df['Currency'].iloc[0] if not remarks_df.empty else ""
+        nomination_rate = nom_df[nom_df['Agent Name'] == agent]["Nomination Rate"].values[0]
+        nomination_cbm = nom_df[nom_df['Agent Name'] == agent]["Nomination CBM"].values[0]
+        nomination_bl = nom_df[nom_df['Agent Name'] == agent]["Nomination BL"].values[0]
+
+        # Rebates
+        if rebate_df.empty:
+            rebate_cbm = rebate_per_ton = rebate_bl = rebate_per_container = 0.0
+        else:
+            r_cur = rebate_df.iloc[0]['Currency']
+            r_rate = rate_map.get(r_cur, np.nan)
+            rebate_cbm     = rebate_df.iloc[0]['Per CBM'] * r_rate if not np.isnan(r_rate) else 0
+            rebate_bl      = rebate_df.iloc[0]['Per BL']  * r_rate if not np.isnan(r_rate) else 0
+            rebate_per_ton = rebate_df.iloc[0]['Per Ton'] * r_rate if not np.isnan(r_rate) else 0
+            rebate_per_container = float(rebate_df.iloc[0]["Per Container"]) * r_rate if not np.isnan(r_rate) else 0
+
+        free_hand_volume_20,free_hand_bl_20,pro_free_hand_20,pro_nomination_20,pro_sum_20 = nom(con_cbm_20,con_bl_20,freight_cost_20,market_rate_20_f,
+                                                                                                nomination_rate,nomination_cbm,nomination_bl,rebate_cbm,rebate_bl,
+                                                                                                rebate_per_container,tran_cbm_20_f,tran_pro_per_cbm_20_f)
+        free_hand_volume_40,free_hand_bl_40,pro_free_hand_40,pro_nomination_40,pro_sum_40 = nom(con_cbm_40,con_bl_40,freight_cost_40,market_rate_40_f,
+                                                                                                nomination_rate,nomination_cbm,nomination_bl,rebate_cbm,rebate_bl,
+                                                                                                rebate_per_container,tran_cbm_40_f,tran_pro_per_cbm_40_f)
+        
+        now_row1 = {"Agent Name":agent,"Container Type":"20'STD","Box Rate":box_rate_20_f,"Total Loadability":loadability_20_f,
+                    "Freight Cost":freight_cost_20,"Total Number of BLs":num_bl_20_f,"Market Rate":market_rate_20_f,
+                    "Nomination Rate":nomination_rate,"Transhipment CBM":tran_cbm_20_f,"Transhipment Number of BLs":tran_num_bl_20_f,
+                    "Transhipment Profitability Per CBM":tran_pro_per_cbm_20_f,"Rebate Per CBM":rebate_cbm,"Rebate Per BL":rebate_bl,
+                    "Rebate Per Container":rebate_per_container,"Nomination CBM":nomination_cbm,
+                    "Nomination BL":nomination_bl,"Considered CBM":con_cbm_20,"Considered BLs":con_bl_20,
+                    "Free Hand CBM":free_hand_volume_20,"Free Hand BL":free_hand_bl_20,"Profitability on Free Hand":pro_free_hand_20,
+                    "Profitability on Nomination":pro_nomination_20,"Sum of Profitability":pro_sum_20}
+        
+        now_row2 = {"Agent Name":agent,"Container Type":"40'STD","Box Rate":box_rate_40_f,"Total Loadability":loadability_40_f,
+                    "Freight Cost":freight_cost_40,"Total Number of BLs":num_bl_40_f,"Market Rate":market_rate_40_f,
+                    "Nomination Rate":nomination_rate,"Transhipment CBM":tran_cbm_40_f,"Transhipment Number of BLs":tran_num_bl_40_f,
+                    "Transhipment Profitability Per CBM":tran_pro_per_cbm_20_f,"Rebate Per CBM":rebate_cbm,"Rebate Per BL":rebate_bl,
+                    "Rebate Per Container":rebate_per_container,"Nomination CBM":nomination_cbm,
+                    "Nomination BL":nomination_bl,"Considered CBM":con_cbm_40,"Considered BLs":con_bl_40,
+                    "Free Hand CBM":free_hand_volume_40,"Free Hand BL":free_hand_bl_40,"Profitability on Free Hand":pro_free_hand_40,
+                    "Profitability on Nomination":pro_nomination_40,"Sum of Profitability":pro_sum_40}
+        
+        nomination_out.extend([now_row1, now_row2])
+
+        # Total charges
+        totals = charge_df.apply(
+            lambda row: row[money_cols] * rate_map.get(row['Currency'], np.nan),
+            axis=1
+        ).sum()
+        tot_cbm, tot_bl, tot_ton = totals['Per CBM'], totals['Per BL'], totals['Per Ton']
+
+        row1 = {"Agent Name": agent, "Remarks": remark, "Type": "Destination Charges"}
+        row2 = {"Agent Name": agent, "Remarks": remark, "Type": "Fixed Charges (BL)"}
+        row3 = {"Agent Name": agent, "Remarks": remark, "Type": "Rebate (CBM or Ton)"}
+        row4 = {"Agent Name": agent, "Remarks": remark, "Type": "Rebate (BL)"}
+        row5 = {"Agent Name": agent, "Remarks": remark, "Type": "Net Charges"}
+
+        for n in range(1, 31):
+            tpc = tot_cbm * n
+            tpt = tot_ton * (n / 2)  # as per your logic: ton weight = CBM / 2
+
+            if tpc > tpt:
+                con = tpc
+                rcon = rebate_cbm * n
+            else:
+                con = tpt
+                rcon = rebate_per_ton * (n / 2)
+
+            dest_chg = tot_bl + con
+            net = dest_chg - rcon - rebate_bl
+
+            row1[f"CBM {n}"] = round(con, 2)
+            row2[f"CBM {n}"] = round(tot_bl, 2)
+            row3[f"CBM {n}"] = round(rcon, 2)
+            row4[f"CBM {n}"] = round(rebate_bl, 2)
+            row5[f"CBM {n}"] = round(net, 2)
+
+        rows_out.extend([row1, row2, row3, row4, row5])
+
+    comp_df = pd.DataFrame(rows_out)
+    nomination_df = pd.DataFrame(nomination_out)
+    return comp_df,nomination_df
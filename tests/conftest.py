@@ -0,0 +1,8 @@
+import os
+import sys
+
+# Run from anywhere: the tests import cif_calc and tests/baseline.py directly
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+for path in (ROOT, os.path.dirname(os.path.abspath(__file__))):
+    if path not in sys.path:
+        sys.path.insert(0, path)
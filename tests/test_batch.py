@@ -0,0 +1,116 @@
+"""Batch re-calculation: unchanged inputs give the saved numbers, and nothing newer is overwritten."""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cif_calc import batch, store
+from cif_calc.bench import synthetic_tender
+from cif_calc.engine import agent_compare
+from cif_calc.files import VersionConflict
+from cif_calc.rates import RateHistory, load_rate_history
+from cif_calc.workbook import comparison_sheets, container_info, rate_date_from_info, write_workbook
+
+RATE_DATE = "2026-10-01T09:00:00.000000"
+
+def tender_sheets(seed=0):
+    t = synthetic_tender(4, 3, 2, seed)
+    comp_df, nomination_df = agent_compare(t["in_df"].copy(), t["nom_df"], t["input_dict"], t["exchange_df"])
+    info = container_info("Nhava Sheva", "Jebel Ali", t["input_dict"], RATE_DATE)
+    return comparison_sheets(info, t["in_df"], t["nom_df"], comp_df, nomination_df), t["exchange_df"]
+
+def numbers(sheets, sheet="Comparison"):
+    return sheets[sheet].select_dtypes("number").to_numpy(float)
+
+@pytest.fixture
+def rates(tmp_path):
+    """--exchange-rates / --rate-history: the tender's rates, no history yet."""
+    _, exchange_df = tender_sheets()
+    workbook = str(tmp_path / "Exchange Rates.xlsx")
+    exchange_df.to_excel(workbook, index=False)
+    return ["--exchange-rates", workbook, "--rate-history", str(tmp_path / "history.sqlite")]
+
+def test_unchanged_inputs_give_the_saved_numbers(tmp_path):
+    sheets, exchange_df = tender_sheets()
+    store.save_comparison("Tender", sheets, str(tmp_path / "store.sqlite"))
+    saved = store.load_comparison("Tender", path=str(tmp_path / "store.sqlite"))
+
+    again, agents = batch.recalculate_sheets(saved, exchange_df)
+    assert agents == 4 and list(again) == list(sheets)
+    np.testing.assert_allclose(numbers(again), numbers(saved))
+    np.testing.assert_allclose(numbers(again, "Nomination"), numbers(saved, "Nomination"))
+    assert rate_date_from_info(again["Info"]) == RATE_DATE
+
+    # Other rates at another date are used and recorded
+    dearer = exchange_df.assign(**{"Exchange Rate to USD": exchange_df["Exchange Rate to USD"] * 2})
+    revalued, _ = batch.recalculate_sheets(saved, dearer, rate_date="2026-11-01T00:00:00.000000")
+    assert rate_date_from_info(revalued["Info"]) == "2026-11-01T00:00:00.000000"
+    assert not np.allclose(numbers(revalued), numbers(saved))
+
+def test_rate_tables():
+    history = RateHistory(["EUR", "EUR", "INR"], ["0001-01-01T00:00:00", "2026-06-01T00:00:00", "2026-07-01T00:00:00"],
+                          [1.0, 1.1, 0.012])
+    tables = batch.rate_tables(history, ["2026-06-15", "2026-01-01", "2026-06-15", "2026-08-01"])
+    assert sorted(tables) == ["2026-01-01", "2026-06-15", "2026-08-01"]
+    for day, table in tables.items():
+        pd.testing.assert_frame_equal(table.reset_index(drop=True), history.as_of(day).reset_index(drop=True),
+                                      check_dtype=False, check_index_type=False)
+
+def test_workbook_written_back(tmp_path, rates):
+    sheets, _ = tender_sheets()
+    path = str(tmp_path / "Tender.xlsx")
+    write_workbook({**sheets, "Comparison": sheets["Comparison"].assign(**{"CBM 1": 0.0})}, path)
+    history = load_rate_history(rates[3], rates[1])
+
+    out = str(tmp_path / "out.xlsx")
+    assert batch.recalculate_workbook(path, history, output_path=out) == 4
+    assert (pd.read_excel(path, sheet_name="Comparison")["CBM 1"] == 0).all()   # the source is left alone
+    np.testing.assert_allclose(numbers(pd.read_excel(out, sheet_name=None)), numbers(sheets), rtol=1e-9)
+
+    batch.recalculate_workbook(path, history)
+    np.testing.assert_allclose(numbers(pd.read_excel(path, sheet_name=None)), numbers(sheets), rtol=1e-9)
+
+def test_workbook_changed_meanwhile_is_not_overwritten(tmp_path, rates, monkeypatch):
+    sheets, _ = tender_sheets()
+    path = str(tmp_path / "Tender.xlsx")
+    write_workbook(sheets, path)
+    recalculate = batch.recalculate_sheets
+
+    def edited_meanwhile(*args):
+        write_workbook({**sheets, "Info": sheets["Info"].assign(Note="edited")}, path)
+        return recalculate(*args)
+
+    monkeypatch.setattr(batch, "recalculate_sheets", edited_meanwhile)
+    with pytest.raises(VersionConflict):
+        batch.recalculate_workbook(path, load_rate_history(rates[3], rates[1]))
+    assert "Note" in pd.read_excel(path, sheet_name="Info").columns
+
+def test_command_line_over_the_store(tmp_path, rates, capsys):
+    path = str(tmp_path / "store.sqlite")
+    for seed, name in enumerate(["One", "Two"]):
+        sheets, _ = tender_sheets(seed)
+        store.save_comparison(name, sheets, path)
+
+    out = tmp_path / "out"
+    assert batch.main(["--store", path, "--workers", "1", "--output-dir", str(out)] + rates) == 0
+    assert sorted(os.listdir(out)) == ["One.xlsx", "Two.xlsx"]
+    assert store.comparison_version("One", path) == 1   # --output-dir leaves the store alone
+
+    assert batch.main(["--store", path, "--workers", "1"] + rates) == 0
+    assert store.comparison_version("One", path) == 2
+    # Same rates as when "One" was saved (seed 1 has rates of its own)
+    np.testing.assert_allclose(numbers(store.load_comparison("One", path=path)), numbers(tender_sheets(0)[0]))
+    assert "2/2 comparisons, 8 agents" in capsys.readouterr().out
+
+def test_command_line_over_workbooks(tmp_path, rates, capsys):
+    saved = tmp_path / "Saved"
+    saved.mkdir()
+    write_workbook(tender_sheets()[0], str(saved / "Good.xlsx"))
+    (saved / "Broken.xlsx").write_bytes(b"not a workbook")
+    assert batch.main(["--xlsx", str(saved), "--workers", "1", "--step", "2"] + rates) == 1
+    captured = capsys.readouterr()
+    assert "✔ Good" in captured.out and "✘ Broken" in captured.err
+    # Slabs follow --max-cbm / --step
+    assert "CBM 2" in pd.read_excel(saved / "Good.xlsx", sheet_name="Comparison").columns
+    assert "CBM 1" not in pd.read_excel(saved / "Good.xlsx", sheet_name="Comparison").columns
@@ -0,0 +1,206 @@
+"""Equivalence checks for the vectorized engine.
+
+agent_compare is compared with the original per-agent loop (tests/baseline.py)
+on seeded synthetic tenders; cheapest_bands / pairwise_crossovers with dense
+sampling of the charge ladder; Minimum / Maximum caps with hand-worked tariffs.
+"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import baseline
+from cif_calc.bench import synthetic_tender
+from cif_calc.engine import (LADDER_TYPES, agent_coefficients, agent_compare, charge_caps, charge_ladder,
+                             cheapest_bands, clean_money_cols, expand_ladder, pairwise_crossovers)
+
+SEEDS = range(5)
+# The baseline used 20'STD's transhipment profitability for 40'STD too, so both get the same
+INPUT_DICT = {"20'STD": [25.0, 1800.0, 5.0, -10.0, 3.0, 1.0, 2.0],
+              "40'STD": [50.0, 2400.0, 12.5, -5.0, 4.0, 2.0, 2.0]}
+
+def tender(agents, seed, caps=True):
+    t = synthetic_tender(agents, 6, 3, seed)
+    if not caps:
+        t["in_df"][["Minimum", "Maximum"]] = ""
+    return t
+
+def net_charges(coeffs, volumes, caps=None):
+    """Net charge of every agent (rows) at every volume (columns)."""
+    return charge_ladder(coeffs, np.asarray(volumes, dtype=float), caps)[:, LADDER_TYPES.index("Net Charges"), :]
+
+def coefficients(t):
+    in_df = t["in_df"].copy()
+    caps = charge_caps(in_df, t["exchange_df"])
+    return agent_coefficients(in_df, t["exchange_df"]), caps
+
+# ------------------------------------------------------------------
+# agent_compare vs the original loop
+# ------------------------------------------------------------------
+@pytest.mark.parametrize("agents", [1, 7, 40])
+@pytest.mark.parametrize("seed", SEEDS)
+def test_agent_compare_matches_baseline(agents, seed):
+    t = tender(agents, seed, caps=False)   # the baseline has no Minimum / Maximum
+    # ... and fails on a blank rebate Per Container
+    rebates = t["in_df"]["Description"] == "Rebate"
+    t["in_df"].loc[rebates & (t["in_df"]["Per Container"] == ""), "Per Container"] = "0"
+    old_comp, old_nom = baseline.agent_compare(t["in_df"].copy(), t["nom_df"], INPUT_DICT, t["exchange_df"])
+    new_comp, new_nom = agent_compare(t["in_df"].copy(), t["nom_df"], INPUT_DICT, t["exchange_df"])
+
+    assert list(new_comp.columns) == list(old_comp.columns)
+    slabs = [c for c in old_comp.columns if c.startswith("CBM ")]
+    labels = [c for c in old_comp.columns if c not in slabs]
+    pd.testing.assert_frame_equal(new_comp[labels].astype(str), old_comp[labels].astype(str))
+    # Both round to cents; allow one cent for values rounded on either side of a half cent
+    np.testing.assert_allclose(new_comp[slabs].to_numpy(float), old_comp[slabs].to_numpy(float), atol=0.0100001)
+
+    pd.testing.assert_frame_equal(new_nom[old_nom.columns].reset_index(drop=True), old_nom,
+                                  check_dtype=False, rtol=1e-12, atol=1e-9)
+
+def test_uncapped_ladder_ignores_caps_argument():
+    t = tender(10, 0, caps=False)
+    coeffs, caps = coefficients(t)
+    assert caps.empty
+    slabs = np.arange(1, 31)
+    np.testing.assert_array_equal(charge_ladder(coeffs, slabs, caps), charge_ladder(coeffs, slabs))
+
+# ------------------------------------------------------------------
+# Breakeven solver vs dense sampling
+# ------------------------------------------------------------------
+@pytest.mark.parametrize("with_caps", [False, True])
+@pytest.mark.parametrize("seed", SEEDS)
+def test_cheapest_bands_match_dense_sampling(seed, with_caps):
+    max_cbm = 30.0
+    coeffs, caps = coefficients(tender(12, seed, caps=with_caps))
+    caps = caps if with_caps else None
+    bands = cheapest_bands(coeffs, max_cbm, caps=caps)
+
+    # Contiguous cover of (0, max_cbm]
+    assert bands["From CBM"].iloc[0] == 0.0
+    assert bands["To CBM"].iloc[-1] == pytest.approx(max_cbm)
+    np.testing.assert_allclose(bands["From CBM"].to_numpy()[1:], bands["To CBM"].to_numpy()[:-1])
+
+    volumes = np.linspace(1e-6, max_cbm, 6001)
+    net = net_charges(coeffs, volumes, caps)
+    cheapest = net.min(axis=0)
+    agents = list(coeffs.index)
+    for band in bands.itertuples(index=False):
+        inside = (volumes > band[0] + 1e-6) & (volumes < band[1] - 1e-6)
+        row = net[agents.index(band[2])]
+        # The band's agent is (one of) the cheapest everywhere inside the band
+        np.testing.assert_allclose(row[inside], cheapest[inside], rtol=1e-9, atol=1e-6)
+        ends = net_charges(coeffs, [max(band[0], 1e-9), band[1]], caps)[agents.index(band[2])]
+        np.testing.assert_allclose([band[3], band[4]], ends, rtol=1e-9, atol=1e-6)
+
+@pytest.mark.parametrize("with_caps", [False, True])
+@pytest.mark.parametrize("seed", SEEDS)
+def test_pairwise_crossovers_match_dense_sampling(seed, with_caps):
+    max_cbm = 30.0
+    coeffs, caps = coefficients(tender(6, seed, caps=with_caps))
+    caps = caps if with_caps else None
+    crossovers = pairwise_crossovers(coeffs, max_cbm, caps=caps)
+    agents = list(coeffs.index)
+
+    volumes = np.linspace(1e-6, max_cbm, 6001)
+    net = net_charges(coeffs, volumes, caps)
+    for a, b in ((a, b) for i, a in enumerate(agents) for b in agents[i + 1:]):
+        rows = crossovers[(crossovers["Agent A"] == a) & (crossovers["Agent B"] == b)]
+        diff = net[agents.index(a)] - net[agents.index(b)]
+        sign = np.sign(np.where(np.abs(diff) < 1e-9, 0, diff))
+        changes = volumes[1:][(sign[1:] * sign[:-1]) < 0]
+        found = rows["Crossover CBM"].dropna().to_numpy(dtype=float)
+        # Every sign change of A - B sits at a reported crossover
+        for x in changes:
+            assert np.min(np.abs(found - x)) <= max_cbm / 6000 + 1e-6 if len(found) else False, (a, b, x)
+        # and every reported crossover is a point where A and B cost the same
+        for x in found:
+            at = net_charges(coeffs, [x], caps)[:, 0]
+            assert at[agents.index(a)] == pytest.approx(at[agents.index(b)], rel=1e-9, abs=1e-6)
+
+# ------------------------------------------------------------------
+# Minimum / Maximum caps
+# ------------------------------------------------------------------
+EXCHANGE = pd.DataFrame({"Currency": ["USD", "EUR"], "Exchange Rate to USD": [1.0, 1.2]})
+SLABS = [1, 2, 3, 4, 5, 6]
+
+def charge(agent, desc, currency="USD", cbm="", ton="", minimum="", maximum="", bl="", per_container=""):
+    # Amounts as the forms leave them: text, blank when not entered
+    return {"Agent Name": agent, "Description": desc, "Currency": currency, "Per CBM": cbm, "Per Ton": ton,
+            "Minimum": minimum, "Maximum": maximum, "Per BL": bl, "Vat(%)": "", "Per Container": per_container}
+
+CAP_CASES = {
+    # agent: (tariff rows, expected net charges at SLABS)
+    "Minimum": ([charge("Minimum", "THC", cbm="10", minimum="35")],
+                [35, 35, 35, 40, 50, 60]),
+    "Maximum in EUR": ([charge("Maximum in EUR", "DO", "EUR", cbm="5", maximum="20")],
+                       [6, 12, 18, 24, 24, 24]),
+    "Ton branch": ([charge("Ton branch", "THC", ton="30", minimum="40")],
+                   [40, 40, 45, 60, 75, 90]),
+    "Both": ([charge("Both", "THC", cbm="10", minimum="25", maximum="50")],
+             [25, 25, 30, 40, 50, 50]),
+    "BL only": ([charge("BL only", "Docs", bl="50", minimum="100")],
+                [50, 50, 50, 50, 50, 50]),
+    "Rebate min": ([charge("Rebate min", "THC", cbm="10"),
+                    charge("Rebate min", "Rebate", cbm="2", minimum="100")],
+                   [8, 16, 24, 32, 40, 48]),
+    "Unknown currency": ([charge("Unknown currency", "THC", "XXX", cbm="10", minimum="100"),
+                          charge("Unknown currency", "DO", cbm="1")],
+                         [1, 2, 3, 4, 5, 6]),
+    # Mixed bases: a head is only capped on the basis its agent is charged on
+    "Ton head on CBM branch": ([charge("Ton head on CBM branch", "THC", cbm="10"),
+                                charge("Ton head on CBM branch", "DO", ton="4", minimum="30")],
+                               [10, 20, 30, 40, 50, 60]),
+    "CBM head on Ton branch": ([charge("CBM head on Ton branch", "THC", ton="40"),
+                                charge("CBM head on Ton branch", "DO", cbm="1", minimum="50", maximum="60")],
+                               [20, 40, 60, 80, 100, 120]),
+    "Both bases": ([charge("Both bases", "THC", cbm="2", ton="30", minimum="20")],
+                   [20, 30, 45, 60, 75, 90]),
+    "Zero means none": ([charge("Zero means none", "THC", cbm="10", minimum="0", maximum="0")],
+                        [10, 20, 30, 40, 50, 60]),
+}
+
+def cap_tariffs():
+    return pd.DataFrame([row for rows, _ in CAP_CASES.values() for row in rows])
+
+def test_caps_hand_worked():
+    in_df = cap_tariffs()
+    caps = charge_caps(in_df, EXCHANGE)
+    coeffs = agent_coefficients(in_df, EXCHANGE)
+    net = net_charges(coeffs, SLABS, caps)
+    for agent, (_, expected) in CAP_CASES.items():
+        np.testing.assert_allclose(net[coeffs.index.get_loc(agent)], expected, err_msg=agent)
+
+def test_caps_in_agent_compare():
+    in_df = cap_tariffs()
+    nom_df = pd.DataFrame({"Agent Name": list(CAP_CASES)})
+    comp_df, _ = agent_compare(in_df, nom_df, INPUT_DICT, EXCHANGE, SLABS)
+    net = comp_df[comp_df["Type"] == "Net Charges"].set_index("Agent Name")
+    for agent, (_, expected) in CAP_CASES.items():
+        np.testing.assert_allclose(net.loc[agent, [f"CBM {n}" for n in SLABS]].to_numpy(float), expected,
+                                   err_msg=agent)
+
+def test_charge_caps_on_raw_and_cleaned_tariffs():
+    raw = cap_tariffs()
+    from_raw = charge_caps(raw, EXCHANGE)
+    from_clean = charge_caps(clean_money_cols(raw.copy()), EXCHANGE)
+    pd.testing.assert_frame_equal(from_raw, from_clean, check_dtype=False)
+    # Only volume heads with a non-zero Minimum / Maximum in a known currency
+    assert sorted(from_raw["Agent Name"]) == ["Both", "Both bases", "CBM head on Ton branch", "Maximum in EUR",
+                                              "Minimum", "Ton branch", "Ton head on CBM branch"]
+
+def test_cheapest_bands_knots_at_caps():
+    in_df = cap_tariffs()
+    caps = charge_caps(in_df, EXCHANGE)
+    coeffs = agent_coefficients(in_df, EXCHANGE).loc[["Minimum", "Both"]]
+    # max(10n, 35) vs clamp(10n, 25, 50): Both is cheaper below 3.5 and above 5, equal in between
+    bands = cheapest_bands(coeffs, 6.0, caps=caps)
+    assert bands["Agent Name"].iloc[0] == "Both" and bands["Agent Name"].iloc[-1] == "Both"
+    assert bands["To CBM"].iloc[0] >= 3.5 - 1e-9 and bands["From CBM"].iloc[-1] <= 5 + 1e-9
+    others = bands[bands["Agent Name"] != "Both"]
+    assert ((others["From CBM"] >= 3.5 - 1e-9) & (others["To CBM"] <= 5 + 1e-9)).all()
+    assert bands["Net Charges From"].iloc[0] == pytest.approx(25)
+    assert bands["Net Charges To"].iloc[-1] == pytest.approx(50)
+
+def test_empty_slabs_rejected():
+    coeffs, caps = coefficients(tender(3, 0))
+    with pytest.raises(ValueError):
+        expand_ladder(coeffs, [], caps)
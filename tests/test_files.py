@@ -0,0 +1,114 @@
+"""Shared Data/ writes: lock, atomic replace, version check."""
+import os
+import threading
+import time
+
+import pandas as pd
+import pytest
+
+from cif_calc import files
+from cif_calc.files import VersionConflict, file_lock, file_version, write_file
+from cif_calc.rates import load_rate_history, save_exchange_rates
+
+def write_text(text):
+    def write(tmp):
+        with open(tmp, "w") as f:
+            f.write(text)
+    return write
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+def test_write_file_creates_and_replaces(tmp_path):
+    path = str(tmp_path / "data.txt")
+    assert file_version(path) == 0
+    first = write_file(path, write_text("one"), expected_version=0)
+    assert read(path) == "one" and first == file_version(path) != 0
+    second = write_file(path, write_text("two"), expected_version=first)
+    assert read(path) == "two" and second != first
+    assert sorted(os.listdir(tmp_path)) == ["data.txt", "data.txt.lock"]
+
+def test_stale_version_conflicts_and_writes_nothing(tmp_path):
+    path = str(tmp_path / "data.txt")
+    base = write_file(path, write_text("one"))
+    write_file(path, write_text("someone else"), expected_version=base)
+    called = []
+    with pytest.raises(VersionConflict):
+        write_file(path, write_text("mine"), expected_version=base, installed=lambda: called.append(1))
+    assert read(path) == "someone else" and not called
+
+def test_failed_write_keeps_original(tmp_path):
+    path = str(tmp_path / "data.txt")
+    write_file(path, write_text("one"))
+
+    def broken(tmp):
+        write_text("half")(tmp)
+        raise OSError("disk full")
+
+    with pytest.raises(OSError):
+        write_file(path, broken)
+    assert read(path) == "one"
+    assert sorted(os.listdir(tmp_path)) == ["data.txt", "data.txt.lock"]   # no temp file left behind
+
+def test_copy_seeds_the_temp_file(tmp_path):
+    path = str(tmp_path / "data.txt")
+    write_file(path, write_text("one"))
+
+    def append(tmp):
+        with open(tmp, "a") as f:
+            f.write("+two")
+
+    write_file(path, append, copy=True)
+    assert read(path) == "one+two"
+
+def test_file_lock_excludes_other_writers(tmp_path):
+    path = str(tmp_path / "data.txt")
+    with file_lock(path):
+        with pytest.raises(TimeoutError):
+            write_file(path, write_text("blocked"), timeout=0.2)
+    assert not os.path.exists(path)
+
+    # A writer waiting on the lock goes ahead once it is released
+    done = []
+    with file_lock(path):
+        waiter = threading.Thread(target=lambda: done.append(write_file(path, write_text("after"))))
+        waiter.start()
+        time.sleep(0.2)
+        assert not done
+    waiter.join(5)
+    assert done and read(path) == "after"
+
+def test_installed_runs_after_the_replace(tmp_path):
+    path = str(tmp_path / "data.txt")
+    seen = []
+    write_file(path, write_text("one"), installed=lambda: seen.append(read(path)))
+    assert seen == ["one"]
+
+# ------------------------------------------------------------------
+# Exchange rates: the history only records rates that were published
+# ------------------------------------------------------------------
+RATES = pd.DataFrame({"Currency": ["USD", "EUR"], "Exchange Rate to USD": [1.0, 1.1]})
+
+def test_rates_history_follows_the_published_file(tmp_path):
+    path, history = str(tmp_path / "Exchange Rates.xlsx"), str(tmp_path / "history.sqlite")
+    RATES.to_excel(path, index=False)
+    save_exchange_rates(RATES.assign(**{"Exchange Rate to USD": [1.0, 1.2]}), path, history_path=history)
+    table = load_rate_history(history, path)
+    # The rates replaced by the first save are kept as the earliest ones
+    assert table.as_of("1999-01-01").set_index("Currency")["Exchange Rate to USD"]["EUR"] == 1.1
+    assert table.as_of().set_index("Currency")["Exchange Rate to USD"]["EUR"] == 1.2
+
+def test_failed_rates_replace_records_no_history(tmp_path, monkeypatch):
+    path, history = str(tmp_path / "Exchange Rates.xlsx"), str(tmp_path / "history.sqlite")
+    RATES.to_excel(path, index=False)
+
+    def refuse(src, dst, attempts=10):
+        raise PermissionError("file is open in Excel")
+
+    monkeypatch.setattr(files, "_replace", refuse)
+    with pytest.raises(PermissionError):
+        save_exchange_rates(RATES.assign(**{"Exchange Rate to USD": [1.0, 9.9]}), path, history_path=history)
+    assert pd.read_excel(path)["Exchange Rate to USD"].tolist() == [1.0, 1.1]
+    assert len(load_rate_history(history, path)) == 2   # only the file's own rates, since EARLIEST
+    assert 9.9 not in load_rate_history(history, path).as_of()["Exchange Rate to USD"].tolist()
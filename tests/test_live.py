@@ -0,0 +1,65 @@
+"""Live recalculation: only the newest inputs are calculated."""
+import threading
+import time
+
+import pytest
+
+from cif_calc.live import LiveCalculator
+
+def wait_for(calc, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while calc.pending():
+        assert time.monotonic() < deadline, "live calculation did not finish"
+        time.sleep(0.01)
+    return calc.latest()
+
+@pytest.fixture
+def calc():
+    calc = LiveCalculator(debounce=0.05)
+    yield calc
+    calc.shutdown()
+
+def test_burst_runs_only_the_newest(calc):
+    ran = []
+    for i in range(10):
+        assert calc.submit(i, ran.append, i)
+    assert calc.pending()
+    result = wait_for(calc)
+    assert ran == [9] and result.generation == 10 and result.error is None
+
+def test_unchanged_inputs_are_not_resubmitted(calc):
+    assert calc.submit("same", lambda: 1)
+    assert not calc.submit("same", lambda: 2)
+    assert wait_for(calc).value == 1
+
+def test_newer_inputs_win_over_a_running_job(calc):
+    started, release = threading.Event(), threading.Event()
+
+    def slow():
+        started.set()
+        release.wait(5)
+        return "old"
+
+    calc.submit("a", slow)
+    assert started.wait(5)
+    calc.submit("b", lambda: "new")
+    release.set()
+    result = wait_for(calc)
+    assert result.value == "new" and result.generation == 2
+    time.sleep(0.1)
+    assert calc.latest().value == "new"   # the older job finishing late does not replace it
+
+def test_errors_are_reported_not_raised(calc):
+    calc.submit("bad", lambda: 1 / 0)
+    result = wait_for(calc)
+    assert isinstance(result.error, ZeroDivisionError) and result.value is None
+    calc.submit("good", lambda: 2)
+    assert wait_for(calc).value == 2
+
+def test_shutdown_drops_queued_jobs():
+    calc = LiveCalculator(debounce=0.2)
+    ran = []
+    calc.submit(1, ran.append, 1)
+    calc.shutdown()
+    time.sleep(0.4)
+    assert ran == [] and calc.latest() is None
@@ -0,0 +1,88 @@
+"""Exchange-rate history: every save gets its own key, lookups find the rates in force."""
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cif_calc.rates import EARLIEST, RateHistory, load_rate_history, rate_time, record_rates
+
+def rates(**by_currency):
+    return pd.DataFrame({"Currency": list(by_currency), "Exchange Rate to USD": list(by_currency.values())})
+
+def as_dict(table):
+    return dict(zip(table["Currency"], table["Exchange Rate to USD"]))
+
+@pytest.fixture
+def history_path(tmp_path):
+    return str(tmp_path / "rate_history.sqlite")
+
+def test_rate_time():
+    assert rate_time("2026-03-04") == "2026-03-04T23:59:59.999999"
+    assert rate_time(date(2026, 3, 4)) == "2026-03-04T23:59:59.999999"
+    assert rate_time("2026-03-04T10:11:12") == "2026-03-04T10:11:12.000000"
+    # Today (or a timestamp) is never later than now
+    before = datetime.now()
+    today = datetime.fromisoformat(rate_time(before.date()))
+    assert before <= today <= datetime.now()
+
+def test_as_of_between_records():
+    history = RateHistory(["EUR", "EUR", "EUR", "INR"],
+                          [EARLIEST, "2026-01-01T00:00:00", "2026-02-01T12:00:00", EARLIEST],
+                          [1.0, 1.1, np.nan, 0.012])
+    assert len(history) == 4
+    assert as_dict(history.as_of("2025-12-31")) == {"EUR": 1.0, "INR": 0.012}
+    assert as_dict(history.as_of("2026-01-01T00:00:00")) == {"EUR": 1.1, "INR": 0.012}
+    assert as_dict(history.as_of("2026-02-01T11:59:59")) == {"EUR": 1.1, "INR": 0.012}
+    assert as_dict(history.as_of("2026-02-01")) == {"INR": 0.012}   # EUR no longer quoted that day
+
+    matrix = history.rate_matrix(["2025-06-01", "2026-01-15T08:00:00"])
+    assert list(matrix.columns) == ["EUR", "INR"] and matrix.index.name == "Rate Date"
+    np.testing.assert_allclose(matrix.to_numpy(), [[1.0, 0.012], [1.1, 0.012]])
+
+def test_before_any_record():
+    history = RateHistory(["EUR"], ["2026-01-01T00:00:00"], [1.1])
+    assert history.as_of("2025-01-01").empty
+    assert np.isnan(history.rate_matrix(["2025-01-01"]).iloc[0, 0])
+
+def test_matches_a_plain_lookup():
+    rng = np.random.default_rng(0)
+    currencies = [f"C{i}" for i in range(5)]
+    start = datetime(2026, 1, 1)
+    rows = [(c, (start + timedelta(hours=int(h))).isoformat(), float(r))
+            for c in currencies for h, r in zip(rng.choice(2000, 20, replace=False), rng.uniform(0.5, 2, 20))]
+    history = RateHistory(*zip(*rows))
+    for hours in rng.integers(-10, 2100, 50):
+        when = (start + timedelta(hours=int(hours), minutes=30)).isoformat()
+        expected = {}
+        for c in currencies:
+            earlier = [(t, r) for cur, t, r in rows if cur == c and t <= when]
+            if earlier:
+                expected[c] = max(earlier)[1]
+        assert as_dict(history.as_of(when)) == expected
+
+def test_same_second_saves_stay_apart(history_path):
+    first = record_rates(rates(USD=1.0, EUR=1.1), path=history_path, previous=None)
+    second = record_rates(rates(USD=1.0, EUR=1.2), path=history_path, previous=None)
+    third = record_rates(rates(USD=1.0, EUR=1.3), path=history_path, previous=None)
+    assert first < second < third
+    history = load_rate_history(history_path)
+    # A comparison keyed on a save finds that save's rates, however many follow
+    assert [as_dict(history.as_of(k))["EUR"] for k in (first, second, third)] == [1.1, 1.2, 1.3]
+
+def test_dropped_currency_and_seed(history_path, tmp_path):
+    previous = str(tmp_path / "Exchange Rates.xlsx")
+    rates(USD=1.0, EUR=1.05, INR=0.012).to_excel(previous, index=False)
+    stamp = record_rates(rates(USD=1.0, EUR=1.1), "2026-05-01T09:00:00", history_path, previous)
+    assert stamp == "2026-05-01T09:00:00.000000"
+
+    history = load_rate_history(history_path, previous)
+    # The rates in use before the first record count as in force since EARLIEST
+    assert as_dict(history.as_of("2026-04-30")) == {"USD": 1.0, "EUR": 1.05, "INR": 0.012}
+    assert as_dict(history.as_of("2026-05-01T09:00:00")) == {"USD": 1.0, "EUR": 1.1}
+
+def test_history_falls_back_to_the_current_workbook(tmp_path):
+    current = str(tmp_path / "Exchange Rates.xlsx")
+    rates(USD=1.0, EUR=1.1).to_excel(current, index=False)
+    history = load_rate_history(str(tmp_path / "none.sqlite"), current)
+    assert as_dict(history.as_of("1950-01-01")) == as_dict(history.as_of()) == {"USD": 1.0, "EUR": 1.1}
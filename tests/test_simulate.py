@@ -0,0 +1,57 @@
+"""Monte Carlo profitability: reproducible, and nom() itself when nothing varies."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from cif_calc import simulate
+from cif_calc.bench import synthetic_tender
+from cif_calc.engine import agent_coefficients, nomination_compare
+from cif_calc.simulate import rebate_currencies, run_simulation
+
+VARIABLES = {"Considered CBM": ("triangular", 15, 20, 22), "Market Rate (USD)": ("normal", -10, 3),
+             "Box Rate (USD)": ("uniform", 1700, 1900)}
+
+@pytest.fixture(scope="module")
+def tender():
+    t = synthetic_tender(12, 4, 3, 2)
+    t["coeffs"] = agent_coefficients(t["in_df"].copy(), t["exchange_df"])
+    return t
+
+def simulation(t, **kw):
+    kw = {"variables": VARIABLES, "draws": 20_000, "seed": 11,
+          "rebate_currency": rebate_currencies(t["in_df"]), "fx_vol": 0.1, **kw}
+    return run_simulation(t["coeffs"], t["nom_df"], t["input_dict"], **kw)
+
+def test_same_seed_same_result(tender):
+    pd.testing.assert_frame_equal(simulation(tender), simulation(tender))
+    assert not simulation(tender).equals(simulation(tender, seed=12))
+
+def test_zero_variance_is_nomination_compare(tender):
+    result = simulation(tender, variables=None, fx_vol=0.0, draws=1_000)
+    expected = nomination_compare(tender["coeffs"], tender["nom_df"], tender["input_dict"])
+    merged = result.merge(expected, on=["Container Type", "Agent Name"])
+    assert len(merged) == len(expected) == len(result)
+    for col in ["Mean", "P5", "P50", "P95"]:
+        # Profits are kept as float32 for the percentiles
+        np.testing.assert_allclose(merged[col], merged["Sum of Profitability"], rtol=1e-6, atol=1e-3)
+    np.testing.assert_allclose(merged["Std"], 0, atol=1e-3)
+    # Every draw is the same, so each container type has one best agent, as nomination_compare ranks them
+    for ctype, group in merged.groupby("Container Type"):
+        best = group["Sum of Profitability"].idxmax()
+        assert group.loc[best, "P(Best)"] == 1.0 and group["P(Best)"].sum() == 1.0
+
+def test_result_layout(tender):
+    result = simulation(tender, percentiles=(10, 90))
+    assert list(result.columns) == ["Container Type", "Agent Name", "Mean", "Std", "P10", "P90", "P(Best)"]
+    assert result.groupby("Container Type")["P(Best)"].sum().tolist() == pytest.approx([1.0] * len(tender["input_dict"]))
+    assert (result["P10"] <= result["P90"]).all()
+
+def test_blocks_of_agents_match_one_block(tender, monkeypatch):
+    whole = simulation(tender)
+    monkeypatch.setattr(simulate, "BLOCK_CELLS", 20_000 * 5)   # five agents per block, last one partial
+    monkeypatch.setattr(simulate, "CHUNK_DRAWS", 3_000)
+    pd.testing.assert_frame_equal(simulation(tender), whole, rtol=1e-12)
+
+def test_unknown_variable_rejected(tender):
+    with pytest.raises(ValueError):
+        simulation(tender, variables={"Loadability": ("normal", 20, 1)})
@@ -0,0 +1,215 @@
+"""Saved-comparison store: round-trips, version checks, search and the workbook import."""
+import os
+import zipfile
+from contextlib import closing
+from datetime import date, datetime
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from cif_calc import store
+from cif_calc.bench import synthetic_tender
+from cif_calc.engine import agent_compare
+from cif_calc.workbook import comparison_sheets, container_info
+
+@pytest.fixture
+def path(tmp_path):
+    return str(tmp_path / "comparisons.sqlite")
+
+def comparison(agents=3, seed=0, pol="Nhava Sheva", pod="Jebel Ali", rate_date="2026-10-01"):
+    """The sheets Tab 1 saves for a synthetic tender (amounts as the forms leave them)."""
+    t = synthetic_tender(agents, 4, 2, seed)
+    comp_df, nomination_df = agent_compare(t["in_df"].copy(), t["nom_df"], t["input_dict"], t["exchange_df"])
+    info = container_info(pol, pod, t["input_dict"], rate_date)
+    return comparison_sheets(info, t["in_df"], t["nom_df"], comp_df, nomination_df)
+
+def test_round_trip(path):
+    sheets = comparison()
+    assert store.save_comparison("Tender", sheets, path) == 1
+    loaded = store.load_comparison("Tender", path=path)
+    assert list(loaded) == list(sheets)
+    for sheet in ("Comparison", "Nomination"):
+        pd.testing.assert_frame_equal(loaded[sheet], sheets[sheet].reset_index(drop=True), check_index_type=False)
+    assert store.load_sheet("Tender", "Info", path).equals(loaded["Info"])
+
+def test_blank_rebate_cells_load_as_nan(path):
+    sheets = comparison()
+    agent = next(s for s in sheets if s.startswith("Agent"))
+    rebate = sheets[agent]["Description"] == "Rebate"
+    sheets[agent].loc[rebate, ["Per CBM", "Per BL", "Per Container"]] = ""
+    store.save_comparison("Tender", sheets, path)
+
+    loaded = store.load_sheet("Tender", agent, path)
+    rebate_row = loaded[loaded["Description"] == "Rebate"].fillna(0)
+    # What the Saved Comparisons tab reads into its number inputs
+    assert [float(rebate_row[c].values[0]) for c in ("Per CBM", "Per BL", "Per Container")] == [0.0, 0.0, 0.0]
+    assert not (loaded == "").any().any()
+
+def test_mixed_type_columns_round_trip(path):
+    # The Info sheet holds POL / POD text and numbers in one column
+    sheets = {"Info": comparison()["Info"], "Odd": pd.DataFrame({1: [1, "a", 2.5, None], "b": [True, False, None, "x"]})}
+    store.save_comparison("Mixed", sheets, path)
+    loaded = store.load_comparison("Mixed", path=path)
+    assert loaded["Info"].iloc[:, 1].tolist() == sheets["Info"].iloc[:, 1].tolist()
+    assert loaded["Odd"]["1"].tolist()[:3] == [1, "a", 2.5] and loaded["Odd"]["1"].iloc[3] is None
+    assert loaded["Odd"]["b"].tolist()[:2] == [True, False]
+
+def test_versions_and_conflicts(path):
+    sheets = comparison()
+    assert store.comparison_version("Tender", path) is None
+    assert store.save_comparison("Tender", sheets, path, expected_version=0) == 1
+    with pytest.raises(store.VersionConflict):
+        store.save_comparison("Tender", sheets, path, expected_version=0)   # must not exist yet
+    assert store.save_comparison("Tender", sheets, path, expected_version=1) == 2
+
+    # Someone else saves in between: the stale save is refused and changes nothing
+    store.save_comparison("Tender", {**sheets, "Info": sheets["Info"].assign(Extra=1)}, path)
+    with pytest.raises(store.VersionConflict):
+        store.save_comparison("Tender", comparison(seed=1), path, expected_version=2)
+    assert store.comparison_version("Tender", path) == 3
+    assert "Extra" in store.load_sheet("Tender", "Info", path).columns
+
+def test_add_empty_agent_and_delete(path):
+    sheets = comparison(agents=2)
+    store.save_comparison("Tender", sheets, path)
+    assert store.add_empty_agent("Tender", path=path) == "NewAgent1"
+    assert store.add_empty_agent("Tender", path=path) == "NewAgent2"
+    names = store.sheet_names("Tender", path)
+    # New agents go after the existing agent sheets, before the result sheets
+    assert names[:5] == ["Info", "Agent 1", "Agent 2", "NewAgent1", "NewAgent2"]
+    with pytest.raises(store.VersionConflict):
+        store.add_empty_agent("Tender", path=path, expected_version=1)
+
+    store.delete_comparison("Tender", path)
+    assert store.list_comparisons(path) == []
+    with pytest.raises(KeyError):
+        store.load_comparison("Tender", path=path)
+
+def write_xlsx(sheets, xlsx_path):
+    from cif_calc.workbook import write_workbook
+    write_workbook(sheets, str(xlsx_path))
+    return str(xlsx_path)
+
+def test_import_saved_workbooks_once(path, tmp_path):
+    saved = tmp_path / "Saved"
+    saved.mkdir()
+    write_xlsx(comparison(), saved / "Old Tender.xlsx")
+    write_xlsx({"Sheet1": pd.DataFrame({"a": [1]})}, saved / "Not a comparison.xlsx")
+    (saved / "Broken.xlsx").write_bytes(b"not a workbook")
+    (saved / "~$Old Tender.xlsx").write_bytes(b"Excel lock file")
+    os.utime(saved / "Old Tender.xlsx", (1_700_000_000, 1_700_000_000))
+
+    imported, failed = store.import_saved_workbooks(str(saved), path)
+    assert imported == ["Old Tender"]
+    assert [f for f, _ in failed] == ["Broken.xlsx"]
+    assert store.list_comparisons(path) == ["Old Tender"]
+    created = store.search_comparisons(path=path)["Created"].iloc[0]
+    assert created == datetime.fromtimestamp(1_700_000_000).isoformat(timespec="seconds")
+    loaded = store.load_sheet("Old Tender", "Comparison", path)
+    np.testing.assert_allclose(loaded.filter(like="CBM ").to_numpy(float),
+                               comparison()["Comparison"].filter(like="CBM ").to_numpy(float))
+
+    # Runs once per store, unless forced; comparisons already in the store are skipped
+    write_xlsx(comparison(seed=1), saved / "Later.xlsx")
+    assert store.import_saved_workbooks(str(saved), path) == ([], [])
+    imported, _ = store.import_saved_workbooks(str(saved), path, force=True)
+    assert imported == ["Later"]
+
+# ------------------------------------------------------------------
+# Search index
+# ------------------------------------------------------------------
+def test_search_filters(path):
+    store.save_comparison("Dubai old", comparison(agents=2, pod="Jebel Ali"), path, created="2026-01-05T10:00:00")
+    store.save_comparison("Dubai new", comparison(agents=3, seed=1, pod="Jebel Ali"), path,
+                          created="2026-03-01T09:30:00")
+    store.save_comparison("Muscat", comparison(agents=4, seed=2, pol="Mundra", pod="Sohar"), path,
+                          created="2026-02-10T23:59:59")
+
+    assert store.search_comparisons(path=path)["Name"].tolist() == ["Dubai new", "Muscat", "Dubai old"]
+    assert store.indexed_values("pod", path) == ["Jebel Ali", "Sohar"]
+    assert store.indexed_values("pol", path) == ["Mundra", "Nhava Sheva"]
+    with pytest.raises(ValueError):
+        store.indexed_values("name; DROP TABLE comparisons", path)
+
+    def names(**kw):
+        return store.search_comparisons(path=path, **kw)["Name"].tolist()
+
+    assert names(pod="Jebel Ali") == ["Dubai new", "Dubai old"]
+    assert names(pol="Mundra") == ["Muscat"]
+    assert names(agent="agent 4") == ["Muscat"]   # part of a name, any case
+    # Dates take whole days of the creation time, both ends included
+    assert names(since="2026-02-10", until="2026-02-10") == ["Muscat"]
+    assert names(since=date(2026, 1, 6), until=date(2026, 3, 1)) == ["Dubai new", "Muscat"]
+    assert store.search_comparisons(path=path)["Agents"].tolist() == [3, 4, 2]
+
+def test_search_best_net_charges(path):
+    sheets = comparison(agents=5)
+    store.save_comparison("Tender", sheets, path)
+    net = sheets["Comparison"][sheets["Comparison"]["Type"] == "Net Charges"].set_index("Agent Name")["CBM 10"]
+
+    found = store.search_comparisons(cbm=10, path=path)
+    assert found.loc[0, "Best Agent"] == net.idxmin()
+    assert found.loc[0, "Best Net Charges"] == pytest.approx(net.min())
+    assert store.search_comparisons(cbm=10, max_net=net.min() - 0.01, path=path).empty
+    assert len(store.search_comparisons(cbm=10, max_net=net.min(), path=path)) == 1
+
+def test_resave_and_delete_update_the_index(path):
+    store.save_comparison("Tender", comparison(pod="Jebel Ali"), path)
+    store.save_comparison("Tender", comparison(pod="Sohar"), path)
+    assert store.search_comparisons(pod="Jebel Ali", path=path).empty
+    assert store.search_comparisons(pod="Sohar", path=path)["Name"].tolist() == ["Tender"]
+    store.delete_comparison("Tender", path)
+    assert store.search_comparisons(path=path).empty and store.indexed_values("pod", path) == []
+
+def test_comparisons_saved_before_the_index_are_indexed(path):
+    store.save_comparison("Tender", comparison(), path)
+    with closing(store.connect(path)) as conn, conn:
+        conn.execute("DELETE FROM comparison_index")
+    assert store.search_comparisons(pod="Jebel Ali", path=path)["Name"].tolist() == ["Tender"]
+
+# ------------------------------------------------------------------
+# On-demand sheets and exports
+# ------------------------------------------------------------------
+def test_only_requested_sheets_are_decoded(path, monkeypatch):
+    sheets = comparison()
+    store.save_comparison("Tender", sheets, path)
+    decoded = []
+    decode = store.decode_frame
+    monkeypatch.setattr(store, "decode_frame", lambda blob: decoded.append(1) or decode(blob))
+
+    assert store.sheet_names("Tender", path) == list(sheets) and not decoded
+    frames = store.load_comparison("Tender", ["Nomination", "Info"], path)
+    assert list(frames) == ["Info", "Nomination"] and len(decoded) == 2   # in sheet order
+    with pytest.raises(KeyError):
+        store.load_sheet("Tender", "No such sheet", path)
+    with pytest.raises(KeyError):
+        store.load_sheet("No such comparison", "Info", path)
+
+def test_archive_holds_every_comparison(path, monkeypatch):
+    store.save_comparison("One", comparison(), path)
+    store.save_comparison("Two", comparison(seed=1), path)
+
+    spool = store.export_archive(path)
+    with zipfile.ZipFile(spool) as zipf:
+        assert sorted(zipf.namelist()) == ["One.xlsx", "Two.xlsx"]
+        workbook = pd.read_excel(BytesIO(zipf.read("Two.xlsx")), sheet_name=None)
+    assert list(workbook) == store.sheet_names("Two", path)
+    np.testing.assert_allclose(workbook["Comparison"].filter(like="CBM ").to_numpy(float),
+                               store.load_sheet("Two", "Comparison", path).filter(like="CBM ").to_numpy(float))
+
+    # Large archives spill to disk instead of staying in memory
+    monkeypatch.setattr(store, "ARCHIVE_SPOOL_BYTES", 1024)
+    assert store.export_archive(path)._rolled
+
+def test_archive_signature_follows_saves_and_deletes(path):
+    store.save_comparison("One", comparison(), path)
+    signature = store.archive_signature(path)
+    store.load_comparison("One", path=path)
+    assert store.archive_signature(path) == signature
+    store.save_comparison("One", comparison(), path)
+    resaved = store.archive_signature(path)
+    assert resaved != signature
+    store.delete_comparison("One", path)
+    assert store.archive_signature(path) not in (signature, resaved)
@@ -0,0 +1,84 @@
+"""Scenario sweep: each scenario row gives what the calculator gives for those inputs."""
+import numpy as np
+import pandas as pd
+import pytest
+
+from cif_calc import sweep
+from cif_calc.bench import synthetic_tender
+from cif_calc.engine import agent_compare, agent_coefficients, charge_caps, charge_ladder, nomination_compare
+from cif_calc.sweep import RESULT_COLS, SCENARIO_COLS, SCENARIO_KEYS, run_sweep, scenario_grid
+from cif_calc.workbook import comparison_sheets, container_info, write_workbook
+
+@pytest.fixture(scope="module")
+def tender():
+    t = synthetic_tender(6, 4, 3, 1)
+    t["coeffs"] = agent_coefficients(t["in_df"].copy(), t["exchange_df"])
+    t["caps"] = charge_caps(t["in_df"], t["exchange_df"])
+    return t
+
+def test_scenario_grid(tender):
+    grid = scenario_grid(["Jebel Ali", "Sohar"], tender["input_dict"],
+                         {("20'STD", "Box Rate (USD)"): [1600, 2000], ("40'STD", "Market Rate (USD)"): [-5, 0, 5]})
+    assert list(grid.columns) == SCENARIO_COLS
+    assert len(grid) == 2 * 6 * len(tender["input_dict"])
+    first = grid[(grid["POD"] == "Sohar") & (grid["Scenario"] == 1)].set_index("Container Type")
+    assert first.loc["20'STD", "Box Rate (USD)"] == 1600 and first.loc["40'STD", "Market Rate (USD)"] == -5
+    # Fields that are not varied keep the base inputs
+    assert first.loc["40'STD", "Box Rate (USD)"] == tender["input_dict"]["40'STD"][1]
+    with pytest.raises(ValueError):
+        scenario_grid(["Jebel Ali"], tender["input_dict"], {("45'HC", "Loadability"): [60]})
+
+def test_base_scenario_matches_the_calculator(tender):
+    result = run_sweep(tender["coeffs"], tender["nom_df"], scenario_grid(["Jebel Ali"], tender["input_dict"]),
+                       tender["caps"])
+    assert list(result.columns) == SCENARIO_KEYS + ["Agent Name"] + RESULT_COLS
+    expected = nomination_compare(tender["coeffs"], tender["nom_df"], tender["input_dict"])
+    merged = result.merge(expected, on=["Container Type", "Agent Name"], suffixes=("", " expected"))
+    assert len(merged) == len(result) == len(expected)
+    for col in ["Considered CBM", "Free Hand CBM", "Free Hand BL", "Profitability on Free Hand",
+                "Profitability on Nomination", "Sum of Profitability"]:
+        np.testing.assert_allclose(merged[col], merged[f"{col} expected"].astype(float), err_msg=col)
+
+    for ctype, group in result.groupby("Container Type"):
+        cbm = group["Considered CBM"].iloc[0]
+        net = charge_ladder(tender["coeffs"], np.array([cbm]), tender["caps"])[:, 4, 0]
+        np.testing.assert_allclose(group["Net Charges"], net)
+        # Rank 1 is the most profitable agent
+        assert group.sort_values("Rank")["Sum of Profitability"].is_monotonic_decreasing
+        assert sorted(group["Rank"]) == list(range(1, len(tender["coeffs"]) + 1))
+
+def test_scenarios_change_the_results(tender):
+    grid = scenario_grid(["Jebel Ali"], tender["input_dict"], {("20'STD", "Market Rate (USD)"): [-10, 10]})
+    result = run_sweep(tender["coeffs"], tender["nom_df"], grid, tender["caps"]).set_index(
+        ["Scenario", "Container Type", "Agent Name"])
+    low, high = result.loc[(1, "20'STD")], result.loc[(2, "20'STD")]
+    # A higher market rate earns more on every free-hand CBM
+    np.testing.assert_allclose(high["Profitability on Free Hand"] - low["Profitability on Free Hand"],
+                               20 * low["Free Hand CBM"])
+    pd.testing.assert_frame_equal(result.loc[(1, "40'STD")], result.loc[(2, "40'STD")])
+
+def test_missing_scenario_columns(tender):
+    grid = scenario_grid(["Jebel Ali"], tender["input_dict"]).drop(columns=["Loadability"])
+    with pytest.raises(ValueError, match="Loadability"):
+        run_sweep(tender["coeffs"], tender["nom_df"], grid)
+
+def test_command_line(tender, tmp_path):
+    t = tender
+    comp_df, nomination_df = agent_compare(t["in_df"].copy(), t["nom_df"], t["input_dict"], t["exchange_df"])
+    workbook = str(tmp_path / "Tender.xlsx")
+    write_workbook(comparison_sheets(container_info("Nhava Sheva", "Jebel Ali", t["input_dict"], "2026-10-01"),
+                                     t["in_df"], t["nom_df"], comp_df, nomination_df), workbook)
+    rates = str(tmp_path / "Exchange Rates.xlsx")
+    t["exchange_df"].to_excel(rates, index=False)
+    common = ["--xlsx", workbook, "--exchange-rates", rates, "--rate-history", str(tmp_path / "history.sqlite")]
+
+    grid_path = str(tmp_path / "grid.csv")
+    assert sweep.main(common + ["--pods", "Jebel Ali", "Sohar", "--grid-only", "-o", grid_path]) == 0
+    assert len(pd.read_csv(grid_path)) == 2 * len(t["input_dict"])
+
+    out = str(tmp_path / "sweep.csv")
+    assert sweep.main(common + ["--scenarios", grid_path, "-o", out]) == 0
+    result = pd.read_csv(out)
+    assert len(result) == 2 * len(t["input_dict"]) * len(t["coeffs"])
+    direct = run_sweep(t["coeffs"], t["nom_df"], pd.read_csv(grid_path), t["caps"])
+    np.testing.assert_allclose(result["Sum of Profitability"], direct["Sum of Profitability"], rtol=1e-9)
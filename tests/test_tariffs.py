@@ -0,0 +1,146 @@
+"""Agent tariffs: the forms, the grid and the bulk import all build the same (in_df, nom_df)."""
+from io import BytesIO
+
+import pandas as pd
+import pytest
+
+from cif_calc.bench import synthetic_tender
+from cif_calc.engine import agent_compare, agent_coefficients, nomination_support
+from cif_calc.tariffs import (GRID_CHARGE_COLS, GRID_TERM_COLS, TARIFF_ERROR_COLS, agent_grid, form_frames,
+                              form_keys, grid_frames, import_tariffs, tariff_frames)
+from cif_calc.workbook import NOM_SHEET, comparison_sheets, container_info, write_workbook
+
+def same_calculation(a, b, exchange_df):
+    """Two (in_df, nom_df) pairs give the same coefficients and nomination support."""
+    coeffs = agent_coefficients(a[0].copy(), exchange_df)
+    pd.testing.assert_frame_equal(coeffs, agent_coefficients(b[0].copy(), exchange_df), check_index_type=False)
+    pd.testing.assert_frame_equal(nomination_support(a[1], coeffs.index), nomination_support(b[1], coeffs.index),
+                                  check_dtype=False, check_index_type=False)
+
+# ------------------------------------------------------------------
+# Agent grid
+# ------------------------------------------------------------------
+@pytest.mark.parametrize("seed", range(3))
+def test_grid_round_trips_the_forms(seed):
+    t = synthetic_tender(5, 4, 3, seed)
+    charges, terms = agent_grid(t["in_df"], t["nom_df"])
+    assert list(charges.columns) == GRID_CHARGE_COLS and list(terms.columns) == GRID_TERM_COLS
+    assert terms["Agent Name"].tolist() == [f"Agent {a}" for a in t["agent_ids"]]
+    same_calculation(grid_frames(charges, terms), (t["in_df"], t["nom_df"]), t["exchange_df"])
+
+def test_grid_edits_are_calculated():
+    t = synthetic_tender(2, 2, 1, 0)
+    charges, terms = agent_grid(t["in_df"], t["nom_df"])
+    charges = pd.concat([charges, pd.DataFrame([{"Agent Name": "Agent 2", "Description": "Extra", "Currency": "USD",
+                                                 "Per CBM": 7.0}])], ignore_index=True)
+    terms.loc[terms["Agent Name"] == "Agent 1", ["Rebate Currency", "Rebate Per BL"]] = ["USD", 11.0]
+    in_df, nom_df = grid_frames(charges, terms)
+
+    coeffs = agent_coefficients(in_df.copy(), t["exchange_df"])
+    before = agent_coefficients(t["in_df"].copy(), t["exchange_df"])
+    assert coeffs.at["Agent 2", "Per CBM"] == pytest.approx(before.at["Agent 2", "Per CBM"] + 7)
+    assert coeffs.at["Agent 1", "Rebate Per BL"] == 11.0
+    # Each agent's rows stay together, Remarks and Rebate after its charge heads
+    agent_2 = in_df[in_df["Agent Name"] == "Agent 2"]
+    assert agent_2.index.tolist() == list(range(agent_2.index[0], agent_2.index[-1] + 1))
+    assert agent_2["Description"].tolist()[-3:] == ["Extra", "Remarks", "Rebate"]
+
+def test_grid_skips_incomplete_rows():
+    charges = pd.DataFrame([
+        {"Agent Name": "A", "Description": "THC", "Currency": "USD", "Per CBM": 5.0},
+        {"Agent Name": "A", "Description": " ", "Currency": "USD", "Per CBM": 9.0},
+        {"Agent Name": None, "Description": "DO", "Currency": "USD", "Per CBM": 9.0},
+    ]).reindex(columns=GRID_CHARGE_COLS)
+    terms = pd.DataFrame([{"Agent Name": "A"}, {"Agent Name": " "}, {"Agent Name": "B"}]).reindex(columns=GRID_TERM_COLS)
+    in_df, nom_df = grid_frames(charges, terms)
+    assert in_df["Description"].tolist() == ["THC", "Remarks", "Rebate", "Remarks", "Rebate"]
+    assert nom_df["Agent Name"].tolist() == ["A", "B"]
+    assert (nom_df[["Nomination Rate", "Nomination CBM", "Nomination BL"]] == 0).all().all()
+    # Blank amounts stay blank, as the forms leave them
+    assert in_df.loc[0, "Per Ton"] == ""
+
+def test_form_keys_cover_what_form_frames_reads():
+    t = synthetic_tender(12, 2, 1, 0)
+    state = {**t["state"], "agent_entry_mode": "Grid", "slab_max": 30.0, "12_extra": 1}
+    keys = form_keys(state, [1, 2])
+    assert keys and all(k in state for k in keys)
+    assert "agent_name_1" in keys and "agent_name_12" not in keys and "12_extra" not in keys
+    assert "agent_entry_mode" not in keys and "slab_max" not in keys
+    # form_frames of agents 1 and 2 needs nothing but those keys
+    kept = {k: state[k] for k in keys}
+    for got, want in zip(form_frames(kept, [1, 2]), form_frames(state, [1, 2])):
+        pd.testing.assert_frame_equal(got, want)
+
+# ------------------------------------------------------------------
+# Bulk import
+# ------------------------------------------------------------------
+CURRENCIES = ["USD", "EUR", "INR"]
+
+def charge(agent, description, currency="USD", **amounts):
+    return {"Agent Name": agent, "Description": description, "Currency": currency, **amounts}
+
+def test_saved_workbook_imports_as_is(tmp_path):
+    t = synthetic_tender(4, 3, 2, 0)
+    comp_df, nomination_df = agent_compare(t["in_df"].copy(), t["nom_df"], t["input_dict"], t["exchange_df"])
+    sheets = comparison_sheets(container_info("Nhava Sheva", "Jebel Ali", t["input_dict"], "2026-10-01"),
+                               t["in_df"], t["nom_df"], comp_df, nomination_df)
+    path = str(tmp_path / "Tender.xlsx")
+    write_workbook(sheets, path)
+
+    in_df, nom_df, errors = import_tariffs(path, t["exchange_df"]["Currency"])
+    assert errors.empty and list(errors.columns) == TARIFF_ERROR_COLS
+    same_calculation((in_df, nom_df), (t["in_df"], t["nom_df"]), t["exchange_df"])
+
+def test_csv_with_nomination_columns():
+    rows = pd.DataFrame([
+        charge("A", "THC", **{"Per CBM": 5, "Nomination Rate": 12, "Nomination CBM": 3}),
+        charge("A", "DO", "INR", **{"Per BL": 900}),
+        charge("B", "THC", "EUR", **{"Per CBM": "4.5", "Minimum": 20}),
+    ])
+    in_df, nom_df, errors = import_tariffs(BytesIO(rows.to_csv(index=False).encode()), CURRENCIES, name="rates.csv")
+    assert errors.empty
+    assert in_df["Agent Name"].tolist() == ["A", "A", "B"]
+    assert in_df.loc[2, "Per CBM"] == 4.5 and in_df.loc[0, "Per Ton"] == ""
+    assert nom_df.set_index("Agent Name").loc["A"].tolist() == [12, 3, 0]
+    assert nom_df.set_index("Agent Name").loc["B"].tolist() == [0, 0, 0]
+
+def test_nomination_sheet_wins_over_columns():
+    sheets = {
+        "Agent X": pd.DataFrame([charge(None, "THC", **{"Per CBM": 5, "Nomination Rate": 99})]).drop(columns="Agent Name"),
+        NOM_SHEET: pd.DataFrame([{"Agent Name": "Agent X", "Nomination Rate": 10, "Nomination CBM": 2,
+                                  "Nomination BL": 1}]),
+    }
+    in_df, nom_df, errors = tariff_frames(sheets, CURRENCIES)
+    assert errors.empty and in_df["Agent Name"].tolist() == ["Agent X"]   # named after its sheet
+    assert nom_df.to_dict("records") == [{"Agent Name": "Agent X", "Nomination Rate": 10, "Nomination CBM": 2,
+                                          "Nomination BL": 1}]
+
+def test_every_bad_cell_is_reported():
+    sheets = {"Agents": pd.DataFrame([
+        charge("A", "THC", **{"Per CBM": "five"}),
+        charge("A", "Remarks", "paid at destination"),     # a note, not a currency
+        charge("A", "Rebate", "XYZ"),
+        charge("A", "Rebate", **{"Per BL": 10}),
+        charge(None, "DO", **{"Per BL": 20}),             # between A and B: whose is it?
+        charge("B", "THC", **{"Per CBM": 4}),
+        charge("B", "Seal", **{"Nomination Rate": "n/a"}),
+    ])}
+    _, _, errors = tariff_frames(sheets, CURRENCIES)
+    assert errors[["Row", "Column", "Problem"]].values.tolist() == [
+        [2, "Per CBM", "not a number"],
+        [4, "Currency", "unknown currency"],
+        [5, "Description", "more than one Rebate row"],
+        [6, "Agent Name", "missing agent name"],
+        [8, "Nomination Rate", "not a number"],
+    ]
+    assert (errors["Sheet"] == "Agents").all() and errors.loc[0, "Value"] == "five"
+
+def test_blank_names_continue_a_single_agent_sheet():
+    sheets = {"Only": pd.DataFrame([charge(None, "THC", **{"Per CBM": 5}), charge("Agent Q", "DO", **{"Per BL": 9}),
+                                    charge(None, "Seal", **{"Per BL": 1})])}
+    in_df, _, errors = tariff_frames(sheets, CURRENCIES)
+    assert errors.empty and set(in_df["Agent Name"]) == {"Agent Q"}
+
+def test_no_agent_sheet():
+    with pytest.raises(ValueError):
+        tariff_frames({"Info": pd.DataFrame({"Description": ["x"]}), "Other": pd.DataFrame({"a": [1]})}, CURRENCIES)